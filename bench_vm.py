@@ -0,0 +1,208 @@
+"""Сравнение способов выполнения методов: обход дерева, виртуальная машина (vm) и компиляция
+   в функции Python (codegen) на одних и тех же FuncNode
+"""
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from compiler_demo import my_parser
+from compiler_demo.analyzer import analyze
+from compiler_demo.ast import *
+from compiler_demo.codegen import _f32, _fdiv, _frem, _idiv32, _idiv64, _irem, _wrap32, _wrap64, compile_class
+from compiler_demo.semantic import BaseType
+from compiler_demo.vm import load_class
+
+PROGRAM = '''class Bench {
+    int fib(int n) {
+        if (n < 2) {
+            return n;
+        }
+        return fib(n - 1) + fib(n - 2);
+    }
+    int sum(int n) {
+        int s = 0;
+        for (int i = 0; i < n; i = i + 1) {
+            if (i % 3 == 0) {
+                continue;
+            }
+            s = s + i * 7;
+        }
+        return s;
+    }
+    double grid(int n) {
+        double acc = 0.0;
+        for (int i = 0; i < n; i = i + 1) {
+            for (int j = 0; j < n; j = j + 1) {
+                if (i > j && j % 2 == 0 || i == j) {
+                    acc = acc + i * 0.5 - j / 4.0;
+                }
+            }
+        }
+        return acc;
+    }
+}'''
+CALLS = (('fib', (22,)), ('sum', (200000,)), ('grid', (300,)))
+
+
+class _Break(Exception):
+    pass
+
+
+class _Continue(Exception):
+    pass
+
+
+class _Return(Exception):
+    def __init__(self, value: Any) -> None:
+        super().__init__()
+        self.value = value
+
+
+class TreeWalker:
+    """Наивный интерпретатор: рекурсивный обход дерева с окружением-словарем и переходами
+       через исключения
+    """
+
+    def __init__(self, cls: ClassInitNode) -> None:
+        self.methods: Dict[IdentDesc, FuncNode] = {
+            stmt.name.node_ident: stmt for stmt in cls.body.exprs if isinstance(stmt, FuncNode)}
+
+    def call(self, func: FuncNode, args: List[Any]) -> Any:
+        env = {param.name.node_ident: arg for param, arg in zip(func.params, args)}
+        try:
+            self.stmts(func.body.exprs, env)
+        except _Return as e:
+            return e.value
+        return None
+
+    def stmts(self, stmts: Any, env: Dict[IdentDesc, Any]) -> None:
+        if stmts is None:
+            return
+        if not isinstance(stmts, (list, tuple)):
+            stmts = stmts.exprs if isinstance(stmts, (StmtListNode, FuncStmtListNode)) else (stmts,)
+        for stmt in stmts:
+            self.stmt(stmt, env)
+
+    def stmt(self, node: AstNode, env: Dict[IdentDesc, Any]) -> None:
+        if isinstance(node, VarsNode):
+            for var in node.vars:
+                if isinstance(var, AssignNode):
+                    self.stmt(var, env)
+        elif isinstance(node, AssignNode):
+            value = self.expr(node.val, env)
+            if node.var.node_ident.type.base_type is BaseType.DOUBLE:
+                value = float(value)
+            env[node.var.node_ident] = value
+        elif isinstance(node, IfNode):
+            if self.expr(node.cond, env):
+                self.stmts(node.then_stmt, env)
+            else:
+                self.stmts(node.else_stmt, env)
+        elif isinstance(node, ForNode):
+            self.stmts(node.init, env)
+            while self.expr(node.cond, env):
+                try:
+                    self.stmts(node.body, env)
+                except _Break:
+                    break
+                except _Continue:
+                    pass
+                self.stmts(node.step, env)
+        elif isinstance(node, ReturnNode):
+            raise _Return(None if node.val is None else self.expr(node.val, env))
+        elif isinstance(node, IdentNode) and node.name == 'break':
+            raise _Break()
+        elif isinstance(node, IdentNode) and node.name == 'continue':
+            raise _Continue()
+        elif isinstance(node, (StmtListNode, FuncStmtListNode)):
+            self.stmts(node.exprs, env)
+        else:
+            self.expr(node, env)
+
+    def expr(self, node: AstNode, env: Dict[IdentDesc, Any]) -> Any:
+        if isinstance(node, LiteralNode):
+            return node.value
+        if isinstance(node, IdentNode):
+            return env[node.node_ident]
+        if isinstance(node, CallNode):
+            args = [self.expr(param, env) for param in node.params]
+            return self.call(self.methods[node.func.node_ident], args)
+        if isinstance(node, BinOpNode):
+            op = node.op
+            a = self.expr(node.arg1, env)
+            if op is BinOp.LOGICAL_AND:
+                return a and self.expr(node.arg2, env)
+            if op is BinOp.LOGICAL_OR:
+                return a or self.expr(node.arg2, env)
+            b = self.expr(node.arg2, env)
+            base = node.node_type.base_type
+            if op is BinOp.LT:
+                return a < b
+            if op is BinOp.GT:
+                return a > b
+            if op is BinOp.LE:
+                return a <= b
+            if op is BinOp.GE:
+                return a >= b
+            if op is BinOp.EQUALS:
+                return a == b
+            if op is BinOp.NEQUALS:
+                return a != b
+            if base in (BaseType.INT, BaseType.LONG):
+                wrap = _wrap32 if base is BaseType.INT else _wrap64
+                if op is BinOp.ADD:
+                    return wrap(a + b)
+                if op is BinOp.SUB:
+                    return wrap(a - b)
+                if op is BinOp.MUL:
+                    return wrap(a * b)
+                if op is BinOp.DIV:
+                    return (_idiv32 if base is BaseType.INT else _idiv64)(a, b)
+                return _irem(a, b)
+            if op is BinOp.ADD:
+                value = a + b
+            elif op is BinOp.SUB:
+                value = a - b
+            elif op is BinOp.MUL:
+                value = a * b
+            elif op is BinOp.DIV:
+                value = _fdiv(a, b)
+            else:
+                value = _frem(a, b)
+            return _f32(value) if base is BaseType.FLOAT else value
+        raise NotImplementedError(str(node))
+
+
+def _best(func: Callable, args: tuple, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    sys.setrecursionlimit(10000)
+    tree = my_parser.parse(PROGRAM, engine='fast')
+    errors = analyze(tree)
+    if errors:
+        raise SystemExit('\n'.join(map(str, errors)))
+    cls = tree.exprs[0]
+    walker = TreeWalker(cls)
+    methods = {stmt.name.name: stmt for stmt in cls.body.exprs if isinstance(stmt, FuncNode)}
+    vm = load_class(cls)
+    compiled = compile_class(cls)
+    print('{:12} {:>12} {:>12} {:>12}'.format('method', 'tree walk', 'vm', 'codegen'))
+    for name, args in CALLS:
+        results = (walker.call(methods[name], list(args)), getattr(vm, name)(*args), getattr(compiled, name)(*args))
+        if len(set(map(repr, results))) != 1:
+            raise SystemExit('{}{}: results differ: {}'.format(name, args, results))
+        times = (_best(lambda *a: walker.call(methods[name], list(a)), args, 3),
+                 _best(getattr(vm, name), args, 3), _best(getattr(compiled, name), args, 3))
+        print('{:12} {:>10.1f}ms {:>10.1f}ms {:>10.1f}ms'.format(
+            '{}{}'.format(name, args), *(t * 1000 for t in times)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,534 @@
+"""Семантический анализ: таблица символов из вложенных областей видимости и разрешение идентификаторов.
+
+   Каждая область (программа, класс, параметры метода, блок, инициализация for) хранит свои
+   объявления в словаре, поэтому поиск имени в области - O(1), а поиск по цепочке областей -
+   по числу вложенных областей. Дерево обходится один раз без рекурсии: в стеке обхода лежат
+   узлы и действия (объявить переменную, закрыть область и т.п.), которые выполняются в порядке
+   текста программы. Узлам проставляются node_ident (IdentDesc объявления, на которое ссылается
+   идентификатор) и node_type (тип выражения); ошибки собираются в список, анализ не прерывается.
+
+   Члены класса (поля, методы, вложенные классы) объявляются до обхода тела класса, поэтому
+   на них можно ссылаться до объявления, как в Java. Локальная переменная видна с места
+   объявления до конца блока и не может перекрывать параметр или другую локальную переменную метода.
+
+   Поэтому анализ идет в две фазы: index строит индекс членов всех классов, check проверяет тела;
+   после первой фазы инструкции верхнего уровня только читают индекс, и analyze_parallel
+   проверяет классы верхнего уровня в пуле процессов.
+"""
+import os
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .ast import *
+from .semantic import BaseType, ScopeType
+from .visitor import _Dispatcher, child_nodes, walk
+
+# классы и значения, которые считаются объявленными всегда; break и continue грамматика разбирает
+# как инструкции-идентификаторы, поэтому они тоже здесь
+BUILT_IN_CLASSES = ('Object', 'Integer', 'Long', 'Double', 'Float', 'Boolean', 'Character', 'Math', 'System')
+BUILT_IN_IDENTS = ('null', 'break', 'continue')
+
+# ранги числовых типов для двуместного числового расширения
+_NUMERIC_RANKS: Dict[BaseType, int] = {BaseType.CHAR: 0, BaseType.INT: 1, BaseType.LONG: 2,
+                                       BaseType.FLOAT: 3, BaseType.DOUBLE: 4}
+_ARITHMETIC_OPS = frozenset((BinOp.ADD, BinOp.SUB, BinOp.MUL, BinOp.DIV, BinOp.MOD))
+
+
+class SemanticError(Exception):
+    """Семантическая ошибка в узле node
+    """
+
+    def __init__(self, msg: str, node: AstNode) -> None:
+        super().__init__(msg)
+        self.msg = msg
+        self.node = node
+
+    def __str__(self) -> str:
+        row, col = getattr(self.node, 'row', None), getattr(self.node, 'col', None)
+        if row is None:
+            return self.msg
+        return '{} (at {}:{})'.format(self.msg, row, col)
+
+
+class Scope:
+    """Область видимости: объявления idents и ссылка на объемлющую область parent.
+
+       kind - вид объявлений в области (ScopeType), owner - область, которая нумерует объявления:
+       у параметров и локальных переменных метода сквозная нумерация (номер слота), у членов
+       класса - своя в каждом классе; name - уточненное имя класса (A.B) у области членов класса
+    """
+
+    __slots__ = ('parent', 'kind', 'idents', 'owner', 'count', 'name')
+
+    def __init__(self, parent: Optional['Scope'], kind: ScopeType, owner: Optional['Scope'] = None,
+                 name: Optional[str] = None) -> None:
+        self.parent = parent
+        self.kind = kind
+        self.name = name
+        self.idents: Dict[str, IdentDesc] = {}
+        self.owner = owner if owner is not None else self
+        self.count = 0
+
+    def lookup(self, name: str) -> Optional[IdentDesc]:
+        scope = self
+        while scope is not None:
+            ident = scope.idents.get(name)
+            if ident is not None:
+                return ident
+            scope = scope.parent
+        return None
+
+    def declare(self, name: str, type_: TypeDesc) -> IdentDesc:
+        owner = self.owner
+        ident = IdentDesc(name, type_, self.kind, owner.count)
+        owner.count += 1
+        self.idents[name] = ident
+        return ident
+
+
+class SemanticAnalyzer(_Dispatcher):
+    """Анализатор: analyze(tree) проставляет узлам node_ident/node_type и возвращает список ошибок
+    """
+
+    def __init__(self) -> None:
+        self.errors: List[SemanticError] = []
+        # области членов классов по типу класса (у встроенных классов члены не проверяются - None)
+        self.classes: Dict[TypeDesc, Optional[Scope]] = {}
+        self.built_ins = Scope(None, ScopeType.GLOBAL)
+        for name in BUILT_IN_CLASSES:
+            type_ = TypeDesc(name=name)
+            self.classes[type_] = None
+            self._built_in(name, type_)
+        self._built_in('String', TypeDesc.STR)
+        for name in BUILT_IN_IDENTS:
+            self._built_in(name, TypeDesc.VOID if name != 'null' else TypeDesc(name='null'))
+        self._scope = self.built_ins
+        self._stack: list = []
+
+    def shared_idents(self) -> List[IdentDesc]:
+        """Объявления индекса (встроенные, верхнего уровня и члены классов) в неизменном порядке:
+           по номеру в этом списке они сопоставляются между процессами analyze_parallel
+        """
+        scopes = [self.built_ins]
+        scope = self._scope
+        while scope is not self.built_ins:
+            scopes.append(scope)
+            scope = scope.parent
+        scopes.extend(scope for scope in self.classes.values() if scope is not None)
+        return [ident for scope in scopes for ident in scope.idents.values()]
+
+    def _built_in(self, name: str, type_: TypeDesc) -> None:
+        ident = self.built_ins.declare(name, type_)
+        ident.built_in = True
+
+    def error(self, msg: str, node: AstNode) -> None:
+        self.errors.append(SemanticError(msg, node))
+
+    # обход
+
+    def analyze(self, root: AstNode) -> List[SemanticError]:
+        self.index(root)
+        self.check(*self._top_level(root), self._close)
+        return self.errors
+
+    @staticmethod
+    def _top_level(root: AstNode) -> Tuple[AstNode, ...]:
+        # отдельный узел (класс, метод, объявление, ...) анализируется как программа из одной
+        # инструкции: ссылки на объявления вне него - ошибки
+        return root.exprs if isinstance(root, StmtListNode) else (root,)
+
+    def index(self, root: AstNode) -> None:
+        """Первая фаза: индекс членов - объявления верхнего уровня программы и члены всех классов
+           без обхода тел методов (остается открытой область программы)
+        """
+        self._open(ScopeType.GLOBAL)
+        self._members(self._top_level(root))
+
+    def check(self, *items: Union[AstNode, Callable[[], None]]) -> None:
+        """Вторая фаза: обход узлов (и выполнение действий) items в текущей области; после index
+           инструкции верхнего уровня только читают индекс и могут проверяться независимо
+        """
+        stack = self._stack = []
+        self.then(*items)
+        handler = self._handler
+        while stack:
+            item = stack.pop()
+            if isinstance(item, AstNode):
+                visit = handler('visit_', type(item))
+                if visit is not None:
+                    visit(self, item)
+                else:
+                    self.then(*child_nodes(item))
+            else:
+                item()
+
+    def then(self, *items: Union[AstNode, Callable[[], None]]) -> None:
+        """Узлы и действия, которые нужно обработать следующими (в указанном порядке)
+        """
+        self._stack.extend(reversed(items))
+
+    def _open(self, kind: ScopeType, owner: Optional[Scope] = None) -> Scope:
+        self._scope = Scope(self._scope, kind, owner)
+        return self._scope
+
+    def _close(self) -> None:
+        self._scope = self._scope.parent
+
+    def _in_method(self) -> bool:
+        return self._scope.kind in (ScopeType.PARAM, ScopeType.LOCAL)
+
+    def _in_members(self) -> bool:
+        # в области класса (программы) объявления уже сделаны в _members
+        return self._scope.kind is ScopeType.GLOBAL
+
+    # объявления
+
+    def _declare(self, name_node: IdentNode, type_: Optional[TypeDesc]) -> IdentDesc:
+        scope = self._scope
+        name = name_node.name
+        if name in scope.idents:
+            self.error("Identifier '{}' is already declared".format(name), name_node)
+        elif scope.kind in (ScopeType.PARAM, ScopeType.LOCAL):
+            # локальная переменная не может перекрывать параметр или локальную переменную метода
+            outer = scope.parent
+            while outer is not None and outer.kind in (ScopeType.PARAM, ScopeType.LOCAL):
+                if name in outer.idents:
+                    self.error("Identifier '{}' is already declared".format(name), name_node)
+                    break
+                outer = outer.parent
+        ident = scope.declare(name, type_ if type_ is not None else TypeDesc.VOID)
+        name_node.node_ident = ident
+        return ident
+
+    def _declare_class(self, name_node: IdentNode) -> Scope:
+        """Объявление класса в текущей области; возвращает область его членов. Типы интернированы
+           по имени, поэтому имя типа уточняется именем объемлющего класса (A.B), а одноименные
+           классы в одной области (локальные классы, повторное объявление) получают номер (A.B$2)
+        """
+        outer = self._scope
+        while outer is not None and outer.name is None:
+            outer = outer.parent
+        name = name_node.name if outer is None else '{}.{}'.format(outer.name, name_node.name)
+        qualified, n = name, 1
+        while TypeDesc(name=qualified) in self.classes:
+            n += 1
+            qualified = '{}${}'.format(name, n)
+        type_ = TypeDesc(name=qualified)
+        self._declare(name_node, type_)
+        scope = self.classes[type_] = Scope(self._scope, ScopeType.GLOBAL, name=qualified)
+        return scope
+
+    def _resolve_type(self, type_node: TypeNode) -> Optional[TypeDesc]:
+        type_ = type_node.type
+        if type_ is None:
+            ident = self._scope.lookup(type_node.name)
+            if ident is not None and ident.type in self.classes:
+                type_ = ident.type
+            else:
+                self.error("Unknown type '{}'".format(type_node.name), type_node)
+        type_node.node_type = type_
+        return type_
+
+    def _func_type(self, node: FuncNode) -> TypeDesc:
+        params = tuple(self._resolve_type(param.type) or TypeDesc.VOID for param in node.params)
+        return TypeDesc(return_type=self._resolve_type(node.type) or TypeDesc.VOID, params=params)
+
+    def _members(self, stmts: Tuple[AstNode, ...]) -> None:
+        """Объявление членов текущей области (класса или программы) и всех вложенных в нее классов
+           до обхода тел: сначала имена всех классов, потом методы и поля (их типы могут ссылаться
+           на классы, объявленные ниже или во вложенных классах)
+        """
+        scope = self._scope
+        bodies = [(scope, stmts)]
+        i = 0
+        while i < len(bodies):
+            self._scope, body = bodies[i]
+            for stmt in body:
+                if isinstance(stmt, ClassInitNode):
+                    bodies.append((self._declare_class(stmt.name), stmt.body.exprs))
+            i += 1
+        for class_scope, body in bodies:
+            self._scope = class_scope
+            for stmt in body:
+                if isinstance(stmt, FuncNode):
+                    self._declare(stmt.name, self._func_type(stmt))
+                elif isinstance(stmt, VarsNode):
+                    type_ = self._resolve_type(stmt.type)
+                    for var in stmt.vars:
+                        self._declare(self._var_name(var), type_)
+        self._scope = scope
+
+    # обработчики узлов
+
+    def visit_ClassInitNode(self, node: ClassInitNode) -> None:
+        if self._in_members():
+            self._scope = self.classes[node.name.node_ident.type]
+        else:
+            # класс внутри блока объявляется на месте
+            self._scope = self._declare_class(node.name)
+            self._members(node.body.exprs)
+        self.then(*node.body.exprs, self._close)
+
+    def visit_FuncNode(self, node: FuncNode) -> None:
+        if self._in_members():
+            ident = node.name.node_ident
+        else:
+            ident = self._declare(node.name, self._func_type(node))
+        params = self._open(ScopeType.PARAM)
+        for param, type_ in zip(node.params, ident.type.params):
+            param.type.node_type = type_
+            self._declare(param.name, type_)
+        body = node.body
+        if body is None:
+            self._close()
+            return
+        self._open(ScopeType.LOCAL, params)
+        self.then(*body.exprs, self._close, self._close)
+
+    def visit_VarsNode(self, node: VarsNode) -> None:
+        if self._in_members():
+            # поля класса уже объявлены, остаются инициализаторы
+            self.then(*(var.val for var in node.vars if isinstance(var, AssignNode)))
+            for var in node.vars:
+                if isinstance(var, AssignNode):
+                    var.node_type = var.var.node_ident.type
+            return
+        type_ = self._resolve_type(node.type)
+        items = []
+        for var in node.vars:
+            if isinstance(var, AssignNode):
+                # переменная видна уже в своем инициализаторе
+                items.append(self._declarator(var, type_))
+                items.append(var.val)
+            else:
+                items.append(self._declarator(var, type_))
+        self.then(*items)
+
+    @staticmethod
+    def _var_name(var: ExprNode) -> IdentNode:
+        return var.var if isinstance(var, AssignNode) else var
+
+    def _declarator(self, var: ExprNode, type_: Optional[TypeDesc]) -> Callable[[], None]:
+        def declare() -> None:
+            self._declare(self._var_name(var), type_)
+            if isinstance(var, AssignNode):
+                var.node_type = type_
+
+        return declare
+
+    def _block(self, node: Union[StmtListNode, FuncStmtListNode]) -> None:
+        if not node.exprs:
+            return
+        if self._in_method():
+            self._open(ScopeType.LOCAL, self._scope.owner)
+        else:
+            self._open(ScopeType.GLOBAL_LOCAL)
+        self.then(*node.exprs, self._close)
+
+    visit_StmtListNode = _block
+    visit_FuncStmtListNode = _block
+
+    def visit_ForNode(self, node: ForNode) -> None:
+        self._open(ScopeType.LOCAL, self._scope.owner if self._in_method() else None)
+        init = node.init
+        # инициализация - список инструкций без своей области (переменные видны во всем цикле)
+        items = list(init.exprs) if isinstance(init, StmtListNode) else [init]
+        cond = node.cond if not isinstance(node.cond, StmtListNode) else None
+        items.extend(item for item in (cond, node.step, node.body) if item is not None)
+        self.then(*items, self._close)
+
+    def visit_ParamNode(self, node: ParamNode) -> None:
+        self._declare(node.name, self._resolve_type(node.type))
+
+    def visit_TypeNode(self, node: TypeNode) -> None:
+        self._resolve_type(node)
+
+    def visit_AccessNode(self, node: AccessNode) -> None:
+        pass
+
+    def visit_LiteralNode(self, node: LiteralNode) -> None:
+        node.node_type = node.type
+
+    def visit_IdentNode(self, node: IdentNode) -> None:
+        ident = self._scope.lookup(node.name)
+        if ident is None:
+            self.error("Unknown identifier '{}'".format(node.name), node)
+            return
+        node.node_ident = ident
+        node.node_type = ident.type
+
+    def visit_CallNode(self, node: CallNode) -> None:
+        self._call(node, self._scope.lookup(node.func.name), True)
+
+    def _call(self, node: CallNode, ident: Optional[IdentDesc], report: bool) -> None:
+        func = node.func
+        if ident is None:
+            if report:
+                self.error("Unknown identifier '{}'".format(func.name), func)
+        elif not ident.type.func:
+            self.error("'{}' is not a function".format(func.name), func)
+        else:
+            func.node_ident = ident
+            node.node_type = ident.type.return_type
+            if len(ident.type.params) != len(node.params):
+                self.error("Function '{}' expects {} arguments, got {}".format(
+                    func.name, len(ident.type.params), len(node.params)), node)
+        self.then(*node.params)
+
+    def visit_NewNode(self, node: NewNode) -> None:
+        call = node.val
+        ident = self._scope.lookup(call.func.name)
+        if ident is None:
+            self.error("Unknown type '{}'".format(call.func.name), call.func)
+        else:
+            call.func.node_ident = ident
+            call.node_type = node.node_type = ident.type
+        self.then(*call.params)
+
+    def visit_AssignNode(self, node: AssignNode) -> None:
+        self.then(node.var, node.val, lambda: self._set_type(node, node.var.node_type))
+
+    def visit_OpAssignNode(self, node: OpAssignNode) -> None:
+        if not isinstance(node.var, IdentNode):
+            self.error("Left side of '{}' must be a variable".format(node), node.var)
+        self.visit_AssignNode(node)
+
+    def visit_BinOpNode(self, node: BinOpNode) -> None:
+        if node.op is BinOp.DOT:
+            self.then(node.arg1, lambda: self._member(node))
+        else:
+            self.then(node.arg1, node.arg2, lambda: self._set_type(node, self._bin_op_type(node)))
+
+    def _member(self, node: BinOpNode) -> None:
+        """Правая часть a.b: член класса, к которому относится тип a (для встроенных и неизвестных
+           классов члены не проверяются)
+        """
+        owner = node.arg1.node_type
+        scope = self.classes.get(owner) if owner is not None else None
+        member = node.arg2
+        call = member.val if isinstance(member, NewNode) else member
+        name_node = call.func if isinstance(call, CallNode) else call
+        ident = scope.idents.get(name_node.name) if scope is not None else None
+        if scope is not None and ident is None:
+            self.error("'{}' has no member '{}'".format(owner, name_node.name), name_node)
+        if isinstance(member, NewNode):
+            self.visit_NewNode(member)
+        elif isinstance(call, CallNode):
+            self._call(call, ident, False)
+        elif ident is not None:
+            call.node_ident = ident
+            call.node_type = ident.type
+        self.then(lambda: self._set_type(node, member.node_type))
+
+    @staticmethod
+    def _set_type(node: AstNode, type_: Optional[TypeDesc]) -> None:
+        if type_ is not None:
+            node.node_type = type_
+
+    @staticmethod
+    def _bin_op_type(node: BinOpNode) -> Optional[TypeDesc]:
+        if node.op not in _ARITHMETIC_OPS:
+            return TypeDesc.BOOL
+        type1, type2 = node.arg1.node_type, node.arg2.node_type
+        if type1 is None or type2 is None:
+            return None
+        if node.op is BinOp.ADD and (type1 is TypeDesc.STR or type2 is TypeDesc.STR):
+            return TypeDesc.STR
+        rank1, rank2 = _NUMERIC_RANKS.get(type1.base_type), _NUMERIC_RANKS.get(type2.base_type)
+        if rank1 is None or rank2 is None:
+            return None
+        # двуместное числовое расширение: более широкий из типов, но не уже int
+        wider = type1 if rank1 >= rank2 else type2
+        return wider if _NUMERIC_RANKS[wider.base_type] > _NUMERIC_RANKS[BaseType.INT] else TypeDesc.INT
+
+
+def analyze(tree: AstNode) -> List[SemanticError]:
+    """Семантический анализ дерева (см. SemanticAnalyzer); возвращает найденные ошибки
+    """
+    return SemanticAnalyzer().analyze(tree)
+
+
+# результат проверки инструкции в процессе: номера узлов (в прямом порядке) с проставленными
+# семантическими полями, их node_ident и node_type и ошибки (сообщение, номер узла);
+# объявления индекса передаются номером из shared_idents, остальные - самими объектами
+_UnitResult = Tuple[List[int], list, List[Optional[TypeDesc]], List[Tuple[str, int]]]
+
+# состояние процесса пула analyze_parallel
+_worker_state: Optional[tuple] = None
+
+
+def _init_worker(analyzer: SemanticAnalyzer, tree: StmtListNode, shared: List[IdentDesc]) -> None:
+    global _worker_state
+    shared_numbers = {id(ident): i for i, ident in enumerate(shared)}
+    _worker_state = analyzer, tree, shared_numbers, dict(analyzer.classes)
+
+
+def _check_unit(i: int) -> _UnitResult:
+    analyzer, tree, shared_numbers, classes = _worker_state
+    stmt = tree.exprs[i]
+    # локальные классы, объявленные при проверке других инструкций, не должны влиять на имена
+    analyzer.classes = dict(classes)
+    analyzer.errors = []
+    analyzer.check(stmt)
+    numbers, idents, types = [], [], []
+    nodes = list(walk(stmt))
+    for k, node in enumerate(nodes):
+        extra = node._extra
+        if extra:
+            ident, type_ = extra.get('node_ident'), extra.get('node_type')
+            if ident is not None or type_ is not None:
+                numbers.append(k)
+                idents.append(shared_numbers.get(id(ident), ident))
+                types.append(type_)
+    errors = []
+    if analyzer.errors:
+        node_numbers = {id(node): k for k, node in enumerate(nodes)}
+        errors = [(error.msg, node_numbers[id(error.node)]) for error in analyzer.errors]
+    return numbers, idents, types, errors
+
+
+def _apply_unit(stmt: AstNode, result: _UnitResult, shared: List[IdentDesc]) -> List[SemanticError]:
+    numbers, idents, types, errors = result
+    nodes = list(walk(stmt))
+    for k, ident, type_ in zip(numbers, idents, types):
+        node = nodes[k]
+        if ident is not None:
+            node.node_ident = shared[ident] if type(ident) is int else ident
+        if type_ is not None:
+            node.node_type = type_
+    return [SemanticError(msg, nodes[k]) for msg, k in errors]
+
+
+def analyze_parallel(tree: AstNode, workers: Optional[int] = None) -> List[SemanticError]:
+    """Семантический анализ с проверкой классов верхнего уровня в пуле из workers процессов.
+
+       Индекс членов строится в текущем процессе; процессы пула получают его вместе с деревом
+       один раз при запуске и проверяют тела классов независимо (индекс только читается).
+       Результаты (node_ident/node_type узлов и ошибки) переносятся на узлы tree, поэтому
+       дерево и ошибки те же, что у analyze(tree); остальные инструкции верхнего уровня
+       проверяются в текущем процессе, пока работает пул
+    """
+    workers = workers or os.cpu_count() or 1
+    units = [i for i, stmt in enumerate(tree.exprs) if isinstance(stmt, ClassInitNode)] \
+        if isinstance(tree, StmtListNode) else []
+    if workers == 1 or len(units) < 2:
+        return analyze(tree)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    analyzer = SemanticAnalyzer()
+    analyzer.index(tree)
+    shared = analyzer.shared_idents()
+    errors = analyzer.errors
+    unit_errors: Dict[int, List[SemanticError]] = {}
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(analyzer, tree, shared)) as executor:
+        results = executor.map(_check_unit, units, chunksize=max(1, len(units) // (4 * workers)))
+        for i, stmt in enumerate(tree.exprs):
+            if not isinstance(stmt, ClassInitNode):
+                analyzer.errors = []
+                analyzer.check(stmt)
+                unit_errors[i] = analyzer.errors
+        for i, result in zip(units, results):
+            unit_errors[i] = _apply_unit(tree.exprs[i], result, shared)
+    for i in range(len(tree.exprs)):
+        errors.extend(unit_errors[i])
+    return errors
@@ -0,0 +1,262 @@
+"""Плоское (struct-of-arrays) представление AST-дерева.
+
+   Узлы пронумерованы в порядке обхода в ширину, поэтому дочерние узлы любого узла
+   занимают непрерывный диапазон индексов [first_child[i], first_child[i] + child_count[i]).
+   Вид узла, родитель, диапазон детей, смещение в тексте и имя (индекс в таблице строк)
+   хранятся в типизированных массивах array, так что аналитику по дереву можно считать
+   линейными проходами по массивам (или векторно через numpy, см. AstArena.to_numpy)
+   без рекурсии по childs.
+"""
+import struct
+from array import array
+from collections import Counter
+from typing import Dict, List, Optional, Tuple, Union
+
+from .ast import *
+from .ast import current_positions, _GroupNode
+from .positions import LineIndex
+
+# псевдо-виды для значений полей, которые не являются узлами
+NONE_KIND, SEQ_KIND = 0, 1
+
+NODE_CLASSES: Tuple[type, ...] = (
+    _GroupNode, LiteralNode, IdentNode, TypeNode, AccessNode, CallNode, AssignNode, VarsNode, NewNode,
+    ReturnNode, IfNode, ForNode, ParamNode, FuncNode, StmtListNode, FuncStmtListNode, ClassInitNode, BinOpNode,
+    OpAssignNode
+)
+KIND_NAMES: Tuple[str, ...] = ('None', 'tuple') + tuple(cls.__name__ for cls in NODE_CLASSES)
+_KIND_BY_CLASS: Dict[type, int] = {cls: kind for kind, cls in enumerate(NODE_CLASSES, 2)}
+
+
+# двоичный формат: заголовок, затем массивы parents, first_child, child_count, locs, name_ids,
+# line_starts, line_crs, длины имен (все 'i'), kinds ('B') и имена в utf-8 подряд; число line_crs хранится
+# в последнем поле заголовка (в файлах без '\r' оно равно 0, как и прежде)
+FORMAT_MAGIC = b'JAST'
+FORMAT_VERSION = 1
+_HEADER = struct.Struct('<4sIIIIIII')
+_INT_ARRAYS = ('parents', 'first_child', 'child_count', 'locs', 'name_ids')
+
+
+class AstArena:
+    """AST-дерево в виде набора параллельных массивов
+    """
+
+    def __init__(self) -> None:
+        self.kinds = array('B')
+        self.parents = array('i')
+        self.first_child = array('i')
+        self.child_count = array('i')
+        self.locs = array('i')
+        self.name_ids = array('i')
+        self.names: List[str] = []
+        self.line_starts: Optional[array] = None
+        self.line_crs: Optional[array] = None
+        self.program = False
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    @staticmethod
+    def from_tree(root: AstNode, positions: Optional[LineIndex] = None) -> 'AstArena':
+        """Построение по дереву узлов (поля узлов обходятся по _fields, как в AstNode.iter_child_nodes)
+        """
+        arena = AstArena()
+        kinds, parents, first_child, child_count, locs, name_ids = (
+            arena.kinds, arena.parents, arena.first_child, arena.child_count, arena.locs, arena.name_ids)
+        names = arena.names
+        name_index: Dict[str, int] = {}
+        if positions is None:
+            # у узлов, row/col которых уже вычислены, ссылки на индекс строк нет
+            positions = getattr(root, 'positions', None)
+
+        items: list = [root]
+        parents.append(-1)
+        i = 0
+        while i < len(items):
+            item = items[i]
+            first_child.append(len(items))
+            if item is None:
+                kinds.append(NONE_KIND)
+                locs.append(-1)
+                name_ids.append(-1)
+            elif isinstance(item, tuple):
+                kinds.append(SEQ_KIND)
+                locs.append(-1)
+                name_ids.append(-1)
+                items.extend(item)
+                parents.extend([i] * len(item))
+            else:
+                cls = type(item)
+                kinds.append(_KIND_BY_CLASS[cls])
+                loc = getattr(item, 'loc', None)
+                locs.append(loc if isinstance(loc, int) else -1)
+                if positions is None:
+                    positions = item._positions
+                if cls._attrs:
+                    name = str(getattr(item, cls._attrs[0]))
+                    name_id = name_index.get(name)
+                    if name_id is None:
+                        name_id = name_index[name] = len(names)
+                        names.append(name)
+                    name_ids.append(name_id)
+                else:
+                    name_ids.append(-1)
+                for field in cls._fields:
+                    if field[0] == '*':
+                        value = getattr(item, field[1:])
+                        items.extend(value)
+                        parents.extend([i] * len(value))
+                    else:
+                        items.append(getattr(item, field))
+                        parents.append(i)
+            child_count.append(len(items) - first_child[i])
+            i += 1
+
+        arena.line_starts = positions.starts if positions is not None else None
+        arena.line_crs = positions.crs if positions is not None and positions.crs else None
+        arena.program = bool(getattr(root, 'program', False))
+        return arena
+
+    def to_tree(self) -> AstNode:
+        """Обратное преобразование в дерево узлов (позиции row/col вычисляются по loc лениво)
+        """
+        kinds, first_child, child_count, locs, name_ids, names = (
+            self.kinds, self.first_child, self.child_count, self.locs, self.name_ids, self.names)
+        built: list = [None] * len(kinds)
+        positions = (LineIndex.from_starts(self.line_starts, crs=self.line_crs)
+                     if self.line_starts is not None else None)
+        token = current_positions.set(positions)
+        try:
+            # дети всегда имеют больший индекс, чем родитель, поэтому строим с конца
+            for i in range(len(kinds) - 1, -1, -1):
+                kind = kinds[i]
+                if kind == NONE_KIND:
+                    continue
+                first = first_child[i]
+                childs = built[first:first + child_count[i]]
+                if kind == SEQ_KIND:
+                    built[i] = tuple(childs)
+                    continue
+                cls = NODE_CLASSES[kind - 2]
+                args = []
+                if cls._attrs:
+                    name = names[name_ids[i]]
+                    args.append(BinOp(name) if cls is BinOpNode or cls is OpAssignNode else name)
+                # поле с '*' всегда последнее, поэтому дети передаются в конструктор подряд
+                args.extend(childs)
+                loc = locs[i]
+                built[i] = cls(*args, loc=loc) if loc >= 0 else cls(*args)
+        finally:
+            current_positions.reset(token)
+        root = built[0]
+        if self.program:
+            root.program = True
+            root.positions = positions
+        return root
+
+    def to_bytes(self) -> bytes:
+        """Сериализация в компактный двоичный формат (порядок байт - платформенный)
+        """
+        encoded = [name.encode('utf-8') for name in self.names]
+        line_starts = array('i', self.line_starts if self.line_starts is not None else ())
+        line_crs = array('i', self.line_crs if self.line_crs is not None else ())
+        header = _HEADER.pack(FORMAT_MAGIC, FORMAT_VERSION, len(self.kinds), len(encoded),
+                              sum(map(len, encoded)), len(line_starts), self.program, len(line_crs))
+        parts = [header]
+        parts.extend(array('i', getattr(self, field)).tobytes() for field in _INT_ARRAYS)
+        parts.append(line_starts.tobytes())
+        parts.append(line_crs.tobytes())
+        parts.append(array('i', map(len, encoded)).tobytes())
+        parts.append(bytes(self.kinds))
+        parts.extend(encoded)
+        return b''.join(parts)
+
+    @staticmethod
+    def from_bytes(buffer: Union[bytes, memoryview, 'mmap.mmap']) -> 'AstArena':
+        """Загрузка из двоичного формата; массивы узлов не копируются, а ссылаются на buffer
+           (например, на mmap файла), поэтому buffer должен жить, пока используется arena
+           (см. также release)
+        """
+        arena = AstArena()
+        # вспомогательные представления освобождаются сразу, а при ошибке - и массивы arena:
+        # иначе ссылки на них из трассировки исключения не дали бы закрыть mmap
+        with memoryview(buffer) as view:
+            try:
+                if len(view) < _HEADER.size:
+                    raise ValueError('Truncated AST data')
+                magic, version, count, names_count, names_len, lines_count, program, crs_count = \
+                    _HEADER.unpack_from(view)
+                if magic != FORMAT_MAGIC or version != FORMAT_VERSION:
+                    raise ValueError('Unsupported AST format')
+                size = (_HEADER.size + 4 * (len(_INT_ARRAYS) * count + lines_count + crs_count + names_count)
+                        + count + names_len)
+                if len(view) != size:
+                    raise ValueError('Truncated AST data')
+                pos = _HEADER.size
+                for field in _INT_ARRAYS:
+                    setattr(arena, field, view[pos:pos + 4 * count].cast('i'))
+                    pos += 4 * count
+                arena.line_starts = array('l', view[pos:pos + 4 * lines_count].cast('i')) if lines_count else None
+                pos += 4 * lines_count
+                arena.line_crs = array('l', view[pos:pos + 4 * crs_count].cast('i')) if crs_count else None
+                pos += 4 * crs_count
+                with view[pos:pos + 4 * names_count].cast('i') as lengths:
+                    pos += 4 * names_count
+                    arena.kinds = view[pos:pos + count]
+                    pos += count
+                    names = arena.names
+                    for length in lengths:
+                        names.append(str(view[pos:pos + length], 'utf-8'))
+                        pos += length
+            except BaseException:
+                arena.release()
+                raise
+        arena.program = bool(program)
+        return arena
+
+    def release(self) -> None:
+        """Освобождение buffer, на который ссылаются массивы после from_bytes (например, чтобы
+           закрыть mmap); после этого массивы узлов недоступны, но деревья, построенные to_tree,
+           от buffer не зависят
+        """
+        for field in _INT_ARRAYS + ('kinds',):
+            value = getattr(self, field)
+            if isinstance(value, memoryview):
+                value.release()
+
+    # аналитика
+
+    def kind_histogram(self) -> Dict[str, int]:
+        """Число узлов каждого вида (без псевдо-видов None и tuple)
+        """
+        counts = Counter(self.kinds)
+        return {KIND_NAMES[kind]: count for kind, count in sorted(counts.items()) if kind > SEQ_KIND}
+
+    def depths(self) -> array:
+        """Глубина каждого узла (у корня 0); кортежи полей глубину не увеличивают
+        """
+        kinds, parents = self.kinds, self.parents
+        depths = array('i', bytes(4 * len(kinds)))
+        for i in range(1, len(kinds)):
+            parent = parents[i]
+            depths[i] = depths[parent] + (kinds[parent] != SEQ_KIND)
+        return depths
+
+    def find_calls(self, name: str) -> List[int]:
+        """Индексы узлов CallNode, вызывающих функцию name
+        """
+        try:
+            name_id = self.names.index(name)
+        except ValueError:
+            return []
+        kinds, first_child, name_ids = self.kinds, self.first_child, self.name_ids
+        call_kind = _KIND_BY_CLASS[CallNode]
+        return [i for i, kind in enumerate(kinds) if kind == call_kind and name_ids[first_child[i]] == name_id]
+
+    def to_numpy(self) -> Dict[str, 'numpy.ndarray']:
+        """Представления массивов в виде numpy.ndarray (без копирования); требует numpy
+        """
+        import numpy
+
+        return {field: numpy.frombuffer(getattr(self, field), dtype=getattr(self, field).typecode)
+                for field in ('kinds', 'parents', 'first_child', 'child_count', 'locs', 'name_ids')}
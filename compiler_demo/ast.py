@@ -1,39 +1,175 @@
 from abc import ABC, abstractmethod
 from contextlib import suppress
-from typing import Optional, Union, Tuple, Callable
+from contextvars import ContextVar
+from typing import Optional, Union, Tuple, Callable, Iterator, TextIO, Dict, List
 
-from .semantic import TypeDesc, IdentDesc, AccessType, BinOp
+from .literals import decode_literal
+from .positions import LineIndex
+from .semantic import TypeDesc, IdentDesc, AccessType, BinOp, BIN_OP_PRECEDENCE, NON_ASSOCIATIVE_PRECEDENCES
 
 TYPES = {"int": "Integer", "float": "Float", "double": "Double", "boolean": "Boolean", "short": "Short", "char": "Char",
          "long": "Long", "byte": "Byte"}
 
 
+TREE_TRUNCATED = '(...)'
+
+# индекс позиций текущего разбора: у каждого потока (контекста) свой, поэтому разборы
+# в разных потоках не мешают друг другу
+current_positions: ContextVar[Optional[LineIndex]] = ContextVar('current_positions', default=None)
+
+
 class AstNode(ABC):
-    """Базовый абстрактый класс узла AST-дерева"""
+    """Базовый абстрактый класс узла AST-дерева.
+
+       Узлы хранят поля в __slots__ (без __dict__). Редко используемые семантические поля
+       (node_type, node_ident, type_changing, ...) и свойства из **props, для которых нет слота,
+       хранятся в словаре _extra, который создается только при первой записи
+    """
+
+    __slots__ = ('_row', '_col', '_positions', 'loc', '_extra')
 
-    init_action: Callable[['AstNode'], None] = None
+    # структура узла: _attrs - скалярные аргументы конструктора, _fields - поля с дочерними узлами
+    # (значение поля - узел, None или кортеж узлов; поле с '*' передается в конструктор как *args)
+    _attrs: Tuple[str, ...] = ()
+    _fields: Tuple[str, ...] = ()
 
     def __init__(self, row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__()
-        self.row = row
-        self.col = col
+        self._row = row
+        self._col = col
+        self._positions: Optional[LineIndex] = None
+        self._extra: Optional[dict] = None
         for k, v in props.items():
-            setattr(self, k, v)
-        if AstNode.init_action is not None:
-            AstNode.init_action(self)
-        self.node_type: Optional[TypeDesc] = None
-        self.node_ident: Optional[IdentDesc] = None
-        self.type_changing = []
-        self.external_type_changing = []
+            try:
+                setattr(self, k, v)
+            except AttributeError:
+                self._set_extra(k, v)
+        positions = current_positions.get()
+        if positions is not None and isinstance(getattr(self, 'loc', None), int):
+            self._positions = positions
+
+    def _set_extra(self, name: str, value) -> None:
+        if self._extra is None:
+            self._extra = {}
+        self._extra[name] = value
+
+    def __getattr__(self, name: str):
+        extra = self._extra if name != '_extra' else None
+        if extra is not None and name in extra:
+            return extra[name]
+        raise AttributeError("'{}' object has no attribute '{}'".format(type(self).__name__, name))
+
+    def __copy__(self) -> 'AstNode':
+        # как у объектов с __dict__: у копии свой словарь _extra, и запись в нее не меняет оригинал
+        cls = type(self)
+        new = cls.__new__(cls)
+        for klass in cls.__mro__:
+            for name in klass.__dict__.get('__slots__', ()):
+                slot = klass.__dict__[name]
+                with suppress(AttributeError):
+                    slot.__set__(new, slot.__get__(self, cls))
+        if new._extra is not None:
+            new._extra = dict(new._extra)
+        return new
+
+    @property
+    def node_type(self) -> Optional[TypeDesc]:
+        return self._extra.get('node_type') if self._extra else None
+
+    @node_type.setter
+    def node_type(self, value: Optional[TypeDesc]) -> None:
+        self._set_extra('node_type', value)
+
+    @property
+    def node_ident(self) -> Optional[IdentDesc]:
+        return self._extra.get('node_ident') if self._extra else None
+
+    @node_ident.setter
+    def node_ident(self, value: Optional[IdentDesc]) -> None:
+        self._set_extra('node_ident', value)
+
+    @property
+    def type_changing(self) -> list:
+        if not self._extra or 'type_changing' not in self._extra:
+            self._set_extra('type_changing', [])
+        return self._extra['type_changing']
+
+    @type_changing.setter
+    def type_changing(self, value: list) -> None:
+        self._set_extra('type_changing', value)
+
+    @property
+    def external_type_changing(self) -> list:
+        if not self._extra or 'external_type_changing' not in self._extra:
+            self._set_extra('external_type_changing', [])
+        return self._extra['external_type_changing']
+
+    @external_type_changing.setter
+    def external_type_changing(self, value: list) -> None:
+        self._set_extra('external_type_changing', value)
 
     @abstractmethod
     def __str__(self) -> str:
         pass
 
+    def set_positions(self, positions: LineIndex) -> None:
+        """Строка и столбец будут вычислены по loc при первом обращении к row/col
+        """
+        self._positions = positions
+        self._row = self._col = None
+
+    def _resolve_position(self) -> None:
+        row, col = self._positions.row_col(self.loc)
+        self._row, self._col = row + 1, col + 1
+        self._positions = None
+
+    @property
+    def row(self) -> Optional[int]:
+        if self._positions is not None:
+            self._resolve_position()
+        return self._row
+
+    @row.setter
+    def row(self, row: Optional[int]) -> None:
+        if self._positions is not None:
+            self._resolve_position()
+        self._row = row
+
+    @property
+    def col(self) -> Optional[int]:
+        if self._positions is not None:
+            self._resolve_position()
+        return self._col
+
+    @col.setter
+    def col(self, col: Optional[int]) -> None:
+        if self._positions is not None:
+            self._resolve_position()
+        self._col = col
+
     @property
     def childs(self) -> Tuple['AstNode', ...]:
         return ()
 
+    def _cached_childs(self, key: tuple, build: Callable[[], Tuple['AstNode', ...]]) -> Tuple['AstNode', ...]:
+        """childs со вспомогательными _GroupNode строятся один раз и пересоздаются,
+           только если изменились поля узла (key - кортеж значений этих полей)
+        """
+        cache = self._childs_cache
+        if cache is None or cache[0] != key:
+            cache = self._childs_cache = (key, build())
+        return cache[1]
+
+    def iter_child_nodes(self) -> Iterator['AstNode']:
+        """Дочерние узлы в порядке полей _fields (без вспомогательных _GroupNode, которые создает childs)
+        """
+        for field in self._fields:
+            value = getattr(self, field.lstrip('*'))
+            if isinstance(value, AstNode):
+                yield value
+            elif value:
+                yield from value
+
     def to_str(self):
         return str(self)
 
@@ -47,23 +183,68 @@ class AstNode(ABC):
 
     @property
     def tree(self) -> [str, ...]:
-        r = [self.to_str_full()]
-        childs = self.childs
-        for i, child in enumerate(childs):
-            ch0, ch = '├', '│'
-            if i == len(childs) - 1:
-                ch0, ch = '└', ' '
-            r.extend(((ch0 if j == 0 else ch) + ' ' + s for j, s in enumerate(child.tree)))
-        return tuple(r)
+        return tuple(self.iter_tree())
+
+    def iter_tree(self, max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> Iterator[str]:
+        """Строки текстового представления дерева (без рекурсии, по одной строке за раз).
+
+           max_depth - максимальная глубина выводимых узлов (у корня 0), max_nodes - максимальное
+           число выводимых узлов; на месте отброшенных узлов выводится TREE_TRUNCATED
+        """
+        if max_nodes is not None and max_nodes <= 0:
+            yield TREE_TRUNCATED
+            return
+        yield self.to_str_full()
+        if max_depth is not None and max_depth <= 0:
+            if self.childs:
+                yield '└ ' + TREE_TRUNCATED
+            return
+        count = 1
+        # на каждом уровне храним дочерние узлы, индекс следующего из них и префикс строк уровня
+        stack = [[self.childs, 0, '']]
+        while stack:
+            level = stack[-1]
+            childs, i, prefix = level
+            if i == len(childs):
+                stack.pop()
+                continue
+            level[1] = i + 1
+            if max_nodes is not None and count >= max_nodes:
+                yield prefix + '└ ' + TREE_TRUNCATED
+                return
+            last = i == len(childs) - 1
+            child = childs[i]
+            yield prefix + ('└ ' if last else '├ ') + child.to_str_full()
+            count += 1
+            sub_childs = child.childs
+            if sub_childs:
+                sub_prefix = prefix + ('  ' if last else '│ ')
+                if max_depth is not None and len(stack) >= max_depth:
+                    yield sub_prefix + '└ ' + TREE_TRUNCATED
+                else:
+                    stack.append([sub_childs, 0, sub_prefix])
+
+    def write_tree(self, file: TextIO, max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> None:
+        """Потоковый вывод текстового представления дерева в файл (см. iter_tree)
+        """
+        write = file.write
+        for line in self.iter_tree(max_depth, max_nodes):
+            write(line)
+            write('\n')
 
     def __getitem__(self, index):
-        return self.childs[index] if index < len(self.childs) else None
+        childs = self.childs
+        return childs[index] if index < len(childs) else None
 
 
 class _GroupNode(AstNode):
     """Класс для группировки других узлов (вспомогательный, в синтаксисе нет соотвествия)
     """
 
+    __slots__ = ('name', '_childs')
+    _attrs = ('name',)
+    _fields = ('*_childs',)
+
     def __init__(self, name: str, *childs: AstNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -81,21 +262,24 @@ class _GroupNode(AstNode):
 class ExprNode(AstNode, ABC):
     """Абстракный класс для выражений в AST-дереве
     """
-    pass
+
+    __slots__ = ()
 
 
 class LiteralNode(ExprNode):
-    """Класс для представления в AST-дереве литералов (числа, строки, логическое значение)
+    """Класс для представления в AST-дереве литералов (числа, строки, логическое значение).
+       value - значение литерала по правилам Java (см. literals.decode_literal), type - его тип
     """
 
+    __slots__ = ('literal', 'value', 'type')
+    _attrs = ('literal',)
+
     def __init__(self, literal: str,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
         self.literal = literal
-        if literal in ('true', 'false'):
-            self.value = bool(literal)
-        else:
-            self.value = eval(literal)
+        self.value, base_type_ = decode_literal(literal)
+        self.type = TypeDesc.from_base_type(base_type_)
 
     def __str__(self) -> str:
         return self.literal
@@ -105,6 +289,9 @@ class IdentNode(ExprNode):
     """Класс для представления в AST-дереве идентификаторов
     """
 
+    __slots__ = ('name',)
+    _attrs = ('name',)
+
     def __init__(self, name: str,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -119,6 +306,8 @@ class TypeNode(IdentNode):
        (при появлении составных типов данных должен быть расширен)
     """
 
+    __slots__ = ('type',)
+
     def __init__(self, name: str,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(name, row=row, col=col, **props)
@@ -132,6 +321,8 @@ class TypeNode(IdentNode):
 
 class AccessNode(IdentNode):
 
+    __slots__ = ('type',)
+
     def __init__(self, name: str,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(name, row=row, col=col, **props)
@@ -148,24 +339,31 @@ class CallNode(ExprNode):
        (в языке программирования может быть как expression, так и statement)
     """
 
+    __slots__ = ('func', 'params', '_childs_cache')
+    _fields = ('func', '*params')
+
     def __init__(self, func: IdentNode, *params: ExprNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
         self.func = func
         self.params = params
+        self._childs_cache = None
 
     def __str__(self) -> str:
         return 'call'
 
     @property
     def childs(self) -> Tuple[AstNode, ...]:
-        return self.func, _GroupNode('params', *self.params)
+        return self._cached_childs((self.func, self.params),
+                                   lambda: (self.func, _GroupNode('params', *self.params)))
 
 
 class StmtNode(ExprNode, ABC):
     """Абстракный класс для деклараций или инструкций в AST-дереве
     """
 
+    __slots__ = ()
+
     def to_str_full(self):
         return self.to_str()
 
@@ -174,6 +372,8 @@ class FuncStmtNode(ExprNode, ABC):
     """Абстракный класс для деклараций или инструкций в AST-дереве
     """
 
+    __slots__ = ()
+
     def to_str_full(self):
         return self.to_str()
 
@@ -182,6 +382,9 @@ class AssignNode(ExprNode):
     """Класс для представления в AST-дереве оператора присваивания
     """
 
+    __slots__ = ('var', 'val')
+    _fields = ('var', 'val')
+
     def __init__(self, var: IdentNode, val: ExprNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -200,6 +403,9 @@ class VarsNode(StmtNode):
     """Класс для представления в AST-дереве объявления переменнных
     """
 
+    __slots__ = ('type', 'vars')
+    _fields = ('type', '*vars')
+
     def __init__(self, type_: TypeNode, *vars_: Union[IdentNode, 'AssignNode'],
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -218,6 +424,9 @@ class NewNode(StmtNode):
     """Класс для представления в AST-дереве оператора return
     """
 
+    __slots__ = ('val',)
+    _fields = ('val',)
+
     def __init__(self, val: CallNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -235,6 +444,9 @@ class ReturnNode(StmtNode):
     """Класс для представления в AST-дереве оператора return
     """
 
+    __slots__ = ('val',)
+    _fields = ('val',)
+
     def __init__(self, val: ExprNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -252,6 +464,9 @@ class IfNode(StmtNode):
     """Класс для представления в AST-дереве условного оператора
     """
 
+    __slots__ = ('cond', 'then_stmt', 'else_stmt')
+    _fields = ('cond', 'then_stmt', 'else_stmt')
+
     def __init__(self, cond: ExprNode, then_stmt: StmtNode, else_stmt: Optional[StmtNode] = None,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -259,8 +474,6 @@ class IfNode(StmtNode):
         self.then_stmt = then_stmt
         self.else_stmt = else_stmt
 
-        self.type_changing = []
-
     def __str__(self) -> str:
         return 'if'
 
@@ -273,6 +486,9 @@ class ForNode(StmtNode):
     """Класс для представления в AST-дереве цикла for
     """
 
+    __slots__ = ('init', 'cond', 'step', 'body')
+    _fields = ('init', 'cond', 'step', 'body')
+
     def __init__(self, init: Optional[StmtNode], cond: Optional[ExprNode],
                  step: Optional[StmtNode], body: Optional[StmtNode],
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
@@ -294,6 +510,9 @@ class ParamNode(StmtNode):
     """Класс для представления в AST-дереве объявления параметра функции
     """
 
+    __slots__ = ('type', 'name')
+    _fields = ('type', 'name')
+
     def __init__(self, type_: TypeNode, name: IdentNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -309,41 +528,76 @@ class ParamNode(StmtNode):
 
 
 class FuncNode(StmtNode):
-    """Класс для представления в AST-дереве объявления функции
+    """Класс для представления в AST-дереве объявления функции.
+
+       Тело может быть отложенным (body_loader, режим outline в парсере): тогда оно разбирается
+       при первом обращении к body
     """
 
+    __slots__ = ('access', 'static', 'type', 'name', 'params', '_body', '_body_loader', '_childs_cache')
+    _fields = ('access', 'static', 'type', 'name', 'params', 'body')
+
     def __init__(self, access: AccessNode, static: AccessNode, type_: TypeNode, name: IdentNode,
                  params: Tuple[ParamNode], body: Optional[StmtNode] = None,
-                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
+                 row: Optional[int] = None, col: Optional[int] = None,
+                 body_loader: Optional[Callable[[], StmtNode]] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
         self.access = access if access else empty_access
-        self.static = static
+        self.static = static if static else empty_access
         self.type = type_
         self.name = name
-        self.params = params
-        self.body = body
+        self.params = tuple(params)
+        self._body = body
+        self._body_loader = body_loader
+        self._childs_cache = None
+
+    @property
+    def body(self) -> Optional[StmtNode]:
+        if self._body_loader is not None:
+            self._body = self._body_loader()
+            self._body_loader = None
+        return self._body
+
+    @body.setter
+    def body(self, body: Optional[StmtNode]) -> None:
+        self._body = body
+        self._body_loader = None
+
+    @property
+    def body_loaded(self) -> bool:
+        """Разобрано ли уже тело функции
+        """
+        return self._body_loader is None
 
     def __str__(self) -> str:
         return 'function'
 
     @property
     def childs(self) -> Tuple[AstNode, ...]:
-        return _GroupNode(str(self.access),
-                          _GroupNode(str(self.static),
-                                     _GroupNode(str(self.type),
-                                                self.name),
-                                     )), _GroupNode('params', *self.params), self.body
+        return self._cached_childs(
+            (self.access, self.static, self.type, self.name, self.params, self.body),
+            lambda: (_GroupNode(str(self.access),
+                                _GroupNode(str(self.static),
+                                           _GroupNode(str(self.type),
+                                                      self.name),
+                                           )), _GroupNode('params', *self.params), self.body))
 
 
 class StmtListNode(StmtNode):
-    """Класс для представления в AST-дереве последовательности инструкций
+    """Класс для представления в AST-дереве последовательности инструкций; у корня дерева
+       программы program = True и positions - индекс строк текста (нужен, когда row/col узлов
+       уже вычислены и ссылки на индекс в узлах сброшены, например при сериализации в AstArena)
     """
 
+    __slots__ = ('exprs', 'program', 'positions')
+    _fields = ('*exprs',)
+
     def __init__(self, *exprs: StmtNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
         self.exprs = exprs
         self.program = False
+        self.positions: Optional[LineIndex] = None
 
     def __str__(self) -> str:
         return '...'
@@ -357,6 +611,9 @@ class FuncStmtListNode(StmtNode):
     """Класс для представления в AST-дереве последовательности инструкций
     """
 
+    __slots__ = ('exprs', 'program')
+    _fields = ('*exprs',)
+
     def __init__(self, *exprs: StmtNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -379,24 +636,33 @@ class ClassInitNode(StmtNode):
     """Класс для представления в AST-дереве объявления функции
     """
 
+    __slots__ = ('access', 'name', 'body', '_childs_cache')
+    _fields = ('access', 'name', 'body')
+
     def __init__(self, access: AccessNode, name: IdentNode, body: Optional[StmtListNode] = None,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
         self.access = access if access else empty_access
         self.name = name
         self.body = body if body else empty_statement_list
+        self._childs_cache = None
 
     def __str__(self) -> str:
         return 'class'
 
     @property
     def childs(self) -> Tuple[AstNode, ...]:
-        return _GroupNode(str(self.access), self.name), self.body
+        return self._cached_childs((self.access, self.name, self.body),
+                                   lambda: (_GroupNode(str(self.access), self.name), self.body))
 
 class BinOpNode(ExprNode):
     """Класс для представления в AST-дереве бинарных операций
     """
 
+    __slots__ = ('op', 'arg1', 'arg2')
+    _attrs = ('op',)
+    _fields = ('arg1', 'arg2')
+
     def __init__(self, op: BinOp, arg1: ExprNode, arg2: ExprNode,
                  row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
         super().__init__(row=row, col=col, **props)
@@ -412,5 +678,89 @@ class BinOpNode(ExprNode):
         return self.arg1, self.arg2
 
 
+class OpAssignNode(ExprNode):
+    """Класс для представления в AST-дереве составного присваивания (a += b и т.п.); op - операция,
+       которая применяется к старому значению var и val. Грамматика разбирает составные присваивания
+       как самые слабые бинарные операции, поэтому var - любое выражение (что это переменная,
+       проверяет семантический анализ)
+    """
+
+    __slots__ = ('op', 'var', 'val')
+    _attrs = ('op',)
+    _fields = ('var', 'val')
+
+    def __init__(self, op: BinOp, var: ExprNode, val: ExprNode,
+                 row: Optional[int] = None, col: Optional[int] = None, **props) -> None:
+        super().__init__(row=row, col=col, **props)
+        self.op = op
+        self.var = var
+        self.val = val
+
+    def __str__(self) -> str:
+        return str(self.op.value) + '='
+
+    @property
+    def childs(self) -> Tuple[ExprNode, ExprNode]:
+        return self.var, self.val
+
+
+# операции составных присваиваний по тексту
+OP_ASSIGN_OPS: Dict[str, BinOp] = {op.value + '=': op for op in (BinOp.MUL, BinOp.DIV, BinOp.ADD, BinOp.SUB)}
+# приоритет составных присваиваний (самый слабый); в отличие от остальных операций они правоассоциативны
+OP_ASSIGN_PRECEDENCE = 0
+
+# приоритет операции по ее тексту
+OP_PRECEDENCE: Dict[str, int] = {op.value: precedence for op, precedence in BIN_OP_PRECEDENCE.items()}
+OP_PRECEDENCE.update(dict.fromkeys(OP_ASSIGN_OPS, OP_ASSIGN_PRECEDENCE))
+
+
+class BinOpChain:
+    """Построение дерева BinOpNode (и OpAssignNode для составных присваиваний) по цепочке
+       operand (op operand)* с учетом приоритетов операций без рекурсии (алгоритм сортировочной станции); позиция узла - позиция его левого операнда
+    """
+
+    __slots__ = ('operands', 'ops', 'precedences')
+
+    def __init__(self, operand: ExprNode, loc: int) -> None:
+        self.operands: List[Tuple[ExprNode, int]] = [(operand, loc)]
+        self.ops: List[str] = []
+        self.precedences: List[int] = []
+
+    def accepts(self, op: str) -> bool:
+        """Можно ли продолжить цепочку операцией op (нельзя, если это второе сравнение того же уровня)
+        """
+        precedence = OP_PRECEDENCE[op]
+        return precedence not in NON_ASSOCIATIVE_PRECEDENCES or precedence not in self.precedences
+
+    def push(self, op: str, operand: ExprNode, loc: int) -> None:
+        precedence = OP_PRECEDENCE[op]
+        precedences = self.precedences
+        # в стеке приоритеты строго возрастают (кроме подряд идущих составных присваиваний: a += b += c -
+        # это a += (b += c)), поэтому в нем не больше одной операции каждого другого уровня
+        while precedences and (precedences[-1] > precedence or
+                               precedences[-1] == precedence != OP_ASSIGN_PRECEDENCE):
+            self._reduce()
+        self.ops.append(op)
+        precedences.append(precedence)
+        self.operands.append((operand, loc))
+
+    def _reduce(self) -> None:
+        op = self.ops.pop()
+        self.precedences.pop()
+        arg2, _ = self.operands.pop()
+        arg1, loc = self.operands[-1]
+        assign_op = OP_ASSIGN_OPS.get(op)
+        if assign_op is not None:
+            node = OpAssignNode(assign_op, arg1, arg2, loc=loc)
+        else:
+            node = BinOpNode(BinOp(op), arg1, arg2, loc=loc)
+        self.operands[-1] = node, loc
+
+    def result(self) -> ExprNode:
+        while self.ops:
+            self._reduce()
+        return self.operands[0][0]
+
+
 empty_statement_list = StmtListNode()
 empty_access = AccessNode("")
@@ -0,0 +1,118 @@
+"""Кэш результатов разбора на диске.
+
+   Ключ записи - хэш исходного текста вместе с версией грамматики (движка) и формата, значение -
+   дерево в двоичном формате AstArena. Файлы загружаются через mmap; при превышении
+   max_size удаляются записи, к которым дольше всего не обращались (время доступа - mtime файла).
+
+   Каталог просматривается не при каждой записи: кэш ведет оценку своего размера (по своим записям)
+   и вытесняет записи, только когда она превышает max_size или после каждых EVICT_CHECK_INTERVAL
+   записей - чтобы учесть файлы, записанные другими процессами
+"""
+import hashlib
+import mmap
+import os
+import sys
+from typing import Optional
+
+from .arena import AstArena, FORMAT_VERSION
+from .ast import AstNode
+
+CACHE_SUFFIX = '.ast'
+EVICT_CHECK_INTERVAL = 64
+
+
+class ParseCache:
+    """Кэш деревьев разбора в каталоге directory (не более max_size байт)
+    """
+
+    def __init__(self, directory: str, max_size: int = 256 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        # оценка размера кэша (None - неизвестен) и число записей после последнего просмотра каталога
+        self._size: Optional[int] = None
+        self._puts = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, prog: str, tag: str) -> str:
+        h = hashlib.sha256('{}:{}:{}:'.format(tag, FORMAT_VERSION, sys.byteorder).encode('utf-8'))
+        h.update(prog.encode('utf-8', 'surrogatepass'))
+        return h.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def get(self, prog: str, tag: str) -> Optional[AstNode]:
+        """Дерево из кэша или None; tag - версия грамматики/движка, которым строилось дерево
+        """
+        path = self._path(self.key(prog, tag))
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            return None
+        try:
+            with f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                arena = AstArena.from_bytes(buffer)
+                try:
+                    tree = arena.to_tree()
+                finally:
+                    # дерево на buffer не ссылается, а оставшиеся представления не дали бы закрыть mmap
+                    arena.release()
+        except Exception:
+            # поврежденная или обрезанная запись (в том числе пустой файл) - промах, запись удаляется
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            return None
+        # время изменения файла используется как время последнего доступа для вытеснения
+        os.utime(path)
+        return tree
+
+    def put(self, prog: str, tag: str, tree: AstNode) -> None:
+        import tempfile
+
+        data = AstArena.from_tree(tree).to_bytes()
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(self.key(prog, tag)))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self._puts += 1
+        if self._size is not None:
+            self._size += len(data)
+        if self._size is None or self._size > self.max_size or self._puts >= EVICT_CHECK_INTERVAL:
+            self.evict()
+
+    def evict(self) -> None:
+        """Удаление самых давно использованных записей, пока размер кэша больше max_size
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_SUFFIX):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total += stat.st_size
+        if total > self.max_size:
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_size:
+                    break
+        self._size = total
+        self._puts = 0
+
+    def clear(self) -> None:
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(CACHE_SUFFIX):
+                    os.unlink(entry.path)
+        self._size = 0
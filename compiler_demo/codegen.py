@@ -0,0 +1,640 @@
+"""Компиляция методов (FuncNode) в функции Python.
+
+   По дереву после семантического анализа (node_ident, node_type) для метода генерируется
+   исходный текст функции Python, который компилируется встроенным compile(). Параметры
+   и локальные переменные метода становятся локальными переменными функции (быстрые слоты
+   интерпретатора); одноименные объявления в разных блоках различаются номером слота
+   (IdentDesc.index). Имена в тексте функции: v<слот>_<имя> - локальные переменные,
+   m_<имя> и f_<имя> - методы и поля класса, _<имя> - функции времени выполнения.
+   Код метода кэшируется в узле FuncNode и строится заново, только если у метода заменено тело.
+
+   Поддерживается подмножество Java для вычислений: int, long, float, double, boolean, char
+   и String (сцепление), арифметика с переполнением и делением по правилам Java, сравнения,
+   && и ||, присваивания, локальные переменные, if, for, break, continue, return и вызовы
+   методов того же класса. Методы и поля класса считаются статическими: поля хранятся
+   в пространстве имен скомпилированного класса. На остальном (new, обращения через точку,
+   вложенные классы, ...) компиляция завершается CompileError. Целочисленное деление на ноль
+   бросает ZeroDivisionError (ArithmeticException в Java)
+"""
+import math
+import struct
+import warnings
+from decimal import Decimal
+from types import CodeType, FunctionType
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+from .ast import *
+from .semantic import BaseType, ScopeType
+from .visitor import _Dispatcher
+
+# глубина вложенности блоков, которую еще принимает compile()
+MAX_BLOCK_DEPTH = 90
+
+_INTEGRAL = (BaseType.INT, BaseType.LONG, BaseType.CHAR)
+_FLOATING = (BaseType.FLOAT, BaseType.DOUBLE)
+_PY_OPS = {BinOp.ADD: '+', BinOp.SUB: '-', BinOp.MUL: '*', BinOp.GT: '>', BinOp.LT: '<', BinOp.GE: '>=',
+           BinOp.LE: '<=', BinOp.EQUALS: '==', BinOp.NEQUALS: '!=', BinOp.LOGICAL_AND: 'and',
+           BinOp.LOGICAL_OR: 'or'}
+# перенос результата в диапазон int/long: сравнения с границами из одной "цифры" длинного целого
+# Python выполняются быстро, полный перенос (_wrap32/_wrap64) - только для больших значений
+_WRAP = {BaseType.INT: '(_t if -0x40000000 <= (_t := {}) < 0x40000000 else _wrap32(_t))',
+         BaseType.LONG: '(_t if -0x40000000 <= (_t := {}) < 0x40000000 else _wrap64(_t))'}
+_DEFAULTS = {BaseType.INT: 0, BaseType.LONG: 0, BaseType.CHAR: 0, BaseType.FLOAT: 0.0, BaseType.DOUBLE: 0.0,
+             BaseType.BOOL: False}
+_FLOAT32 = struct.Struct('f')
+
+
+class CompileError(Exception):
+    """Конструкция, которую нельзя скомпилировать, в узле node
+    """
+
+    def __init__(self, msg: str, node: Optional[AstNode] = None) -> None:
+        super().__init__(msg)
+        self.msg = msg
+        self.node = node
+
+    def __str__(self) -> str:
+        row, col = getattr(self.node, 'row', None), getattr(self.node, 'col', None)
+        if row is None:
+            return self.msg
+        return '{} (at {}:{})'.format(self.msg, row, col)
+
+
+# функции времени выполнения, которые использует сгенерированный код
+
+def _f32(x: float) -> float:
+    try:
+        return _FLOAT32.unpack(_FLOAT32.pack(x))[0]
+    except OverflowError:
+        return math.copysign(math.inf, x)
+
+
+def _wrap32(x: int) -> int:
+    return (x + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+
+
+def _wrap64(x: int) -> int:
+    return (x + 0x8000000000000000 & 0xFFFFFFFFFFFFFFFF) - 0x8000000000000000
+
+
+def _idiv32(a: int, b: int) -> int:
+    q = abs(a) // abs(b)
+    q = q if (a < 0) == (b < 0) else -q
+    return q if q != 0x80000000 else -0x80000000
+
+
+def _idiv64(a: int, b: int) -> int:
+    q = abs(a) // abs(b)
+    q = q if (a < 0) == (b < 0) else -q
+    return q if q != 0x8000000000000000 else -0x8000000000000000
+
+
+def _irem(a: int, b: int) -> int:
+    r = abs(a) % abs(b)
+    return r if a >= 0 else -r
+
+
+def _fdiv(a: float, b: float) -> float:
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a != a or a == 0:
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+def _frem(a: float, b: float) -> float:
+    try:
+        return math.fmod(a, b)
+    except ValueError:
+        return math.nan
+
+
+def _java_float_str(x: float, digits: str) -> str:
+    """Текст вещественного числа, как его выводит Java (Double.toString); digits - кратчайшая
+       десятичная запись числа
+    """
+    if x != x:
+        return 'NaN'
+    if math.isinf(x):
+        return 'Infinity' if x > 0 else '-Infinity'
+    if x == 0:
+        return '-0.0' if math.copysign(1.0, x) < 0 else '0.0'
+    sign, all_digits, exponent = Decimal(digits).as_tuple()
+    all_digits = ''.join(map(str, all_digits))
+    point = len(all_digits) + exponent  # позиция десятичной точки относительно первой цифры
+    all_digits = all_digits.rstrip('0')
+    if 1e-3 <= abs(x) < 1e7:
+        if point > 0:
+            text = all_digits[:point].ljust(point, '0') + '.' + (all_digits[point:] or '0')
+        else:
+            text = '0.' + '0' * -point + all_digits
+    else:
+        text = '{}.{}E{}'.format(all_digits[0], all_digits[1:] or '0', point - 1)
+    return '-' + text if sign else text
+
+
+def _dstr(x: float) -> str:
+    return _java_float_str(x, repr(x))
+
+
+def _fstr(x: float) -> str:
+    if x != x or math.isinf(x) or x == 0:
+        return _java_float_str(x, '0')
+    for precision in range(9):
+        digits = '{:.{}e}'.format(x, precision)
+        if _f32(float(digits)) == x:
+            return _java_float_str(x, digits)
+    return _java_float_str(x, repr(x))
+
+
+def _jstr(s: Optional[str]) -> str:
+    return 'null' if s is None else s
+
+
+_RUNTIME = {'_f32': _f32, '_wrap32': _wrap32, '_wrap64': _wrap64, '_idiv32': _idiv32, '_idiv64': _idiv64, '_irem': _irem, '_fdiv': _fdiv, '_frem': _frem,
+            '_dstr': _dstr, '_fstr': _fstr, '_jstr': _jstr}
+
+
+def _expr_childs(node: AstNode) -> Sequence[AstNode]:
+    if isinstance(node, BinOpNode):
+        return (node.arg1, node.arg2) if node.op is not BinOp.DOT else ()
+    if isinstance(node, CallNode):
+        return node.params
+    if isinstance(node, AssignNode):
+        return (node.val,)
+    return ()
+
+
+class _FuncCompiler(_Dispatcher):
+    """Генерация текста функции Python для одного метода; members - имена членов класса
+       (методов и полей) в пространстве имен скомпилированного класса
+    """
+
+    def __init__(self, node: FuncNode, members: Dict[IdentDesc, str]) -> None:
+        self.node = node
+        self.members = members
+        self.lines: List[str] = []
+        self.assigned_members: Dict[str, None] = {}
+        # шаги объемлющих циклов for: continue выполняет шаг самого внутреннего
+        self.steps: List[Sequence[AstNode]] = []
+        # узлы +, -, * над int и long, значение которых еще не перенесено в диапазон типа:
+        # в арифметике по модулю 2**n перенос можно делать один раз для всей цепочки операций
+        self.raw: Set[int] = set()
+
+    def source(self) -> str:
+        node = self.node
+        ident = node.name.node_ident
+        if ident is None or not ident.type.func:
+            raise CompileError('Method is not analyzed', node)
+        if node.body is None:
+            raise CompileError('Method has no body', node)
+        params = ', '.join(self._local(param.name) for param in node.params)
+        self._block(node.body.exprs, 1)
+        if self.assigned_members:
+            self.lines.insert(0, '    global ' + ', '.join(self.assigned_members))
+        self.lines.insert(0, 'def {}({}):'.format(self.members[ident], params))
+        return '\n'.join(self.lines) + '\n'
+
+    def _emit(self, indent: int, text: str) -> None:
+        self.lines.append('    ' * indent + text)
+
+    # имена
+
+    def _local(self, name_node: IdentNode) -> str:
+        ident = name_node.node_ident
+        if ident is None or ident.scope not in (ScopeType.PARAM, ScopeType.LOCAL):
+            raise CompileError("Unknown local variable '{}'".format(name_node.name), name_node)
+        return 'v{}_{}'.format(ident.index, ident.name)
+
+    def _name(self, name_node: IdentNode) -> str:
+        ident = name_node.node_ident
+        if ident is not None and ident.scope in (ScopeType.PARAM, ScopeType.LOCAL):
+            return 'v{}_{}'.format(ident.index, ident.name)
+        name = self.members.get(ident)
+        if name is None or ident.type.func:
+            raise CompileError("'{}' is not a local variable or a field of the class".format(name_node.name),
+                               name_node)
+        return name
+
+    def _target(self, name_node: ExprNode) -> Tuple[str, TypeDesc]:
+        if not isinstance(name_node, IdentNode):
+            raise CompileError('Unsupported assignment target', name_node)
+        name = self._name(name_node)
+        if name_node.node_ident.scope not in (ScopeType.PARAM, ScopeType.LOCAL):
+            self.assigned_members[name] = None
+        return name, name_node.node_ident.type
+
+    # типы
+
+    @staticmethod
+    def _type(node: AstNode) -> TypeDesc:
+        type_ = node.node_type
+        if type_ is None:
+            raise CompileError('Unknown type of expression', node)
+        return type_
+
+    @staticmethod
+    def _convert(code: str, from_type: TypeDesc, to_type: TypeDesc, node: AstNode) -> str:
+        """Присваивающее преобразование значения code типа from_type к типу to_type
+        """
+        if from_type is to_type:
+            return code
+        from_base, to_base = from_type.base_type, to_type.base_type
+        if to_base is BaseType.DOUBLE and from_base in _INTEGRAL:
+            return 'float({})'.format(code)
+        if to_base is BaseType.DOUBLE and from_base is BaseType.FLOAT:
+            return code
+        if to_base is BaseType.FLOAT and from_base in _INTEGRAL:
+            return '_f32({})'.format(code)
+        if to_base in (BaseType.INT, BaseType.LONG) and from_base in (BaseType.INT, BaseType.CHAR) \
+                or to_base is BaseType.LONG and from_base is BaseType.LONG:
+            return code
+        if from_type.name == 'null' and to_base not in _DEFAULTS:
+            return code
+        raise CompileError('Incompatible types: {} cannot be converted to {}'.format(from_type, to_type), node)
+
+    # инструкции
+
+    def _block(self, stmts: Sequence[AstNode], indent: int) -> None:
+        if indent > MAX_BLOCK_DEPTH:
+            raise CompileError('Blocks are nested too deeply', stmts[0] if stmts else self.node)
+        start = len(self.lines)
+        for stmt in stmts:
+            self._stmt(stmt, indent)
+        if len(self.lines) == start:
+            self._emit(indent, 'pass')
+
+    @staticmethod
+    def _stmts(node: Optional[AstNode]) -> Sequence[AstNode]:
+        if node is None:
+            return ()
+        return node.exprs if isinstance(node, (StmtListNode, FuncStmtListNode)) else (node,)
+
+    def _stmt(self, node: AstNode, indent: int) -> None:
+        stmt = self._handler('stmt_', type(node))
+        if stmt is None:
+            raise CompileError('Unsupported statement: {}'.format(node), node)
+        stmt(self, node, indent)
+
+    def stmt_ExprNode(self, node: ExprNode, indent: int) -> None:
+        self._emit(indent, self._expr(node))
+
+    def stmt_StmtNode(self, node: StmtNode, indent: int) -> None:
+        raise CompileError('Unsupported statement: {}'.format(node), node)
+
+    def stmt_StmtListNode(self, node: Union[StmtListNode, FuncStmtListNode], indent: int) -> None:
+        for stmt in node.exprs:
+            self._stmt(stmt, indent)
+
+    stmt_FuncStmtListNode = stmt_StmtListNode
+
+    def stmt_IdentNode(self, node: IdentNode, indent: int) -> None:
+        if node.name == 'break':
+            self._emit(indent, 'break')
+        elif node.name == 'continue':
+            if self.steps:
+                for step in self.steps[-1]:
+                    self._stmt(step, indent)
+            self._emit(indent, 'continue')
+        else:
+            self.stmt_ExprNode(node, indent)
+
+    def stmt_AssignNode(self, node: AssignNode, indent: int) -> None:
+        name, type_ = self._target(node.var)
+        self._emit(indent, '{} = {}'.format(name, self._convert(self._expr(node.val), self._type(node.val),
+                                                               type_, node.val)))
+
+    def stmt_VarsNode(self, node: VarsNode, indent: int) -> None:
+        for var in node.vars:
+            # объявление без инициализатора ничего не делает: Java не дает читать переменную до присваивания
+            if isinstance(var, AssignNode):
+                self.stmt_AssignNode(var, indent)
+
+    def stmt_ReturnNode(self, node: ReturnNode, indent: int) -> None:
+        return_type = self.node.name.node_ident.type.return_type
+        if node.val is None:
+            self._emit(indent, 'return')
+        else:
+            code = self._expr(node.val)
+            self._emit(indent, 'return ' + self._convert(code, self._type(node.val), return_type, node.val))
+
+    def stmt_IfNode(self, node: IfNode, indent: int) -> None:
+        self._emit(indent, 'if {}:'.format(self._expr(node.cond)))
+        self._block(self._stmts(node.then_stmt), indent + 1)
+        if node.else_stmt is not None:
+            self._emit(indent, 'else:')
+            self._block(self._stmts(node.else_stmt), indent + 1)
+
+    def stmt_ForNode(self, node: ForNode, indent: int) -> None:
+        for stmt in self._stmts(node.init):
+            self._stmt(stmt, indent)
+        cond = node.cond
+        no_cond = isinstance(cond, StmtListNode) and not cond.exprs
+        self._emit(indent, 'while {}:'.format('True' if no_cond else self._expr(cond)))
+        step = self._stmts(node.step)
+        self.steps.append(step)
+        self._block(self._stmts(node.body), indent + 1)
+        self.steps.pop()
+        for stmt in step:
+            self._stmt(stmt, indent + 1)
+
+    # выражения
+
+    def _expr(self, root: AstNode) -> str:
+        """Текст выражения Python для root (без рекурсии: длинные цепочки операций не упираются
+           в глубину стека)
+        """
+        stack: List[Tuple[AstNode, bool]] = [(root, False)]
+        results: List[str] = []
+        handler = self._handler
+        while stack:
+            node, ready = stack.pop()
+            childs = _expr_childs(node)
+            if not ready:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(childs))
+                continue
+            args = results[len(results) - len(childs):] if childs else []
+            if childs:
+                del results[len(results) - len(childs):]
+            expr = handler('expr_', type(node))
+            if expr is None:
+                raise CompileError('Unsupported expression: {}'.format(node), node)
+            results.append(expr(self, node, args))
+        return self._value(results[0], root)
+
+    def _value(self, code: str, node: AstNode) -> str:
+        """Значение выражения node (код code) в диапазоне его типа
+        """
+        if id(node) not in self.raw:
+            return code
+        return _WRAP[node.node_type.base_type].format(code)
+
+    def expr_LiteralNode(self, node: LiteralNode, args: List[str]) -> str:
+        base_type = node.type.base_type
+        if base_type is BaseType.CHAR:
+            return str(ord(node.value))
+        return repr(node.value)
+
+    def expr_IdentNode(self, node: IdentNode, args: List[str]) -> str:
+        ident = node.node_ident
+        if ident is not None and ident.built_in and node.name == 'null':
+            return 'None'
+        return self._name(node)
+
+    def expr_AssignNode(self, node: AssignNode, args: List[str]) -> str:
+        name, type_ = self._target(node.var)
+        value = self._value(args[0], node.val)
+        return '({} := {})'.format(name, self._convert(value, self._type(node.val), type_, node.val))
+
+    def expr_CallNode(self, node: CallNode, args: List[str]) -> str:
+        func = node.func
+        ident = func.node_ident
+        name = self.members.get(ident)
+        if name is None or not ident.type.func:
+            raise CompileError("'{}' is not a method of the class".format(func.name), func)
+        if len(args) != len(ident.type.params):
+            raise CompileError("Method '{}' expects {} arguments".format(func.name, len(ident.type.params)), node)
+        params = (self._convert(self._value(arg, param), self._type(param), type_, param)
+                  for arg, param, type_ in zip(args, node.params, ident.type.params))
+        return '{}({})'.format(name, ', '.join(params))
+
+    def expr_BinOpNode(self, node: BinOpNode, args: List[str]) -> str:
+        op = node.op
+        if op is BinOp.DOT:
+            raise CompileError('Member access is not supported', node)
+        type1, type2 = self._type(node.arg1), self._type(node.arg2)
+        base1, base2 = type1.base_type, type2.base_type
+        raw_a, raw_b = args
+        a, b = self._value(raw_a, node.arg1), self._value(raw_b, node.arg2)
+        if op is BinOp.LOGICAL_AND or op is BinOp.LOGICAL_OR:
+            return '({} {} {})'.format(a, _PY_OPS[op], b)
+        numeric = base1 in _INTEGRAL + _FLOATING and base2 in _INTEGRAL + _FLOATING
+        if op in (BinOp.EQUALS, BinOp.NEQUALS) and not numeric and not (base1 is base2 is BaseType.BOOL):
+            # ссылки (строки, объекты, null) сравниваются как ссылки
+            return '({} {} {})'.format(a, 'is' if op is BinOp.EQUALS else 'is not', b)
+        if op in (BinOp.GT, BinOp.LT, BinOp.GE, BinOp.LE, BinOp.EQUALS, BinOp.NEQUALS):
+            if not numeric and op not in (BinOp.EQUALS, BinOp.NEQUALS):
+                raise CompileError("Bad operand types for '{}'".format(op), node)
+            # целое сравнивается с вещественным после преобразования в вещественное, как в Java
+            if base1 in _INTEGRAL and base2 in _FLOATING:
+                a = 'float({})'.format(a)
+            elif base2 in _INTEGRAL and base1 in _FLOATING:
+                b = 'float({})'.format(b)
+            return '({} {} {})'.format(a, _PY_OPS[op], b)
+        result_type = self._type(node)
+        if result_type is TypeDesc.STR:
+            return '({} + {})'.format(self._string(a, node.arg1), self._string(b, node.arg2))
+        base = result_type.base_type
+        if base in (BaseType.INT, BaseType.LONG):
+            if op is BinOp.DIV or op is BinOp.MOD:
+                return self._int_div(op, base, a, b)
+            # операнд того же типа можно не переносить в диапазон: перенос будет у результата
+            self.raw.add(id(node))
+            return '({} {} {})'.format(raw_a if base1 is base else a, _PY_OPS[op], raw_b if base2 is base else b)
+        if base in _FLOATING:
+            if op is BinOp.DIV:
+                code = '_fdiv({}, {})'.format(a, b)
+            elif op is BinOp.MOD:
+                code = '_frem({}, {})'.format(a, b)
+            else:
+                code = '({} {} {})'.format(a, _PY_OPS[op], b)
+            return code if base is BaseType.DOUBLE else '_f32({})'.format(code)
+        raise CompileError("Bad operand types for '{}'".format(op), node)
+
+    @staticmethod
+    def _int_div(op: BinOp, base: BaseType, a: str, b: str) -> str:
+        # деление на положительную константу переменной или константы - без вызова функции
+        if b.isdigit() and int(b) > 0 and (a.isidentifier() or a.lstrip('-').isdigit()):
+            py_op = '//' if op is BinOp.DIV else '%'
+            return '({0} {1} {2} if {0} >= 0 else -(-{0} {1} {2}))'.format(a, py_op, b)
+        if op is BinOp.MOD:
+            return '_irem({}, {})'.format(a, b)
+        return '{}({}, {})'.format('_idiv32' if base is BaseType.INT else '_idiv64', a, b)
+
+    def _string(self, code: str, node: AstNode) -> str:
+        """Преобразование значения к строке при сцеплении
+        """
+        type_ = self._type(node)
+        base_type = type_.base_type
+        if base_type is BaseType.STR:
+            # литерал и результат сцепления не бывают null
+            return code if isinstance(node, (LiteralNode, BinOpNode)) else '_jstr({})'.format(code)
+        if base_type in (BaseType.INT, BaseType.LONG):
+            return 'str({})'.format(code)
+        if base_type is BaseType.BOOL:
+            return "('true' if {} else 'false')".format(code)
+        if base_type is BaseType.CHAR:
+            return 'chr({})'.format(code)
+        if base_type is BaseType.DOUBLE:
+            return '_dstr({})'.format(code)
+        if base_type is BaseType.FLOAT:
+            return '_fstr({})'.format(code)
+        if type_.name == 'null':
+            return "'null'"
+        raise CompileError("Cannot convert '{}' to string".format(type_), node)
+
+
+def generate_source(node: FuncNode, members: Optional[Dict[IdentDesc, str]] = None) -> str:
+    """Текст функции Python для метода node (дерево должно быть размечено семантическим анализом);
+       members - имена методов и полей класса в пространстве имен (по умолчанию - только сам метод)
+    """
+    if members is None:
+        members = _own_members(node)
+    return _FuncCompiler(node, members).source()
+
+
+def _own_members(node: FuncNode) -> Dict[IdentDesc, str]:
+    ident = node.name.node_ident
+    if ident is None:
+        raise CompileError('Method is not analyzed', node)
+    return {ident: 'm_' + node.name.name}
+
+
+def _fingerprint(node: FuncNode) -> list:
+    """Все, от чего зависит текст функции метода node: для каждого узла в прямом порядке - класс,
+       скалярные поля (_attrs), семантическая разметка и форма полей с детьми (узел, None или длина
+       кортежа). Отпечаток меняется при любой правке дерева, в том числе на месте (свертка,
+       NodeTransformer, присваивание полю), и в несколько раз дешевле генерации текста
+    """
+    result = []
+    stack: List[AstNode] = [node]
+    while stack:
+        item = stack.pop()
+        cls = type(item)
+        extra = item._extra
+        result.append(cls)
+        for attr in cls._attrs:
+            result.append(getattr(item, attr))
+        if extra:
+            result.append(extra.get('node_ident'))
+            result.append(extra.get('node_type'))
+        else:
+            result.append(None)
+            result.append(None)
+        childs = []
+        for field in cls._fields:
+            value = getattr(item, field.lstrip('*'))
+            if isinstance(value, AstNode):
+                result.append(-1)
+                childs.append(value)
+            elif value is None:
+                result.append(-2)
+            else:
+                result.append(len(value))
+                childs.extend(value)
+        childs.reverse()
+        stack.extend(childs)
+    return result
+
+
+def _method_code(node: FuncNode, members: Dict[IdentDesc, str]) -> CodeType:
+    """Код функции для метода node; кэшируется в узле, пока не изменятся метод (см. _fingerprint)
+       или имена членов класса
+    """
+    fingerprint = _fingerprint(node)
+    cached = getattr(node, 'compiled', None)
+    if cached is not None and cached[0] == fingerprint and cached[1] == members:
+        return cached[2]
+    source = generate_source(node, members)
+    try:
+        with warnings.catch_warnings():
+            # строки сравниваются по ссылке (is) и с литералами, как == в Java
+            warnings.simplefilter('ignore', SyntaxWarning)
+            module = compile(source, '<{}>'.format(node.name.name), 'exec')
+    except (SyntaxError, RecursionError, MemoryError) as e:
+        # например, слишком длинная цепочка операций для компилятора Python
+        raise CompileError('Cannot compile method: {}'.format(e), node) from e
+    code = next(const for const in module.co_consts if isinstance(const, CodeType))
+    node._set_extra('compiled', (fingerprint, dict(members), code))
+    return code
+
+
+def compile_func(node: FuncNode) -> Callable:
+    """Функция Python для метода node без обращений к другим членам класса (кроме себя самого)
+    """
+    members = _own_members(node)
+    namespace = dict(_RUNTIME)
+    name = members[node.name.node_ident]
+    func = namespace[name] = FunctionType(_method_code(node, members), namespace, node.name.name)
+    return func
+
+
+class CompiledClass:
+    """Скомпилированный класс (или программа): методы - функции Python, поля - значения
+       в пространстве имен namespace; обращение к члену по имени - атрибут объекта.
+       errors - ошибки компиляции членов: такой метод при вызове бросает CompileError,
+       поле без вычисленного инициализатора получает значение по умолчанию
+    """
+
+    def __init__(self, namespace: Dict[str, Any], errors: List[CompileError]) -> None:
+        self.namespace = namespace
+        self.errors = errors
+
+    def __getattr__(self, name: str) -> Any:
+        namespace = self.__dict__['namespace']
+        for key in ('m_' + name, 'f_' + name):
+            if key in namespace:
+                return namespace[key]
+        raise AttributeError("Class has no member '{}'".format(name))
+
+
+def _failed(error: CompileError) -> Callable:
+    def method(*args: Any) -> Any:
+        raise error
+
+    return method
+
+
+def compile_class(node: Union[ClassInitNode, StmtListNode]) -> CompiledClass:
+    """Компиляция методов и инициализаторов полей класса (или членов верхнего уровня программы);
+       дерево должно быть размечено семантическим анализом
+    """
+    body = node.body.exprs if isinstance(node, ClassInitNode) else node.exprs
+    members: Dict[IdentDesc, str] = {}
+    funcs, fields = [], []
+    for stmt in body:
+        if isinstance(stmt, FuncNode):
+            funcs.append(stmt)
+            names = (stmt.name,)
+        elif isinstance(stmt, VarsNode):
+            fields.append(stmt)
+            names = [var.var if isinstance(var, AssignNode) else var for var in stmt.vars]
+        else:
+            continue
+        for name in names:
+            if name.node_ident is None:
+                raise CompileError('Class is not analyzed', name)
+            members[name.node_ident] = ('m_' if isinstance(stmt, FuncNode) else 'f_') + name.name
+
+    namespace = dict(_RUNTIME)
+    errors = []
+    for func in funcs:
+        name = members[func.name.node_ident]
+        try:
+            namespace[name] = FunctionType(_method_code(func, members), namespace, func.name.name)
+        except CompileError as e:
+            errors.append(e)
+            namespace[name] = _failed(e)
+    # поля инициализируются в порядке объявления, как при загрузке класса в Java
+    for stmt in fields:
+        for var in stmt.vars:
+            name_node = var.var if isinstance(var, AssignNode) else var
+            name = members[name_node.node_ident]
+            namespace[name] = _DEFAULTS.get(name_node.node_ident.type.base_type)
+            if isinstance(var, AssignNode):
+                try:
+                    namespace[name] = _eval_init(var, members, namespace)
+                except CompileError as e:
+                    errors.append(e)
+    return CompiledClass(namespace, errors)
+
+
+def _eval_init(var: AssignNode, members: Dict[IdentDesc, str], namespace: Dict[str, Any]) -> Any:
+    compiler = _FuncCompiler(FuncNode(None, None, None, IdentNode('<init>'), ()), members)
+    code = compiler._convert(compiler._expr(var.val), compiler._type(var.val), var.var.node_ident.type, var.val)
+    try:
+        return eval(compile(code, '<init>', 'eval'), namespace)
+    except (SyntaxError, RecursionError, MemoryError) as e:
+        raise CompileError('Cannot compile initializer: {}'.format(e), var) from e
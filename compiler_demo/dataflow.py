@@ -0,0 +1,457 @@
+"""Граф потока управления (CFG) метода и анализы потока данных на битовых множествах.
+
+   Тело метода (после семантического анализа) разбивается на базовые блоки: if и for дают
+   ветвления и обратные дуги, return, break и continue - переходы на выход метода или цикла.
+   В блоке хранятся инструкции, которые в нем начинаются, и события - чтения (USE) и записи (DEF)
+   параметров и локальных переменных в порядке вычисления. Множества в анализах - целые числа
+   Python как битовые векторы: бит переменной - ее номер слота (IdentDesc.index), бит определения -
+   номер записи в методе. Объединение и разность множеств - одна операция над целым, а не
+   перебор элементов, поэтому итерация до неподвижной точки (в обратном постпорядке блоков)
+   остается почти линейной и на методах из тысяч инструкций.
+
+   Определения: присваивание и объявление с инициализатором - запись значения, объявление без
+   инициализатора - "неопределенное" значение переменной (в цикле переменная при каждом проходе
+   объявляется заново). Условие if не считается константой (как в Java для недостижимого кода),
+   условие for из литерала true или пустое - бесконечный цикл
+"""
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from .analyzer import SemanticError
+from .ast import *
+from .semantic import ScopeType
+from .visitor import _Dispatcher, child_nodes, walk
+
+# виды событий блока
+USE, DEF = 0, 1
+
+# событие: вид, номер переменной, номер определения (у USE - -1) и узел идентификатора
+Event = Tuple[int, int, int, IdentNode]
+
+
+class LintWarning(SemanticError):
+    """Предупреждение проверки кода (lint) в узле node
+    """
+
+
+class Block:
+    """Базовый блок: инструкции stmts, которые начинаются в блоке, события events, номера
+       блоков-последователей succs и предшественников preds. visible = False - инструкции блока
+       не отдельные инструкции программы (шаг for): недостижимый шаг цикла, тело которого
+       всегда завершается return или break, - не ошибка, и такой блок не считается мертвым кодом
+    """
+
+    __slots__ = ('index', 'stmts', 'events', 'succs', 'preds', 'visible')
+
+    def __init__(self, index: int) -> None:
+        self.index = index
+        self.stmts: List[AstNode] = []
+        self.events: List[Event] = []
+        self.succs: List[int] = []
+        self.preds: List[int] = []
+        self.visible = True
+
+
+class ControlFlowGraph:
+    """CFG метода func: блоки blocks (blocks[0] - вход, exit - общий выход), переменные по номеру
+       variables и определения definitions (номер переменной, узел, записывается ли значение)
+    """
+
+    def __init__(self, func: FuncNode) -> None:
+        self.func = func
+        self.blocks: List[Block] = []
+        self.entry = self.new_block()
+        self.exit = self.new_block()
+        self.variables: Dict[int, IdentDesc] = {}
+        self.definitions: List[Tuple[int, IdentNode, bool]] = []
+        # узлы объявлений локальных переменных по номеру переменной
+        self.declarations: Dict[int, IdentNode] = {}
+
+    def new_block(self, *preds: Block) -> Block:
+        block = Block(len(self.blocks))
+        self.blocks.append(block)
+        for pred in preds:
+            self.edge(pred, block)
+        return block
+
+    @staticmethod
+    def edge(source: Block, target: Block) -> None:
+        source.succs.append(target.index)
+        target.preds.append(source.index)
+
+    def reverse_postorder(self) -> List[int]:
+        """Номера достижимых из входа блоков в обратном постпорядке (без рекурсии)
+        """
+        blocks = self.blocks
+        visited = bytearray(len(blocks))
+        visited[0] = 1
+        order = []
+        stack = [(0, 0)]
+        while stack:
+            index, i = stack[-1]
+            succs = blocks[index].succs
+            if i < len(succs):
+                stack[-1] = index, i + 1
+                succ = succs[i]
+                if not visited[succ]:
+                    visited[succ] = 1
+                    stack.append((succ, 0))
+            else:
+                stack.pop()
+                order.append(index)
+        order.reverse()
+        return order
+
+    def variable_definitions(self) -> Dict[int, int]:
+        """Множество определений каждой переменной
+        """
+        masks: Dict[int, int] = {}
+        for i, (var, _, _) in enumerate(self.definitions):
+            masks[var] = masks.get(var, 0) | 1 << i
+        return masks
+
+    def reaching_definitions(self, order: Optional[List[int]] = None) -> Tuple[List[int], List[int]]:
+        """Достигающие определения: множества на входе и выходе каждого блока (у недостижимых - 0)
+        """
+        if order is None:
+            order = self.reverse_postorder()
+        blocks = self.blocks
+        masks = self.variable_definitions()
+        gen, kill = [], []
+        for block in blocks:
+            g = k = 0
+            for kind, var, definition, _ in block.events:
+                if kind == DEF:
+                    mask = masks[var]
+                    g = g & ~mask | 1 << definition
+                    k |= mask
+            gen.append(g)
+            kill.append(k)
+        ins, outs = [0] * len(blocks), [0] * len(blocks)
+        changed = True
+        while changed:
+            changed = False
+            for index in order:
+                x = 0
+                for pred in blocks[index].preds:
+                    x |= outs[pred]
+                ins[index] = x
+                out = gen[index] | x & ~kill[index]
+                if out != outs[index]:
+                    outs[index] = out
+                    changed = True
+        return ins, outs
+
+    def liveness(self, order: Optional[List[int]] = None) -> Tuple[List[int], List[int]]:
+        """Живые переменные: множества на входе и выходе каждого блока (у недостижимых - 0)
+        """
+        if order is None:
+            order = self.reverse_postorder()
+        blocks = self.blocks
+        uses, defs = [], []
+        for block in blocks:
+            u = d = 0
+            for kind, var, _, _ in reversed(block.events):
+                bit = 1 << var
+                if kind == DEF:
+                    u &= ~bit
+                    d |= bit
+                else:
+                    u |= bit
+            uses.append(u)
+            defs.append(d)
+        ins, outs = [0] * len(blocks), [0] * len(blocks)
+        postorder = order[::-1]
+        changed = True
+        while changed:
+            changed = False
+            for index in postorder:
+                x = 0
+                for succ in blocks[index].succs:
+                    x |= ins[succ]
+                outs[index] = x
+                live = uses[index] | x & ~defs[index]
+                if live != ins[index]:
+                    ins[index] = live
+                    changed = True
+        return ins, outs
+
+
+class _CfgBuilder(_Dispatcher):
+    """Построение CFG без рекурсии: в стеке обхода лежат инструкции и действия (закрыть ветку
+       if, перейти к шагу цикла и т.п.), как в SemanticAnalyzer
+    """
+
+    def __init__(self, cfg: ControlFlowGraph) -> None:
+        self.cfg = cfg
+        self.current = cfg.entry
+        # блоки continue и break объемлющих циклов
+        self.loops: List[Tuple[Block, Block]] = []
+        self._stack: List[Union[AstNode, Callable[[], None]]] = []
+
+    def build(self) -> ControlFlowGraph:
+        cfg = self.cfg
+        for param in cfg.func.params:
+            self._define(param.name, True)
+        stack = self._stack
+        self.then(*cfg.func.body.exprs)
+        handler = self._handler
+        while stack:
+            item = stack.pop()
+            if isinstance(item, AstNode):
+                handler('stmt_', type(item))(self, item)
+            else:
+                item()
+        cfg.edge(self.current, cfg.exit)
+        return cfg
+
+    def then(self, *items: Union[AstNode, Callable[[], None]]) -> None:
+        self._stack.extend(reversed(items))
+
+    @staticmethod
+    def _stmts(node: Optional[AstNode]) -> Sequence[AstNode]:
+        if node is None:
+            return ()
+        return node.exprs if isinstance(node, (StmtListNode, FuncStmtListNode)) else (node,)
+
+    # события
+
+    @staticmethod
+    def _local(name_node: AstNode) -> Optional[IdentDesc]:
+        if not isinstance(name_node, IdentNode):
+            return None
+        ident = name_node.node_ident
+        if ident is None or ident.scope not in (ScopeType.PARAM, ScopeType.LOCAL):
+            return None
+        return ident
+
+    def _define(self, name_node: IdentNode, assigned: bool) -> None:
+        ident = self._local(name_node)
+        if ident is None:
+            return
+        cfg = self.cfg
+        cfg.variables[ident.index] = ident
+        cfg.definitions.append((ident.index, name_node, assigned))
+        self.current.events.append((DEF, ident.index, len(cfg.definitions) - 1, name_node))
+
+    def _expr(self, root: Optional[AstNode]) -> None:
+        """События выражения root в порядке вычисления
+        """
+        if root is None:
+            return
+        events = self.current.events
+        stack: List[Tuple[AstNode, bool]] = [(root, False)]
+        while stack:
+            node, ready = stack.pop()
+            if ready:
+                self._define(node.var, True)
+                continue
+            if isinstance(node, IdentNode):
+                ident = self._local(node)
+                if ident is not None:
+                    self.cfg.variables[ident.index] = ident
+                    events.append((USE, ident.index, -1, node))
+            elif isinstance(node, AssignNode):
+                # значение вычисляется до записи переменной
+                stack.append((node, True))
+                stack.append((node.val, False))
+                if self._local(node.var) is None:
+                    stack.append((node.var, False))
+            elif isinstance(node, OpAssignNode):
+                # a += b: сначала читается a, затем вычисляется b, затем a записывается
+                stack.append((node, True))
+                stack.append((node.val, False))
+                stack.append((node.var, False))
+            elif not isinstance(node, (FuncNode, ClassInitNode)):
+                childs = child_nodes(node)
+                childs.reverse()
+                stack.extend((child, False) for child in childs)
+
+    # инструкции
+
+    def stmt_AstNode(self, node: AstNode) -> None:
+        self.current.stmts.append(node)
+        self._expr(node)
+
+    def stmt_FuncNode(self, node: AstNode) -> None:
+        # локальные методы и классы анализируются отдельно
+        self.current.stmts.append(node)
+
+    stmt_ClassInitNode = stmt_FuncNode
+
+    def stmt_StmtListNode(self, node: Union[StmtListNode, FuncStmtListNode]) -> None:
+        self.then(*node.exprs)
+
+    stmt_FuncStmtListNode = stmt_StmtListNode
+
+    def stmt_VarsNode(self, node: VarsNode) -> None:
+        self.current.stmts.append(node)
+        for var in node.vars:
+            name = var.var if isinstance(var, AssignNode) else var
+            # переменная видна уже в своем инициализаторе, но значения у нее еще нет
+            self._define(name, False)
+            if isinstance(var, AssignNode):
+                self._expr(var.val)
+                self._define(name, True)
+            ident = self._local(name)
+            if ident is not None:
+                self.cfg.declarations.setdefault(ident.index, name)
+
+    def stmt_ReturnNode(self, node: ReturnNode) -> None:
+        self.current.stmts.append(node)
+        self._expr(node.val)
+        self._jump(self.cfg.exit)
+
+    def stmt_IdentNode(self, node: IdentNode) -> None:
+        if node.name in ('break', 'continue') and self.loops:
+            self.current.stmts.append(node)
+            self._jump(self.loops[-1][node.name == 'break'])
+        else:
+            self.stmt_AstNode(node)
+
+    def _jump(self, target: Block) -> None:
+        # код после перехода начинается в блоке без предшественников
+        self.cfg.edge(self.current, target)
+        self.current = self.cfg.new_block()
+
+    def stmt_IfNode(self, node: IfNode) -> None:
+        cfg = self.cfg
+        self.current.stmts.append(node)
+        self._expr(node.cond)
+        cond = self.current
+        self.current = cfg.new_block(cond)
+
+        def then_done() -> None:
+            then_end = self.current
+            if node.else_stmt is None:
+                self.current = cfg.new_block(cond, then_end)
+                return
+            self.current = cfg.new_block(cond)
+
+            def else_done() -> None:
+                self.current = cfg.new_block(then_end, self.current)
+
+            self.then(*self._stmts(node.else_stmt), else_done)
+
+        self.then(*self._stmts(node.then_stmt), then_done)
+
+    def stmt_ForNode(self, node: ForNode) -> None:
+        cfg = self.cfg
+        self.current.stmts.append(node)
+
+        def head() -> None:
+            header = self.current = cfg.new_block(self.current)
+            cond = node.cond
+            no_cond = isinstance(cond, StmtListNode) and not cond.exprs
+            if not no_cond:
+                self._expr(cond)
+            constant = cond.value if isinstance(cond, LiteralNode) and isinstance(cond.value, bool) else None
+            exit_block = cfg.new_block() if no_cond or constant is True else cfg.new_block(header)
+            step = cfg.new_block()
+            step.visible = False
+            body = cfg.new_block() if constant is False else cfg.new_block(header)
+            self.loops.append((step, exit_block))
+            self.current = body
+
+            def body_done() -> None:
+                self.loops.pop()
+                cfg.edge(self.current, step)
+                self.current = step
+
+            def step_done() -> None:
+                cfg.edge(self.current, header)
+                self.current = exit_block
+
+            self.then(*self._stmts(node.body), body_done, *self._stmts(node.step), step_done)
+
+        self.then(*self._stmts(node.init), head)
+
+
+def build_cfg(node: FuncNode) -> ControlFlowGraph:
+    """CFG метода node (дерево должно быть размечено семантическим анализом)
+    """
+    return _CfgBuilder(ControlFlowGraph(node)).build()
+
+
+def lint_func(node: FuncNode, cfg: Optional[ControlFlowGraph] = None) -> List[LintWarning]:
+    """Проверки метода: недостижимый код, чтение переменной, которой может быть не присвоено
+       значение, неиспользуемые переменные и присваивания, значение которых не читается
+       (cfg - уже построенный CFG метода, если есть)
+    """
+    if node.body is None:
+        return []
+    if cfg is None:
+        cfg = build_cfg(node)
+    blocks = cfg.blocks
+    order = cfg.reverse_postorder()
+    reachable = bytearray(len(blocks))
+    for index in order:
+        reachable[index] = 1
+    warnings = []
+
+    # недостижимый код: одно предупреждение на участок, в порядке создания блоков (порядке текста)
+    covered = bytearray(len(blocks))
+    for block in blocks:
+        if reachable[block.index] or covered[block.index] or not block.stmts or not block.visible:
+            continue
+        warnings.append(LintWarning('Unreachable statement', block.stmts[0]))
+        stack = [block.index]
+        while stack:
+            for succ in blocks[stack.pop()].succs:
+                if not reachable[succ] and not covered[succ]:
+                    covered[succ] = 1
+                    stack.append(succ)
+
+    used = 0
+    for block in blocks:
+        for kind, var, _, _ in block.events:
+            if kind == USE:
+                used |= 1 << var
+    for var, name_node in cfg.declarations.items():
+        if not used >> var & 1:
+            warnings.append(LintWarning("Variable '{}' is never used".format(name_node.name), name_node))
+
+    # чтение до присваивания: до чтения доходит "неопределенное" определение переменной
+    masks = cfg.variable_definitions()
+    undefined: Dict[int, int] = {}
+    for i, (var, _, assigned) in enumerate(cfg.definitions):
+        if not assigned:
+            undefined[var] = undefined.get(var, 0) | 1 << i
+    reaching, _ = cfg.reaching_definitions(order)
+    for index in order:
+        defs = reaching[index]
+        for kind, var, definition, name_node in blocks[index].events:
+            if kind == DEF:
+                defs = defs & ~masks[var] | 1 << definition
+            elif defs & undefined.get(var, 0):
+                warnings.append(LintWarning(
+                    "Variable '{}' might not have been initialized".format(name_node.name), name_node))
+
+    # присваивание, после которого значение не читается (для переменных, которые где-то читаются);
+    # значение параметра задает вызывающий, поэтому перезапись параметра до чтения не ошибка
+    params = {id(param.name) for param in node.params}
+    _, live_out = cfg.liveness(order)
+    for index in order:
+        live = live_out[index]
+        dead = []
+        for kind, var, definition, name_node in reversed(blocks[index].events):
+            bit = 1 << var
+            if kind == USE:
+                live |= bit
+                continue
+            if not live & bit and used & bit and cfg.definitions[definition][2] and id(name_node) not in params:
+                dead.append(LintWarning("Value assigned to '{}' is never used".format(name_node.name), name_node))
+            live &= ~bit
+        warnings.extend(reversed(dead))
+
+    warnings.sort(key=lambda w: getattr(w.node, 'loc', None) or 0)
+    return warnings
+
+
+def lint(tree: AstNode) -> List[LintWarning]:
+    """Проверки всех методов дерева
+    """
+    warnings = []
+    for node in walk(tree):
+        if isinstance(node, FuncNode) and node.body is not None:
+            warnings.extend(lint_func(node))
+    return warnings
@@ -0,0 +1,542 @@
+"""Быстрый движок разбора: лексер за один проход + рекурсивный спуск по лексемам.
+
+   Строит те же узлы AST, что и грамматика pyparsing из my_parser (порядок альтернатив
+   и возвраты повторяют грамматику), но работает со списком лексем, а не с символами.
+   В отличие от pyparsing лексемы всегда выделяются целиком (например, trueValue - это
+   идентификатор, а не литерал true и идентификатор Value), а позиция узла - это всегда
+   позиция его первой лексемы (pyparsing иногда дает позицию пробелов перед ней).
+   Синтаксическая ошибка сообщается в самом дальнем месте, до которого дошел разбор; pyparsing
+   (кроме ошибок в литералах) сообщает о ней в начале инструкции верхнего уровня, которую
+   не удалось разобрать.
+
+   В режиме outline тела функций не разбираются: парсер только находит парную закрывающую
+   скобку, а тело разбирается при первом обращении к FuncNode.body (синтаксические ошибки
+   в теле тоже обнаруживаются только тогда)
+"""
+from functools import partial
+from typing import Dict, List, Optional, Callable, Tuple, Union
+
+from .ast import *
+from .ast import current_positions
+from .positions import LineIndex
+from .lexer import tokenize, TokenStream, ParseError, KEYWORDS, IDENT, NUM, STR, OP, EOF
+
+ACCESS_KEYS = frozenset(('public', 'protected', 'private'))
+
+# операции выражений, из которых BinOpChain строит узлы: бинарные операции ('.' разбирается
+# отдельно, в dot) и составные присваивания
+EXPR_OPS = frozenset(op.value for op in BIN_OP_PRECEDENCE if op is not BinOp.DOT) | frozenset(OP_ASSIGN_OPS)
+
+# классы лексем для таблиц выбора альтернатив: слова, которые что-то значат в начале правил,
+# различаются по тексту, операции - по тексту, остальные лексемы - по виду
+_WORD_CLASSES = dict({word: word for word in KEYWORDS}, new='new', true='bool', false='bool',
+                     **{word: 'access' for word in ACCESS_KEYS})
+_KIND_CLASSES = {IDENT: 'ident', NUM: 'literal', STR: 'literal', EOF: 'eof'}
+# классы лексем, которые принимает ident() (ключевыми словами считаются только KEYWORDS)
+NAME_CLASSES = frozenset(('ident', 'new', 'bool', 'access'))
+
+
+class Choice:
+    """Упорядоченный выбор альтернатив alts - пар (first, rule), где first(c0, c1) говорит, может ли
+       rule начинаться с лексем классов c0, c1. Для каждой пары классов список подходящих
+       альтернатив вычисляется один раз и запоминается в table
+    """
+
+    __slots__ = ('name', 'alts', 'table')
+
+    def __init__(self, name: str, *alts: Tuple[Callable[[str, str], bool], Callable[['Parser'], AstNode]]) -> None:
+        self.name = name
+        self.alts = alts
+        self.table: Dict[Tuple[str, str], Tuple[Callable[['Parser'], AstNode], ...]] = {}
+
+    def candidates(self, c0: str, c1: str) -> Tuple[Callable[['Parser'], AstNode], ...]:
+        rules = tuple(rule for first, rule in self.alts if first(c0, c1))
+        self.table[c0, c1] = rules
+        return rules
+
+
+class Parser:
+    """Парсер методом рекурсивного спуска, по методу на правило грамматики. Вместо текста можно
+       передать готовый TokenStream (тогда pos и end не используются)
+    """
+
+    def __init__(self, prog: Union[str, TokenStream], pos: int = 0, end: Optional[int] = None,
+                 outline: bool = False) -> None:
+        tokens = prog if isinstance(prog, TokenStream) else tokenize(prog, pos, end)
+        self.prog = tokens.prog
+        self.outline = outline
+        self.kinds, self.values, self.locs = tokens.kinds, tokens.values, tokens.locs
+        self.pos = 0
+        self.error_loc = -1
+        self.error_msg = ''
+
+    def error(self, expected: str) -> ParseError:
+        loc = self.locs[self.pos]
+        if loc > self.error_loc:
+            self.error_loc, self.error_msg = loc, 'Expected {}, found {!r}'.format(
+                expected, self.values[self.pos] or 'end of text')
+        return ParseError('Expected ' + expected, loc)
+
+    def expect(self, value: str) -> None:
+        if self.values[self.pos] != value or self.kinds[self.pos] != OP:
+            raise self.error(repr(value))
+        self.pos += 1
+
+    def is_keyword(self, value: str) -> bool:
+        return self.kinds[self.pos] == IDENT and self.values[self.pos] == value
+
+    def keyword(self, value: str) -> None:
+        if not self.is_keyword(value):
+            raise self.error(value)
+        self.pos += 1
+
+    def is_op(self, value: str, offset: int = 0) -> bool:
+        return self.kinds[self.pos + offset] == OP and self.values[self.pos + offset] == value
+
+    def first_of(self, *alts: Callable[[], AstNode]) -> AstNode:
+        """Упорядоченный выбор с возвратом (аналог | в pyparsing)
+        """
+        start = self.pos
+        for alt in alts[:-1]:
+            try:
+                return alt()
+            except ParseError:
+                self.pos = start
+        return alts[-1]()
+
+    def choose(self, choice: 'Choice') -> AstNode:
+        """Упорядоченный выбор с возвратом, как first_of, но пробуются только альтернативы,
+           которые могут начинаться с двух текущих лексем
+        """
+        kinds, values, start = self.kinds, self.values, self.pos
+        value = values[start]
+        c0 = _WORD_CLASSES.get(value) or _KIND_CLASSES.get(kinds[start], value)
+        if c0 == 'eof':
+            c1 = c0
+        else:
+            value = values[start + 1]
+            c1 = _WORD_CLASSES.get(value) or _KIND_CLASSES.get(kinds[start + 1], value)
+        rules = choice.table.get((c0, c1))
+        if rules is None:
+            rules = choice.candidates(c0, c1)
+        if not rules:
+            raise self.error(choice.name)
+        for rule in rules[:-1]:
+            try:
+                return rule(self)
+            except ParseError:
+                self.pos = start
+        return rules[-1](self)
+
+    def optional(self, rule: Callable[[], AstNode]) -> Optional[AstNode]:
+        start = self.pos
+        try:
+            return rule()
+        except ParseError:
+            self.pos = start
+            return None
+
+    def many(self, rule: Callable[[], AstNode], sep: Optional[str] = None) -> List[AstNode]:
+        """Последовательность из нуля и более элементов (через разделитель sep, если задан)
+        """
+        items = []
+        while True:
+            start = self.pos
+            try:
+                if sep is not None and items:
+                    self.expect(sep)
+                items.append(rule())
+            except ParseError:
+                self.pos = start
+                return items
+
+    # лексические правила
+
+    def ident(self) -> IdentNode:
+        if self.kinds[self.pos] != IDENT or self.values[self.pos] in KEYWORDS:
+            raise self.error('ident')
+        node = IdentNode(self.values[self.pos], loc=self.locs[self.pos])
+        self.pos += 1
+        return node
+
+    def type_(self) -> TypeNode:
+        if self.kinds[self.pos] != IDENT or self.values[self.pos] in KEYWORDS:
+            raise self.error('type')
+        node = TypeNode(self.values[self.pos], loc=self.locs[self.pos])
+        self.pos += 1
+        if self.is_op('[') and self.is_op(']', 1):
+            self.pos += 2
+        return node
+
+    def access(self) -> Optional[AccessNode]:
+        if self.kinds[self.pos] == IDENT and self.values[self.pos] in ACCESS_KEYS:
+            node = AccessNode(self.values[self.pos], loc=self.locs[self.pos])
+            self.pos += 1
+            return node
+        return None
+
+    def static(self) -> Optional[AccessNode]:
+        if self.is_keyword('static'):
+            node = AccessNode('static', loc=self.locs[self.pos])
+            self.pos += 1
+            return node
+        return None
+
+    def literal(self) -> LiteralNode:
+        pos, kind, value = self.pos, self.kinds[self.pos], self.values[self.pos]
+        if kind == NUM or kind == STR or kind == IDENT and value in ('true', 'false'):
+            node = self._literal_node(value, self.locs[pos])
+            self.pos += 1
+            return node
+        # знак числа входит в литерал, только если записан вплотную к нему
+        if kind == OP and value in ('+', '-') and self.kinds[pos + 1] == NUM \
+                and self.locs[pos + 1] == self.locs[pos] + 1:
+            node = self._literal_node(value + self.values[pos + 1], self.locs[pos])
+            self.pos += 2
+            return node
+        raise self.error('literal')
+
+    def _literal_node(self, literal: str, loc: int) -> LiteralNode:
+        try:
+            return LiteralNode(literal, loc=loc)
+        except ValueError as e:
+            # некорректный литерал (число вне диапазона и т.п.) - ошибка в этом месте, даже если
+            # другие альтернативы разбора уже дошли до него
+            if loc >= self.error_loc:
+                self.error_loc, self.error_msg = loc, str(e)
+            raise ParseError(str(e), loc) from None
+
+    # выражения
+
+    def call(self) -> CallNode:
+        loc = self.locs[self.pos]
+        func = self.ident()
+        self.expect('(')
+        params = self.many(self.expr, ',')
+        self.expect(')')
+        return CallNode(func, *params, loc=loc)
+
+    def new(self) -> NewNode:
+        loc = self.locs[self.pos]
+        self.keyword('new')
+        return NewNode(self.call(), loc=loc)
+
+    def dot_operand(self) -> ExprNode:
+        return self.choose(DOT_OPERAND)
+
+    def dot(self) -> ExprNode:
+        loc = self.locs[self.pos]
+        node = self.dot_operand()
+        while self.is_op('.'):
+            start = self.pos
+            self.pos += 1
+            try:
+                arg2 = self.dot_operand()
+            except ParseError:
+                self.pos = start
+                break
+            node = BinOpNode(BinOp.DOT, node, arg2, loc=loc)
+        return node
+
+    def paren_expr(self) -> ExprNode:
+        self.expect('(')
+        node = self.expr()
+        self.expect(')')
+        return node
+
+    def group(self) -> ExprNode:
+        return self.choose(GROUP)
+
+    def expr(self) -> ExprNode:
+        """Выражение operand (op operand)*: приоритеты операций учитываются в BinOpChain, а вложенные
+           выражения в скобках хранятся в явном стеке, поэтому рекурсии нет ни по длине цепочки
+           операций, ни по глубине скобок (возвраты - как у group/paren_expr)
+        """
+        kinds, values, locs = self.kinds, self.values, self.locs
+        # незавершенные внешние выражения: (цепочка, операция перед скобкой, позиция операции, позиция скобки)
+        stack = []
+        chain, op, op_start = None, None, 0
+        while True:
+            loc = locs[self.pos]
+            if kinds[self.pos] == OP and values[self.pos] == '(':
+                stack.append((chain, op, op_start, loc))
+                chain, op = None, None
+                self.pos += 1
+                continue
+            try:
+                operand, error = self.group(), None
+            except ParseError as e:
+                operand, error = None, e
+            while True:
+                if operand is not None:
+                    if chain is None:
+                        chain = BinOpChain(operand, loc)
+                    else:
+                        chain.push(op, operand, loc)
+                    op = values[self.pos]
+                    if kinds[self.pos] == OP and op in EXPR_OPS and chain.accepts(op):
+                        op_start = self.pos
+                        self.pos += 1
+                        break
+                    node = chain.result()
+                elif op is not None:
+                    # правый операнд не разобрался: цепочка заканчивается перед операцией
+                    self.pos = op_start
+                    node = chain.result()
+                elif stack:
+                    # не разобрался первый операнд выражения в скобках - значит, и сами скобки
+                    chain, op, op_start, loc = stack.pop()
+                    continue
+                else:
+                    raise error
+                if not stack:
+                    return node
+                if kinds[self.pos] == OP and values[self.pos] == ')':
+                    self.pos += 1
+                    operand = node
+                else:
+                    operand, error = None, self.error(repr(')'))
+                chain, op, op_start, loc = stack.pop()
+
+    # инструкции
+
+    def assign(self) -> AssignNode:
+        loc = self.locs[self.pos]
+        var = self.ident()
+        self.expect('=')
+        return AssignNode(var, self.expr(), loc=loc)
+
+    def var_inner(self) -> ExprNode:
+        return self.choose(VAR_INNER)
+
+    def vars_(self) -> VarsNode:
+        loc = self.locs[self.pos]
+        type_ = self.type_()
+        vars_ = self.many(self.var_inner, ',')
+        if not vars_:
+            raise self.error('ident')
+        return VarsNode(type_, *vars_, loc=loc)
+
+    def simple_stmt(self) -> ExprNode:
+        return self.choose(SIMPLE_STMT)
+
+    def param(self) -> ParamNode:
+        loc = self.locs[self.pos]
+        type_ = self.type_()
+        return ParamNode(type_, self.ident(), loc=loc)
+
+    def func(self) -> FuncNode:
+        loc = self.locs[self.pos]
+        access, static = self.access(), self.static()
+        type_ = self.type_()
+        name = self.ident()
+        self.expect('(')
+        params = self.many(self.param, ',')
+        self.expect(')')
+        if self.outline:
+            return FuncNode(access, static, type_, name, params, body_loader=self.skip_func_body(), loc=loc)
+        return FuncNode(access, static, type_, name, params, self.func_body(), loc=loc)
+
+    def class_init(self) -> ClassInitNode:
+        loc = self.locs[self.pos]
+        access = self.access()
+        self.keyword('class')
+        name = self.ident()
+        return ClassInitNode(access, name, self.body(), loc=loc)
+
+    def return_(self) -> ReturnNode:
+        loc = self.locs[self.pos]
+        self.keyword('return')
+        return ReturnNode(self.expr(), loc=loc)
+
+    def if_(self) -> IfNode:
+        loc = self.locs[self.pos]
+        self.keyword('if')
+        self.expect('(')
+        items = [self.expr()]
+        self.expect(')')
+        items.append(self.func_body())
+        while self.is_keyword('else') and self.kinds[self.pos + 1] == IDENT and self.values[self.pos + 1] == 'if':
+            start = self.pos
+            self.pos += 2
+            try:
+                items.append(self.func_body())
+            except ParseError:
+                self.pos = start
+                break
+        if self.is_keyword('else'):
+            start = self.pos
+            self.pos += 1
+            try:
+                items.append(self.func_body())
+            except ParseError:
+                self.pos = start
+        return IfNode(*items, loc=loc)
+
+    def for_stmt_list(self) -> StmtNode:
+        return self.first_of(self.vars_, self.simple_stmt_list)
+
+    def simple_stmt_list(self) -> StmtListNode:
+        loc = self.locs[self.pos]
+        return StmtListNode(*self.many(self.simple_stmt, ','), loc=loc)
+
+    def for_cond(self) -> ExprNode:
+        loc = self.locs[self.pos]
+        node = self.optional(self.expr)
+        return node if node is not None else StmtListNode(loc=loc)
+
+    def for_(self) -> ForNode:
+        loc = self.locs[self.pos]
+        self.keyword('for')
+        self.expect('(')
+        init = self.for_stmt_list()
+        self.expect(';')
+        cond = self.for_cond()
+        self.expect(';')
+        step = self.for_stmt_list()
+        self.expect(')')
+        return ForNode(init, cond, step, self.func_body(), loc=loc)
+
+    def stmt(self) -> StmtNode:
+        return self.choose(STMT)
+
+    def func_class_init(self) -> List[AstNode]:
+        # в грамматике для вложенного класса нет узла, поэтому имя и тело попадают в список как есть
+        self.keyword('class')
+        name = self.ident()
+        return [name, self.body()]
+
+    def func_stmt(self) -> List[AstNode]:
+        if self.is_keyword('class'):
+            start = self.pos
+            try:
+                return self.func_class_init()
+            except ParseError:
+                self.pos = start
+        return [self.choose(FUNC_STMT)]
+
+    def stmt_list(self) -> StmtListNode:
+        loc = self.locs[self.pos]
+        return StmtListNode(*self.many(self.stmt), loc=loc)
+
+    def func_stmt_list(self) -> FuncStmtListNode:
+        loc = self.locs[self.pos]
+        exprs = []
+        for stmts in self.many(self.func_stmt):
+            exprs.extend(stmts)
+        return FuncStmtListNode(*exprs, loc=loc)
+
+    def body(self) -> StmtListNode:
+        self.expect('{')
+        node = self.stmt_list()
+        self.expect('}')
+        return node
+
+    def func_body(self) -> FuncStmtListNode:
+        self.expect('{')
+        node = self.func_stmt_list()
+        self.expect('}')
+        return node
+
+    def skip_func_body(self) -> Callable[[], FuncStmtListNode]:
+        """Пропуск тела функции до парной фигурной скобки; возвращает функцию, которая разберет его
+        """
+        self.expect('{')
+        kinds, values = self.kinds, self.values
+        pos = self.pos
+        depth = 1
+        while depth:
+            kind = kinds[pos]
+            if kind == OP:
+                value = values[pos]
+                if value == '{':
+                    depth += 1
+                elif value == '}':
+                    depth -= 1
+            elif kind == EOF:
+                self.pos = pos
+                raise self.error(repr('}'))
+            pos += 1
+        start, self.pos = self.pos, pos
+        return partial(parse_func_body, self.prog, self.locs[start], self.locs[pos - 1], current_positions.get())
+
+    def parse_all(self, rule: Callable[[], AstNode]) -> AstNode:
+        """Разбор всего текста правилом rule (после него должен быть конец текста)
+        """
+        node = rule()
+        if self.kinds[self.pos] != EOF:
+            self.error('end of text')
+            raise ParseError(self.error_msg, self.error_loc)
+        return node
+
+    def program(self) -> StmtListNode:
+        return self.parse_all(self.stmt_list)
+
+
+def with_semi(rule: Callable[[Parser], AstNode]) -> Callable[[Parser], AstNode]:
+    def rule_semi(parser: Parser) -> AstNode:
+        node = rule(parser)
+        parser.expect(';')
+        return node
+
+    return rule_semi
+
+
+# множества FIRST альтернатив: по классам первых двух лексем (c0, c1)
+
+def starts_with(*classes: str) -> Callable[[str, str], bool]:
+    return lambda c0, c1: c0 in classes
+
+
+def name_then(*classes: str) -> Callable[[str, str], bool]:
+    return lambda c0, c1: c0 in NAME_CLASSES and c1 in classes
+
+
+def first_decl(c0: str, c1: str) -> bool:
+    # тип, затем имя или []
+    return c0 in NAME_CLASSES and (c1 in NAME_CLASSES or c1 == '[')
+
+
+def first_literal(c0: str, c1: str) -> bool:
+    return c0 == 'literal' or c0 == 'bool' or c0 in ('+', '-') and c1 == 'literal'
+
+
+def first_expr(c0: str, c1: str) -> bool:
+    return c0 in NAME_CLASSES or c0 == '(' or first_literal(c0, c1)
+
+
+def first_class_init(c0: str, c1: str) -> bool:
+    return c0 == 'class' or c0 == 'access' and c1 == 'class'
+
+
+first_name = starts_with(*NAME_CLASSES)
+
+DOT_OPERAND = Choice('ident', (starts_with('new'), Parser.new), (name_then('('), Parser.call), (first_name, Parser.ident))
+GROUP = Choice('expression', (first_literal, Parser.literal), (first_name, Parser.dot),
+               (starts_with('('), Parser.paren_expr))
+VAR_INNER = Choice('ident', (name_then('='), Parser.assign), (first_name, Parser.ident))
+SIMPLE_STMT = Choice('expression', (starts_with('new'), Parser.new), (name_then('='), Parser.assign),
+                     (name_then('('), Parser.call), (first_expr, Parser.expr))
+STMT = Choice('statement', (first_class_init, Parser.class_init), (first_decl, Parser.func),
+              (first_decl, with_semi(Parser.vars_)), (starts_with('{'), Parser.func_body),
+              (first_expr, with_semi(Parser.simple_stmt)))
+FUNC_STMT = Choice('statement', (first_decl, with_semi(Parser.vars_)), (name_then('('), with_semi(Parser.call)),
+                   (starts_with('new'), with_semi(Parser.new)), (first_expr, with_semi(Parser.expr)),
+                   (starts_with('{'), Parser.body), (name_then('='), with_semi(Parser.assign)),
+                   (starts_with('return'), with_semi(Parser.return_)), (starts_with('if'), Parser.if_),
+                   (starts_with('for'), Parser.for_))
+
+
+def parse(prog: Union[str, TokenStream], outline: bool = False) -> StmtListNode:
+    return Parser(prog, outline=outline).program()
+
+
+def parse_func_body(prog: str, start: int, end: int, positions: Optional[LineIndex]) -> FuncStmtListNode:
+    """Разбор тела функции между фигурными скобками (текст prog[start:end]) - для режима outline
+    """
+    token = current_positions.set(positions)
+    try:
+        parser = Parser(prog, start, end)
+        return parser.parse_all(parser.func_stmt_list)
+    finally:
+        current_positions.reset(token)
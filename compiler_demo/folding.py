@@ -0,0 +1,302 @@
+"""Свертка констант и алгебраические упрощения в выражениях BinOpNode (дерево меняется на месте).
+
+   Операции над литералами вычисляются по правилам Java: int и long переполняются по модулю
+   2**32 и 2**64, целочисленное деление округляет к нулю, остаток имеет знак делимого, char
+   участвует в арифметике кодом символа, float округляется до 32 бит после каждой операции;
+   строка сцепляется со строкой, целым, символом и логическим значением. Не сворачиваются
+   выражения, которые в Java бросают исключение (целочисленное деление на ноль), дают значение,
+   которое нельзя записать литералом (бесконечность, NaN), или зависят от ссылок (== строк).
+
+   Логические тождества (true && x -> x, false && x -> false, x || false -> x, ...) применяются
+   всегда. Арифметические (x + 0, x - 0, x * 1, x / 1 и перестановка (x + 1) + 2 -> x + 3) -
+   только если тип x известен (node_type после семантического анализа) и тождество для него
+   точное: для строк и char они меняют результат или его тип, для вещественных x + 0 неверно
+   при x = -0.0. Выражения, которые вычисляются (вызовы и т.п.), никогда не отбрасываются
+"""
+import math
+import struct
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from . import my_parser
+from .ast import *
+from .literals import decode_literal, LiteralValue
+from .semantic import BaseType
+from .visitor import NodeTransformer, walk
+
+_INTEGRAL_BITS: Dict[BaseType, int] = {BaseType.INT: 32, BaseType.LONG: 64}
+# ранги числовых типов для двуместного числового расширения
+_NUMERIC_RANKS: Dict[BaseType, int] = {BaseType.CHAR: 0, BaseType.INT: 1, BaseType.LONG: 2,
+                                       BaseType.FLOAT: 3, BaseType.DOUBLE: 4}
+_COMPARISONS = {
+    BinOp.GT: lambda a, b: a > b,
+    BinOp.LT: lambda a, b: a < b,
+    BinOp.GE: lambda a, b: a >= b,
+    BinOp.LE: lambda a, b: a <= b,
+    BinOp.EQUALS: lambda a, b: a == b,
+    BinOp.NEQUALS: lambda a, b: a != b,
+}
+_JAVA_ESCAPES = {'\b': '\\b', '\t': '\\t', '\n': '\\n', '\f': '\\f', '\r': '\\r', '"': '\\"', '\\': '\\\\'}
+_FLOAT32 = struct.Struct('f')
+
+
+class FoldStats(NamedTuple):
+    """Результат свертки: число узлов дерева до и после и число замененных выражений
+    """
+    nodes_before: int
+    nodes_after: int
+    folded: int
+
+    @property
+    def reduction(self) -> float:
+        return 1 - self.nodes_after / self.nodes_before if self.nodes_before else 0.0
+
+    def __str__(self) -> str:
+        return '{} -> {} nodes (-{:.1%}), {} expressions folded'.format(
+            self.nodes_before, self.nodes_after, self.reduction, self.folded)
+
+
+def _wrap(value: int, bits: int) -> int:
+    half = 1 << (bits - 1)
+    return (value + half) % (1 << bits) - half
+
+
+def _int_div(a: int, b: int) -> int:
+    q = abs(a) // abs(b)
+    return q if (a < 0) == (b < 0) else -q
+
+
+def _string_of(value: LiteralValue, base_type: BaseType) -> Optional[str]:
+    """Строковое представление значения при сцеплении со строкой (None - не свертывается:
+       вещественные числа Java выводит не так, как Python)
+    """
+    if base_type is BaseType.BOOL:
+        return 'true' if value else 'false'
+    if base_type in (BaseType.STR, BaseType.CHAR):
+        return value
+    if base_type in _INTEGRAL_BITS:
+        return str(value)
+    return None
+
+
+def _literal_text(value: LiteralValue, base_type: BaseType) -> Optional[str]:
+    """Текст литерала Java с данным значением и типом (None, если такого литерала нет)
+    """
+    if base_type is BaseType.BOOL:
+        text = 'true' if value else 'false'
+    elif base_type is BaseType.STR:
+        text = '"{}"'.format(''.join(_JAVA_ESCAPES.get(c) or (c if c >= ' ' else '\\u{:04x}'.format(ord(c)))
+                                     for c in value))
+    elif base_type is BaseType.INT:
+        text = str(value)
+    elif base_type is BaseType.LONG:
+        text = '{}L'.format(value)
+    elif base_type in (BaseType.FLOAT, BaseType.DOUBLE):
+        if not math.isfinite(value):
+            return None
+        text = repr(value) + ('f' if base_type is BaseType.FLOAT else '')
+    else:
+        return None
+    # текст должен разбираться обратно в то же значение того же типа
+    try:
+        decoded, decoded_type = decode_literal(text)
+    except ValueError:
+        return None
+    if decoded_type is not base_type or decoded != value or (base_type in (BaseType.FLOAT, BaseType.DOUBLE)
+                                                                and math.copysign(1, decoded) != math.copysign(1, value)):
+        return None
+    return text
+
+
+def _arithmetic(op: BinOp, a: LiteralValue, a_type: BaseType,
+                b: LiteralValue, b_type: BaseType) -> Optional[tuple]:
+    """Значение и тип a op b для числовых операндов (None - не свертывается)
+    """
+    rank = max(_NUMERIC_RANKS[a_type], _NUMERIC_RANKS[b_type], _NUMERIC_RANKS[BaseType.INT])
+    result_type = next(t for t, r in _NUMERIC_RANKS.items() if r == rank)
+    if a_type is BaseType.CHAR:
+        a = ord(a)
+    if b_type is BaseType.CHAR:
+        b = ord(b)
+    if op in _COMPARISONS:
+        return _COMPARISONS[op](a, b), BaseType.BOOL
+    bits = _INTEGRAL_BITS.get(result_type)
+    if bits is not None:
+        if op is BinOp.ADD:
+            value = a + b
+        elif op is BinOp.SUB:
+            value = a - b
+        elif op is BinOp.MUL:
+            value = a * b
+        elif b == 0:
+            return None  # ArithmeticException
+        elif op is BinOp.DIV:
+            value = _int_div(a, b)
+        else:
+            value = a - b * _int_div(a, b)
+        return _wrap(value, bits), result_type
+    a, b = float(a), float(b)
+    if op is BinOp.ADD:
+        value = a + b
+    elif op is BinOp.SUB:
+        value = a - b
+    elif op is BinOp.MUL:
+        value = a * b
+    elif b == 0:
+        return None  # бесконечность или NaN
+    elif op is BinOp.DIV:
+        value = a / b
+    else:
+        value = math.fmod(a, b)
+    if result_type is BaseType.FLOAT:
+        try:
+            value = _FLOAT32.unpack(_FLOAT32.pack(value))[0]
+        except OverflowError:
+            return None
+    return value, result_type
+
+
+def fold_values(op: BinOp, a: LiteralValue, a_type: BaseType,
+                b: LiteralValue, b_type: BaseType) -> Optional[tuple]:
+    """Значение и тип (BaseType) выражения a op b над значениями литералов по правилам Java
+       или None, если выражение не свертывается
+    """
+    if op is BinOp.LOGICAL_AND or op is BinOp.LOGICAL_OR:
+        if a_type is BaseType.BOOL and b_type is BaseType.BOOL:
+            return (a and b if op is BinOp.LOGICAL_AND else a or b), BaseType.BOOL
+        return None
+    if op is BinOp.ADD and (a_type is BaseType.STR or b_type is BaseType.STR):
+        a_str, b_str = _string_of(a, a_type), _string_of(b, b_type)
+        if a_str is None or b_str is None:
+            return None
+        return a_str + b_str, BaseType.STR
+    if a_type in _NUMERIC_RANKS and b_type in _NUMERIC_RANKS:
+        return _arithmetic(op, a, a_type, b, b_type)
+    if a_type is BaseType.BOOL and b_type is BaseType.BOOL and op in (BinOp.EQUALS, BinOp.NEQUALS):
+        return _COMPARISONS[op](a, b), BaseType.BOOL
+    return None
+
+
+class ConstantFolder(NodeTransformer):
+    """Свертка констант (см. описание модуля); folded - число замененных выражений
+    """
+
+    def __init__(self) -> None:
+        self.folded = 0
+
+    def fold(self, root: AstNode) -> AstNode:
+        """Свертка в дереве root (на месте); возвращает корень (он сам заменяется, только если
+           это свертываемое выражение)
+        """
+        return self.transform(root)
+
+    def visit_BinOpNode(self, node: BinOpNode) -> ExprNode:
+        if node.op is BinOp.DOT:
+            return node
+        result = self._fold(node, node.arg1, node.arg2)
+        if result is None:
+            result = self._simplify(node)
+        if result is not node:
+            self.folded += 1
+        return result
+
+    @staticmethod
+    def _fold(node: BinOpNode, arg1: ExprNode, arg2: ExprNode) -> Optional[LiteralNode]:
+        """Литерал со значением arg1 node.op arg2 на месте узла node или None
+        """
+        if not isinstance(arg1, LiteralNode) or not isinstance(arg2, LiteralNode):
+            return None
+        result = fold_values(node.op, arg1.value, arg1.type.base_type, arg2.value, arg2.type.base_type)
+        text = _literal_text(*result) if result is not None else None
+        if text is None:
+            return None
+        # у узлов, построенных не парсером, loc может не быть
+        literal = LiteralNode(text, row=node.row, col=node.col, loc=getattr(node, 'loc', None))
+        if node.node_type is not None:
+            literal.node_type = literal.type
+        return literal
+
+    def _simplify(self, node: BinOpNode) -> ExprNode:
+        op, arg1, arg2 = node.op, node.arg1, node.arg2
+        const1 = arg1.value if isinstance(arg1, LiteralNode) and arg1.type is TypeDesc.BOOL else None
+        const2 = arg2.value if isinstance(arg2, LiteralNode) and arg2.type is TypeDesc.BOOL else None
+        if op is BinOp.LOGICAL_AND:
+            if const1 is not None:
+                return arg2 if const1 else arg1  # false && x - x не вычисляется
+            if const2 is True:
+                return arg1
+        elif op is BinOp.LOGICAL_OR:
+            if const1 is not None:
+                return arg1 if const1 else arg2  # true || x - x не вычисляется
+            if const2 is False:
+                return arg1
+        type_ = node.node_type
+        if type_ is None or type_.base_type not in _NUMERIC_RANKS or type_.base_type is BaseType.CHAR:
+            return node
+        integral = type_.base_type in _INTEGRAL_BITS
+        if arg1.node_type is type_:
+            value = self._constant(arg2, type_)
+            if (op is BinOp.MUL or op is BinOp.DIV) and value == 1 or op is BinOp.SUB and value == 0 \
+                    or op is BinOp.ADD and value == 0 and integral:
+                return arg1
+        if arg2.node_type is type_:
+            value = self._constant(arg1, type_)
+            if op is BinOp.MUL and value == 1 or op is BinOp.ADD and value == 0 and integral:
+                return arg2
+        if integral and (op is BinOp.ADD or op is BinOp.MUL):
+            return self._reassociate(node)
+        return node
+
+    @staticmethod
+    def _constant(node: ExprNode, type_: TypeDesc) -> Optional[LiteralValue]:
+        """Значение числового литерала node, который без потери точности приводится к type_
+           (литерал char - нет: в выражении он участвует кодом символа)
+        """
+        if not isinstance(node, LiteralNode):
+            return None
+        rank = _NUMERIC_RANKS.get(node.type.base_type)
+        if rank is None or node.type is TypeDesc.CHAR or rank > _NUMERIC_RANKS[type_.base_type]:
+            return None
+        return node.value
+
+    def _reassociate(self, node: BinOpNode) -> ExprNode:
+        """(x op c1) op c2 -> x op (c1 op c2) для + и * над int или long: в арифметике по модулю
+           2**n они ассоциативны
+        """
+        inner = node.arg1
+        if not isinstance(node.arg2, LiteralNode) or node.arg2.type is not node.node_type:
+            return node
+        if not isinstance(inner, BinOpNode) or inner.op is not node.op or inner.node_type is not node.node_type:
+            return node
+        c1 = inner.arg2
+        if not isinstance(c1, LiteralNode) or c1.type is not node.node_type:
+            return node
+        literal = self._fold(inner, c1, node.arg2)
+        if literal is None:
+            return node
+        literal.loc, literal.row, literal.col = getattr(c1, 'loc', None), c1.row, c1.col
+        inner.arg2 = literal
+        return inner
+
+
+def _count(tree: AstNode) -> int:
+    return sum(1 for _ in walk(tree))
+
+
+def fold_constants(tree: AstNode) -> FoldStats:
+    """Свертка констант в дереве программы tree (StmtListNode; меняется на месте)
+    """
+    before = _count(tree)
+    folder = ConstantFolder()
+    folder.fold(tree)
+    return FoldStats(before, _count(tree), folder.folded)
+
+
+def fold_files(paths: Iterable[str], engine: str = 'fast') -> Dict[str, FoldStats]:
+    """Разбор и свертка констант в каждом из файлов paths; результат свертки по файлам
+    """
+    result = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            tree = my_parser.parse(f.read(), engine=engine)
+        result[path] = fold_constants(tree)
+    return result
@@ -0,0 +1,220 @@
+"""Эталонная грамматика на pyparsing.
+
+   Узлы AST строятся parse action'ами, которые назначаются по именам правил: имени переменной
+   в make_parser (или имени, заданному через setName) соответствует класс узла в RULE_NODES.
+   Модуль импортируется только при первом разборе движком 'pyparsing' (см. my_parser.get_parser)
+"""
+from typing import Dict, Tuple
+
+import pyparsing as pp
+from pyparsing import pyparsing_common as ppc
+
+from .ast import *
+
+# правило грамматики -> класс узла, который строит его parse action (правила, которых здесь нет,
+# только передают свои лексемы дальше; выражения собирает bin_op_parse_action)
+RULE_NODES: Dict[str, type] = {
+    'literal': LiteralNode,
+    'ident': IdentNode,
+    'type_': TypeNode,
+    'access': AccessNode,
+    'call': CallNode,
+    'new': NewNode,
+    'assign': AssignNode,
+    'vars_': VarsNode,
+    'param': ParamNode,
+    'func': FuncNode,
+    'return_': ReturnNode,
+    'if_': IfNode,
+    'for_': ForNode,
+    'stmt_list': StmtListNode,
+    'func_stmt_list': FuncStmtListNode,
+    'class_init': ClassInitNode,
+}
+
+
+# noinspection PyPep8Naming
+def make_parser(ignore_comments: bool = True):
+    LPAR, RPAR = pp.Literal('(').suppress(), pp.Literal(')').suppress()
+    LBRACK, RBRACK = pp.Literal("[").suppress(), pp.Literal("]").suppress()
+    LBRACE, RBRACE = pp.Literal("{").suppress(), pp.Literal("}").suppress()
+    SEMI, COMMA = pp.Literal(';').suppress(), pp.Literal(',').suppress()
+    DOT = pp.Literal('.')
+    ASSIGN = pp.Literal('=')
+
+    PRIVATE = pp.Literal('private')
+    PROTECTED = pp.Literal('protected')
+    PUBLIC = pp.Literal('public')
+    access_keys = (PUBLIC | PROTECTED | PRIVATE).setName('access')
+
+    # access = pp.Optional(PRIVATE | PROTECTED | PUBLIC)
+
+    STATIC = pp.Literal('static')
+    static = STATIC.copy().setName('access')
+    VOID = pp.Literal('void').suppress()
+
+    CLASS = pp.Keyword('class').suppress()
+
+    IF = pp.Keyword('if')
+    FOR = pp.Keyword('for')
+    RETURN = pp.Keyword('return')
+    NEW = pp.Keyword('new')
+    keywords = IF | FOR | RETURN | CLASS
+
+    num = pp.Regex('[+-]?\\d+\\.?\\d*([eE][+-]?\\d+)?')
+    str_ = pp.QuotedString('"', escChar='\\', unquoteResults=False, convertWhitespaceEscapes=False)
+    literal = num | str_ | pp.Regex('true|false')
+
+    ident = (~keywords + ppc.identifier.copy()).setName('ident')
+    type_ = ident.copy().setName('type') + pp.Optional(LBRACK + RBRACK)
+    access = ident.copy().setName('access')
+
+    expr = pp.Forward()
+    stmt = pp.Forward()
+    stmt_list = pp.Forward()
+    body = pp.Forward()
+    class_init = pp.Forward()
+    func_stmt = pp.Forward()
+    func_class_init = pp.Forward()
+    func_body = pp.Forward()
+    assign = pp.Forward()
+    dot = pp.Forward()
+    caller = pp.Forward()
+    new = pp.Forward()
+
+    call = ident + LPAR + pp.Optional(caller + pp.ZeroOrMore(COMMA + caller)) + RPAR
+    new = NEW.suppress() + call
+
+    assign = ident + ASSIGN.suppress() + expr
+    var_inner = assign | ident
+    vars_ = type_ + var_inner + pp.ZeroOrMore(COMMA + var_inner)
+
+    group = (
+            literal |
+            dot |
+            LPAR + caller + RPAR
+    )
+
+    dot_chain = pp.Group((new | call | ident) + pp.ZeroOrMore(DOT + (new | call | ident))).setName(
+        'bin_op')  # обязательно call перед ident, т.к. приоритетный выбор (или использовать оператор ^ вместо | )
+    dot << dot_chain
+    # все уровни приоритета в одной плоской цепочке, дерево строит BinOpChain в bin_op_parse_action.
+    # Правые операнды приходят вместе с позицией начала (pp.Located) - она нужна узлу BinOpNode,
+    # у которого операнд окажется левым. Пробелы перед операндом пропускаются до его разбора,
+    # кроме операндов * / % (так позиции совпадают с прежней грамматикой из групп по уровням)
+    mult_operand = pp.Located(group)
+    operand = pp.Located(group)
+    operand.callPreparse = True
+    bin_op_ops = pp.oneOf('*= /= += -= >= <= == != && || + - > <')
+    mult_ops = pp.oneOf('* / %')
+    bin_op = pp.Group(group + pp.ZeroOrMore(bin_op_ops + pp.Group(operand) |
+                                            mult_ops + pp.Group(mult_operand))).setName('bin_op')
+    expr << bin_op
+
+    caller << expr
+    param = type_ + ident
+    params = pp.Optional(param + pp.ZeroOrMore(COMMA + param))
+    func_struct = (access_keys | pp.Group(pp.Empty())) + (
+            static | pp.Group(pp.Empty())) + type_ + ident + LPAR + params + RPAR
+
+    func = func_struct + func_body
+    return_ = RETURN.suppress() + expr
+    if_ = IF.suppress() + LPAR + expr + RPAR + func_body + \
+          pp.ZeroOrMore(pp.Keyword("else if").suppress() + func_body) + \
+          pp.Optional(pp.Keyword("else").suppress() + func_body)
+    simple_stmt = new | assign | call | expr
+    for_stmt_list0 = (pp.Optional(simple_stmt + pp.ZeroOrMore(COMMA + simple_stmt))).setName('stmt_list')
+    for_stmt_list = vars_ | for_stmt_list0
+    for_empty_cond = pp.Empty().setName('stmt_list')
+    for_cond = expr | for_empty_cond
+    for_body = stmt | pp.Group(SEMI).setName('stmt_list')
+    for_ = FOR.suppress() + LPAR + for_stmt_list + SEMI + for_cond + SEMI + for_stmt_list + RPAR + func_body
+
+    stmt << (
+            class_init
+            | func
+            | vars_ + SEMI
+            | func_body
+            | simple_stmt + SEMI
+    )
+
+    func_stmt << (
+            func_class_init
+            | vars_ + SEMI
+            | call + SEMI
+            | new + SEMI
+            | caller + SEMI
+            | body
+            | assign + SEMI
+            | return_ + SEMI
+            | if_
+            | for_
+    )
+
+    stmt_list = pp.ZeroOrMore(stmt)
+    func_stmt_list = pp.ZeroOrMore(func_stmt)
+
+    body << LBRACE + stmt_list + RBRACE
+    func_body << LBRACE + func_stmt_list + RBRACE
+
+    class_init << (access_keys | pp.Group(pp.Empty())) + CLASS + ident + body
+    func_class_init << CLASS + ident + body
+
+    program = pp.ZeroOrMore(class_init)
+    start = program
+
+    # без parseWithTabs pyparsing заменяет табуляции пробелами, и смещения узлов отсчитываются
+    # не в исходном тексте
+    program = (stmt_list + pp.StringEnd()).parseWithTabs()
+    if ignore_comments:
+        # комментарии пропускает и StringEnd: иначе ошибка после последней разобранной инструкции
+        # сообщалась бы в начале комментариев перед следующей, а не на ее первой лексеме
+        program.ignore(pp.cStyleComment).ignore(pp.dblSlashComment)
+
+    start = program
+
+    def set_parse_action_magic(rule_name: str, parser: pp.ParserElement) -> None:
+        if rule_name == rule_name.upper():
+            return
+        if getattr(parser, 'name', None) and parser.name.isidentifier():
+            rule_name = parser.name
+        if rule_name in ('bin_op',):
+            def operand(token) -> Tuple[AstNode, int]:
+                # операнд из pp.Located приходит как [начало, [узел], конец]
+                if isinstance(token, AstNode):
+                    return token, token.loc
+                return token[1][0], token[0]
+
+            def bin_op_parse_action(s, loc, tocs):
+                tocs = tocs[0]  # содержимое pp.Group
+                chain = BinOpChain(operand(tocs[0])[0], loc)
+                for i in range(1, len(tocs) - 1, 2):
+                    if not chain.accepts(tocs[i]):
+                        raise pp.ParseException(s, loc, 'Comparison operators cannot be chained')
+                    chain.push(tocs[i], *operand(tocs[i + 1]))
+                return chain.result()
+
+            parser.setParseAction(bin_op_parse_action)
+        else:
+            cls = RULE_NODES.get(rule_name)
+            if cls is not None:
+                def parse_action(s, loc, tocs):
+                    if cls is FuncNode:
+                        return FuncNode(tocs[0], tocs[1], tocs[2], tocs[3], tocs[4:-1], tocs[-1], loc=loc)
+                    elif cls is LiteralNode:
+                        try:
+                            return LiteralNode(*tocs, loc=loc)
+                        except ValueError as e:
+                            # некорректный литерал (число вне диапазона и т.п.) - ошибка без отката;
+                            # сообщение ParseSyntaxException pyparsing не заменяет сообщением правила
+                            raise pp.ParseSyntaxException(s, loc, str(e)) from None
+                    else:
+                        return cls(*tocs, loc=loc)
+
+                parser.setParseAction(parse_action)
+
+    for var_name, value in locals().copy().items():
+        if isinstance(value, pp.ParserElement):
+            set_parse_action_magic(var_name, value)
+
+    return start
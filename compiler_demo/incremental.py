@@ -0,0 +1,151 @@
+"""Инкрементальный повторный разбор после правки текста.
+
+   Заново разбирается только тело наименьшей функции (FuncNode) или класса (ClassInitNode),
+   внутри фигурных скобок которого целиком лежит правка; смещения (loc) узлов после правки
+   сдвигаются, новое тело подставляется в дерево на место старого. Если такой конструкции нет
+   или тело после правки не разбирается само по себе, выполняется полный разбор.
+"""
+from typing import List, NamedTuple, Optional, Tuple
+
+from . import my_parser
+from .ast import *
+from .ast import current_positions
+from .fast_parser import Parser
+from .lexer import iter_tokens, ParseError, OP
+from .positions import LineIndex
+from .visitor import child_nodes
+
+
+class TextEdit(NamedTuple):
+    """Правка текста: с позиции offset удалено removed символов и вставлен текст inserted
+    """
+    offset: int
+    removed: int
+    inserted: str
+
+    @property
+    def delta(self) -> int:
+        return len(self.inserted) - self.removed
+
+    def apply(self, prog: str) -> str:
+        return prog[:self.offset] + self.inserted + prog[self.offset + self.removed:]
+
+
+def _loc(node: AstNode) -> Optional[int]:
+    loc = getattr(node, 'loc', None)
+    return loc if isinstance(loc, int) else None
+
+
+def _containers(tree: StmtListNode, edit: TextEdit) -> List[AstNode]:
+    """Классы и функции (от внешних к внутренним), внутри которых может лежать правка,
+       по смещениям соседних инструкций (без разбора текста)
+    """
+    result = []
+    stmts = tree.exprs
+    edit_end = edit.offset + edit.removed
+    while True:
+        index = None
+        for i, stmt in enumerate(stmts):
+            loc = _loc(stmt)
+            if loc is not None and loc <= edit.offset:
+                index = i
+        if index is None:
+            return result
+        if index + 1 < len(stmts):
+            next_loc = _loc(stmts[index + 1])
+            if next_loc is not None and next_loc < edit_end:
+                return result
+        node = stmts[index]
+        if isinstance(node, ClassInitNode):
+            result.append(node)
+            stmts = node.body.exprs
+        elif isinstance(node, FuncNode):
+            result.append(node)
+            return result
+        else:
+            return result
+
+
+def _body_span(prog: str, node: AstNode) -> Tuple[int, int]:
+    """Позиции открывающей и парной закрывающей фигурной скобки тела node
+       (лексемы читаются только до конца тела)
+    """
+    return _brace_span(prog, node.loc)
+
+
+def _brace_span(prog: str, pos: int) -> Tuple[int, int]:
+    """Позиции первой фигурной скобки не раньше pos и парной ей закрывающей
+    """
+    depth = 0
+    lbrace = None
+    for kind, value, loc in iter_tokens(prog, pos):
+        if kind != OP:
+            continue
+        if value == '{':
+            if lbrace is None:
+                lbrace = loc
+            depth += 1
+        elif value == '}' and lbrace is not None:
+            depth -= 1
+            if depth == 0:
+                return lbrace, loc
+    raise ParseError('Unbalanced braces', pos)
+
+
+def _shift(tree: AstNode, edit: TextEdit, start: int, positions: LineIndex) -> None:
+    """Сдвиг loc узлов, начинающихся не раньше start, на edit.delta (поддеревья целиком
+       до правки пропускаются)
+    """
+    delta = edit.delta
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        loc = _loc(node)
+        if loc is not None and loc >= start:
+            node.loc = loc + delta
+            node.set_positions(positions)
+        childs = child_nodes(node)
+        for i, child in enumerate(childs):
+            if i + 1 < len(childs):
+                next_loc = _loc(childs[i + 1])
+                if next_loc is not None and next_loc <= edit.offset:
+                    continue
+            stack.append(child)
+
+
+def _reparse_body(container: AstNode, prog: str, new_prog: str, edit: TextEdit,
+                  tree: StmtListNode, positions: LineIndex) -> bool:
+    lbrace, rbrace = _body_span(prog, container)
+    if not (lbrace < edit.offset and edit.offset + edit.removed <= rbrace):
+        return False
+    # лексер окна останавливается на его конце, поэтому парность скобки проверяется по всему
+    # тексту после правки: если комментарий или строка из окна захватывает закрывающую скобку
+    # (или правка нарушает баланс скобок), парная скобка окажется в другом месте
+    if _brace_span(new_prog, lbrace)[1] != rbrace + edit.delta:
+        return False
+    token = current_positions.set(positions)
+    try:
+        parser = Parser(new_prog, lbrace + 1, rbrace + edit.delta)
+        body = parser.parse_all(parser.func_stmt_list if isinstance(container, FuncNode) else parser.stmt_list)
+    finally:
+        current_positions.reset(token)
+    _shift(tree, edit, rbrace, positions)
+    container.body = body
+    return True
+
+
+def reparse(tree: StmtListNode, prog: str, edit: TextEdit, engine: str = 'fast') -> Tuple[StmtListNode, str]:
+    """Применяет правку edit к тексту prog, по которому построено дерево tree, и возвращает
+       новое дерево и новый текст. При частичном разборе tree меняется на месте
+       (engine используется только для полного разбора)
+    """
+    new_prog = edit.apply(prog)
+    positions = LineIndex(new_prog)
+    for container in reversed(_containers(tree, edit)):
+        try:
+            if _reparse_body(container, prog, new_prog, edit, tree, positions):
+                tree.positions = positions
+                return tree, new_prog
+        except ParseError:
+            pass
+    return my_parser.parse(new_prog, engine=engine), new_prog
@@ -0,0 +1,164 @@
+import re
+import sys
+from array import array
+from bisect import bisect_right
+from typing import Iterator, List, Optional, Tuple
+
+# виды лексем
+IDENT, NUM, STR, OP, EOF = range(5)
+KIND_NAMES = ('ident', 'num', 'str', 'op', 'eof')
+_KIND_BY_GROUP = {'ident': IDENT, 'num': NUM, 'str': STR, 'op': OP}
+
+KEYWORDS = frozenset(('if', 'for', 'return', 'class'))
+
+_TOKEN_RE = re.compile(r'''
+    (?P<ws>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<num>\d+\.?\d*(?:[eE][+-]?\d+)?)
+  | (?P<str>"(?:[^"\\\n]|\\.)*")
+  | (?P<ident>[^\W\d]\w*)
+  | (?P<op>&&|\|\||>=|<=|!=|==|\+=|-=|/=|\*=|[(){}\[\];,.=+\-*/%<>])
+''', re.VERBOSE | re.DOTALL)
+
+# только то, что нужно для поиска границ инструкций верхнего уровня
+_BOUNDARY_RE = re.compile(r'"(?:[^"\\\n]|\\.)*"|//[^\n]*|/\*.*?\*/|[{};]', re.DOTALL)
+
+
+class ParseError(Exception):
+    """Ошибка разбора исходного текста (лексическая или синтаксическая)
+    """
+
+    def __init__(self, msg: str, loc: int) -> None:
+        super().__init__(msg)
+        self.msg = msg
+        self.loc = loc
+
+    def __reduce__(self) -> tuple:
+        # для передачи ошибки из процесса-исполнителя (parse_many, parse_parallel)
+        return ParseError, (self.msg, self.loc)
+
+    def __str__(self) -> str:
+        return '{} (at char {})'.format(self.msg, self.loc)
+
+
+def iter_tokens(prog: str, pos: int = 0) -> Iterator[Tuple[int, str, int]]:
+    """Лексемы (вид, текст, смещение) начиная с позиции pos - по мере надобности, без EOF
+    """
+    match = _TOKEN_RE.match
+    end = len(prog)
+    while pos < end:
+        m = match(prog, pos)
+        if m is None:
+            raise ParseError('Unexpected character {!r}'.format(prog[pos]), pos)
+        kind = m.lastgroup
+        if kind != 'ws' and kind != 'comment':
+            yield _KIND_BY_GROUP[kind], m.group(), pos
+        pos = m.end()
+
+
+class TokenStream:
+    """Исходный текст (или его часть [pos, end)), разбитый на лексемы за один проход: пробелы
+       и комментарии отбрасываются здесь и больше не разбираются ни одним движком.
+
+       kinds - виды лексем (array('B')), values - их текст (интернированные строки, поэтому
+       одинаковые идентификаторы хранятся один раз), locs - смещения в исходном тексте (array('l'));
+       последней всегда идет лексема EOF
+    """
+
+    __slots__ = ('prog', 'kinds', 'values', 'locs')
+
+    def __init__(self, prog: str, pos: int = 0, end: Optional[int] = None) -> None:
+        self.prog = prog
+        kinds, values, locs = array('B'), [], array('l')
+        match = _TOKEN_RE.match
+        intern = sys.intern
+        end = len(prog) if end is None else end
+        while pos < end:
+            m = match(prog, pos, end)
+            if m is None:
+                raise ParseError('Unexpected character {!r}'.format(prog[pos]), pos)
+            kind = m.lastgroup
+            if kind != 'ws' and kind != 'comment':
+                kinds.append(_KIND_BY_GROUP[kind])
+                values.append(intern(m.group()))
+                locs.append(pos)
+            pos = m.end()
+        kinds.append(EOF)
+        values.append('')
+        locs.append(end)
+        self.kinds, self.values, self.locs = kinds, values, locs
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def normalized(self) -> Tuple[str, array]:
+        """Текст из тех же лексем без комментариев: вместо каждого промежутка между лексемами
+           (пробелы, переводы строк, комментарии) - один пробел, соседние лексемы остаются
+           соседними. Возвращает текст и смещения лексем в нем (для source_loc)
+        """
+        values, locs = self.values, self.locs
+        parts = []
+        starts = array('l')
+        length = 0
+        prev_end = 0
+        for i in range(len(values) - 1):
+            loc = locs[i]
+            if loc > prev_end:
+                parts.append(' ')
+                length += 1
+            starts.append(length)
+            value = values[i]
+            parts.append(value)
+            length += len(value)
+            prev_end = loc + len(value)
+        return ''.join(parts), starts
+
+    def source_loc(self, starts: array, loc: int) -> int:
+        """Смещение в исходном тексте для смещения loc в тексте normalized(); промежуток между
+           лексемами отображается туда же, куда его пропускает pyparsing при разборе исходного
+           текста, - на конец последнего комментария в нем или на конец предыдущей лексемы
+        """
+        i = bisect_right(starts, loc) - 1
+        if i < 0:
+            return self._skip_comments(0, self.locs[0])  # промежуток в начале текста
+        start = self.locs[i]
+        offset = loc - starts[i]
+        length = len(self.values[i])
+        if offset < length:
+            return start + offset
+        return self._skip_comments(start + length, self.locs[i + 1])
+
+    def _skip_comments(self, pos: int, end: int) -> int:
+        result = pos
+        match = _TOKEN_RE.match
+        while pos < end:
+            m = match(self.prog, pos, end)
+            pos = m.end()
+            if m.lastgroup == 'comment':
+                result = pos
+        return result
+
+
+def tokenize(prog: str, pos: int = 0, end: Optional[int] = None) -> TokenStream:
+    """Разбивает исходный текст (или его часть [pos, end)) на лексемы за один проход
+    """
+    return TokenStream(prog, pos, end)
+
+
+def split_top_level(prog: str) -> List[int]:
+    """Смещения концов инструкций верхнего уровня (после '}' или ';' вне фигурных скобок)
+       без полного разбиения на лексемы; строки и комментарии пропускаются
+    """
+    ends = []
+    depth = 0
+    for m in _BOUNDARY_RE.finditer(prog):
+        value = m.group()
+        if value == '{':
+            depth += 1
+        elif value == '}':
+            depth -= 1
+            if depth == 0:
+                ends.append(m.end())
+        elif value == ';' and depth == 0:
+            ends.append(m.end())
+    return ends
@@ -0,0 +1,125 @@
+"""Разбор текста литералов по правилам Java (без eval).
+
+   Целые литералы без суффикса имеют тип int и должны помещаться в 32 бита, с суффиксом L - long
+   (64 бита); десятичные, шестнадцатеричные (0x), восьмеричные (с ведущим 0) и двоичные (0b),
+   с подчеркиваниями между цифрами. Вещественные литералы без суффикса или с суффиксом D - double,
+   с суффиксом F - float (значение округляется до 32 бит). Строки и символы - с escape-
+   последовательностями Java. Результаты кэшируются по тексту литерала: в больших инициализаторах
+   и таблицах констант одни и те же литералы встречаются многократно
+"""
+import math
+import re
+import struct
+from functools import lru_cache
+from typing import Tuple, Union
+
+from .semantic import BaseType
+
+LiteralValue = Union[bool, int, float, str]
+
+INT_MIN, INT_MAX = -2 ** 31, 2 ** 31 - 1
+LONG_MIN, LONG_MAX = -2 ** 63, 2 ** 63 - 1
+
+_INT_RE = re.compile(r'''
+    (?P<sign>[+-]?)
+    (?: 0[xX](?P<hex>[0-9a-fA-F](?:[0-9a-fA-F_]*[0-9a-fA-F])?)
+      | 0[bB](?P<bin>[01](?:[01_]*[01])?)
+      | 0_*(?P<oct>[0-7](?:[0-7_]*[0-7])?)
+      | (?P<dec>0|[1-9](?:[0-9_]*[0-9])?)
+    )
+    (?P<long>[lL]?)$
+''', re.VERBOSE)
+_FLOAT_RE = re.compile(r'''
+    (?P<number>[+-]?(?:\d(?:[\d_]*\d)?\.?(?:\d(?:[\d_]*\d)?)?|\.\d(?:[\d_]*\d)?)(?:[eE][+-]?\d(?:[\d_]*\d)?)?)
+    (?P<suffix>[fFdD]?)$
+''', re.VERBOSE)
+_ESCAPE_RE = re.compile(r'\\(?:u+([0-9a-fA-F]{4})|([0-3][0-7]{0,2}|[4-7][0-7]?)|(.))', re.DOTALL)
+_ESCAPES = {'b': '\b', 't': '\t', 'n': '\n', 'f': '\f', 'r': '\r', 's': ' ', '"': '"', "'": "'", '\\': '\\'}
+_FLOAT32 = struct.Struct('f')
+
+
+def _unescape(body: str, literal: str) -> str:
+    def replace(m: re.Match) -> str:
+        code, octal, char = m.groups()
+        if code is not None:
+            return chr(int(code, 16))
+        if octal is not None:
+            return chr(int(octal, 8))
+        try:
+            return _ESCAPES[char]
+        except KeyError:
+            raise ValueError('Illegal escape character in literal {}'.format(literal)) from None
+
+    return _ESCAPE_RE.sub(replace, body) if '\\' in body else body
+
+
+def _decode_int(m: re.Match, literal: str) -> Tuple[int, BaseType]:
+    for group, base in (('dec', 10), ('hex', 16), ('oct', 8), ('bin', 2)):
+        digits = m.group(group)
+        if digits is not None:
+            break
+    value = int(digits.replace('_', ''), base)
+    is_long = bool(m.group('long'))
+    bits = 64 if is_long else 32
+    if base == 10:
+        # десятичный литерал - это модуль числа: 2147483648 допустим только со знаком минус
+        if value > (LONG_MAX if is_long else INT_MAX) + (m.group('sign') == '-'):
+            raise ValueError('Integer number too large: {}'.format(literal))
+    else:
+        # остальные системы счисления задают биты дополнительного кода
+        if value >> bits:
+            raise ValueError('Integer number too large: {}'.format(literal))
+        if value >> (bits - 1):
+            value -= 1 << bits
+    if m.group('sign') == '-':
+        value = -value
+        # минус к наименьшему значению (-0x80000000) переполняется обратно в него же, как в Java
+        if value >> (bits - 1) == 1:
+            value -= 1 << bits
+    return value, BaseType.LONG if is_long else BaseType.INT
+
+
+def _decode_float(m: re.Match, literal: str) -> Tuple[float, BaseType]:
+    number = m.group('number').replace('_', '')
+    mantissa = number.replace('E', 'e').partition('e')[0]
+    suffix = m.group('suffix')
+    if mantissa == number and '.' not in number and not suffix:
+        # целое, которое не разобралось как целое (например, 09)
+        raise ValueError('Illegal literal: {}'.format(literal))
+    is_float = suffix in ('f', 'F')
+    value = float(number)
+    if is_float:
+        try:
+            value = _FLOAT32.unpack(_FLOAT32.pack(value))[0]
+        except OverflowError:
+            value = float('inf')
+    if math.isinf(value):
+        raise ValueError('Floating-point number too large: {}'.format(literal))
+    if value == 0 and any(c in '123456789' for c in mantissa):
+        raise ValueError('Floating-point number too small: {}'.format(literal))
+    return value, BaseType.FLOAT if is_float else BaseType.DOUBLE
+
+
+@lru_cache(maxsize=4096)
+def decode_literal(literal: str) -> Tuple[LiteralValue, BaseType]:
+    """Значение литерала и его тип; для некорректного литерала - ValueError
+    """
+    if literal == 'true' or literal == 'false':
+        return literal == 'true', BaseType.BOOL
+    first = literal[:1]
+    if first == '"':
+        if len(literal) < 2 or literal[-1] != '"':
+            raise ValueError('Unclosed string literal: {}'.format(literal))
+        return _unescape(literal[1:-1], literal), BaseType.STR
+    if first == "'":
+        value = _unescape(literal[1:-1], literal) if len(literal) > 2 and literal[-1] == "'" else ''
+        if len(value) != 1:
+            raise ValueError('Illegal character literal: {}'.format(literal))
+        return value, BaseType.CHAR
+    m = _INT_RE.match(literal)
+    if m is not None:
+        return _decode_int(m, literal)
+    m = _FLOAT_RE.match(literal)
+    if m is not None and any(c.isdigit() for c in m.group('number')):
+        return _decode_float(m, literal)
+    raise ValueError('Illegal literal: {}'.format(literal))
@@ -1,214 +1,302 @@
-import inspect
-
-import pyparsing as pp
-from pyparsing import pyparsing_common as ppc
+import os
+import threading
+from bisect import bisect_right
+from typing import TYPE_CHECKING, Dict, NamedTuple, Optional, Iterable, List, Tuple, Union
 
 from .ast import *
+from .ast import current_positions
+from . import fast_parser
+from .cache import ParseCache
+from .lexer import ParseError, split_top_level, TokenStream
+from .positions import LineIndex
+from .visitor import walk
 
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
 
-# noinspection PyPep8Naming
-def make_parser():
-    LPAR, RPAR = pp.Literal('(').suppress(), pp.Literal(')').suppress()
-    LBRACK, RBRACK = pp.Literal("[").suppress(), pp.Literal("]").suppress()
-    LBRACE, RBRACE = pp.Literal("{").suppress(), pp.Literal("}").suppress()
-    SEMI, COMMA = pp.Literal(';').suppress(), pp.Literal(',').suppress()
-    DOT = pp.Literal('.')
-    ASSIGN = pp.Literal('=')
-
-    ADD, SUB = pp.Literal('+'), pp.Literal('-')
-    MUL, DIV, MOD = pp.Literal('*'), pp.Literal('/'), pp.Literal('%')
-    AND = pp.Literal('&&')
-    OR = pp.Literal('||')
-    GE, LE, GT, LT = pp.Literal('>='), pp.Literal('<='), pp.Literal('>'), pp.Literal('<')
-    NEQUALS, EQUALS = pp.Literal('!='), pp.Literal('==')
-    P_EQ, M_EQ, DEL_EQ, MUL_EQ = pp.Literal('+='), pp.Literal('-='), pp.Literal('/='), pp.Literal('*=')
-
-    PRIVATE = pp.Literal('private')
-    PROTECTED = pp.Literal('protected')
-    PUBLIC = pp.Literal('public')
-    access_keys = PUBLIC | PROTECTED | PRIVATE
-
-    # access = pp.Optional(PRIVATE | PROTECTED | PUBLIC)
-
-    STATIC = pp.Literal('static')
-    VOID = pp.Literal('void').suppress()
-
-    CLASS = pp.Keyword('class').suppress()
-
-    IF = pp.Keyword('if')
-    FOR = pp.Keyword('for')
-    RETURN = pp.Keyword('return')
-    NEW = pp.Keyword('new')
-    keywords = IF | FOR | RETURN | CLASS
-
-    num = pp.Regex('[+-]?\\d+\\.?\\d*([eE][+-]?\\d+)?')
-    str_ = pp.QuotedString('"', escChar='\\', unquoteResults=False, convertWhitespaceEscapes=False)
-    literal = num | str_ | pp.Regex('true|false')
-
-    ident = (~keywords + ppc.identifier.copy()).setName('ident')
-    type_ = ident.copy().setName('type') + pp.Optional(LBRACK + RBRACK)
-    access = ident.copy().setName('access')
-
-    add = pp.Forward()
-    expr = pp.Forward()
-    stmt = pp.Forward()
-    stmt_list = pp.Forward()
-    body = pp.Forward()
-    class_init = pp.Forward()
-    func_stmt = pp.Forward()
-    func_class_init = pp.Forward()
-    func_body = pp.Forward()
-    assign = pp.Forward()
-    dot = pp.Forward()
-    caller = pp.Forward()
-    new = pp.Forward()
-
-    call = ident + LPAR + pp.Optional(caller + pp.ZeroOrMore(COMMA + caller)) + RPAR
-    new = NEW.suppress() + call
-
-    assign = ident + ASSIGN.suppress() + expr
-    var_inner = assign | ident
-    vars_ = type_ + var_inner + pp.ZeroOrMore(COMMA + var_inner)
-
-    group = (
-            literal |
-            dot |
-            LPAR + caller + RPAR
-    )
-
-    dot << pp.Group((new | call | ident) + pp.ZeroOrMore(DOT + (new | call | ident))).setName(
-        'bin_op')  # обязательно call перед ident, т.к. приоритетный выбор (или использовать оператор ^ вместо | )
-    mult = pp.Group(group + pp.ZeroOrMore((MUL | DIV | MOD) + group)).setName('bin_op')
-    add << pp.Group(mult + pp.ZeroOrMore((ADD | SUB) + mult)).setName('bin_op')
-    compare1 = pp.Group(add + pp.Optional((GE | LE | GT | LT) + add)).setName('bin_op')
-    compare2 = pp.Group(compare1 + pp.Optional((EQUALS | NEQUALS) + compare1)).setName('bin_op')
-    logical_and = pp.Group(compare2 + pp.ZeroOrMore(AND + compare2)).setName('bin_op')
-    logical_or = pp.Group(logical_and + pp.ZeroOrMore(OR + logical_and)).setName('bin_op')
-    op_assign = pp.Group(logical_or + pp.ZeroOrMore((MUL_EQ | DEL_EQ | P_EQ | M_EQ) + logical_or)).setName('bin_op')
-    expr << op_assign
-
-    caller << expr
-    param = type_ + ident
-    params = pp.Optional(param + pp.ZeroOrMore(COMMA + param))
-    func_struct = (access_keys | pp.Group(pp.Empty())) + (
-            STATIC | pp.Group(pp.Empty())) + type_ + ident + LPAR + params + RPAR
-
-    func = func_struct + func_body
-    return_ = RETURN.suppress() + expr
-    if_ = IF.suppress() + LPAR + expr + RPAR + func_body + \
-          pp.ZeroOrMore(pp.Keyword("else if").suppress() + func_body) + \
-          pp.Optional(pp.Keyword("else").suppress() + func_body)
-    simple_stmt = new | assign | call | expr
-    for_stmt_list0 = (pp.Optional(simple_stmt + pp.ZeroOrMore(COMMA + simple_stmt))).setName('stmt_list')
-    for_stmt_list = vars_ | for_stmt_list0
-    for_cond = expr | pp.Group(pp.empty).setName('stmt_list')
-    for_body = stmt | pp.Group(SEMI).setName('stmt_list')
-    for_ = FOR.suppress() + LPAR + for_stmt_list + SEMI + for_cond + SEMI + for_stmt_list + RPAR + func_body
-
-    stmt << (
-            class_init
-            | func
-            | vars_ + SEMI
-            | func_body
-            | simple_stmt + SEMI
-    )
-
-    func_stmt << (
-            func_class_init
-            | vars_ + SEMI
-            | call + SEMI
-            | new + SEMI
-            | caller + SEMI
-            | body
-            | assign + SEMI
-            | return_ + SEMI
-            | if_
-            | for_
-    )
-
-    stmt_list = pp.ZeroOrMore(stmt)
-    func_stmt_list = pp.ZeroOrMore(func_stmt)
-
-    body << LBRACE + stmt_list + RBRACE
-    func_body << LBRACE + func_stmt_list + RBRACE
-
-    class_init << (access_keys | pp.Group(pp.Empty())) + CLASS + ident + body
-    func_class_init << CLASS + ident + body
-
-    program = pp.ZeroOrMore(class_init)
-    start = program
-
-    program = stmt_list.ignore(pp.cStyleComment).ignore(pp.dblSlashComment) + pp.StringEnd()
-
-    start = program
-
-    def set_parse_action_magic(rule_name: str, parser: pp.ParserElement) -> None:
-        if rule_name == rule_name.upper():
-            return
-        if getattr(parser, 'name', None) and parser.name.isidentifier():
-            rule_name = parser.name
-        if rule_name in ('bin_op',):
-            def bin_op_parse_action(s, loc, tocs):
-                node = tocs[0]
-                if not isinstance(node, AstNode):
-                    node = bin_op_parse_action(s, loc, node)
-                for i in range(1, len(tocs) - 1, 2):
-                    secondNode = tocs[i + 1]
-                    if not isinstance(secondNode, AstNode):
-                        secondNode = bin_op_parse_action(s, loc, secondNode)
-                    node = BinOpNode(BinOp(tocs[i]), node, secondNode, loc=loc)
-                return node
-
-            parser.setParseAction(bin_op_parse_action)
-        else:
-            cls = ''.join(x.capitalize() for x in rule_name.split('_')) + 'Node'
-            with suppress(NameError):
-                cls = eval(cls)
-                if not inspect.isabstract(cls):
-                    def parse_action(s, loc, tocs):
-                        if cls is FuncNode:
-                            return FuncNode(tocs[0], tocs[1], tocs[2], tocs[3], tocs[4:-1], tocs[-1], loc=loc)
-                        else:
-                            return cls(*tocs, loc=loc)
-
-                    parser.setParseAction(parse_action)
-
-    for var_name, value in locals().copy().items():
-        if isinstance(value, pp.ParserElement):
-            set_parse_action_magic(var_name, value)
-
-    return start
+    import pyparsing as pp
 
+# грамматики pyparsing строятся (и сам pyparsing импортируется) при первом разборе движком 'pyparsing',
+# поэтому импорт модуля - например, в процессе-исполнителе для быстрого движка - ничего не стоит
+_parsers: Dict[bool, 'pp.ParserElement'] = {}
+_parsers_lock = threading.Lock()
 
-parser = make_parser()
 
-
-def parse(prog: str) -> StmtListNode:
-    locs = []
-    row, col = 0, 0
-    for ch in prog:
-        if ch == '\n':
-            row += 1
-            col = 0
-        elif ch == '\r':
-            pass
+def get_parser(ignore_comments: bool = True) -> 'pp.ParserElement':
+    """Грамматика pyparsing (строится один раз). ignore_comments=False - грамматика для текста
+       из TokenStream.normalized(): комментариев в нем уже нет, и pyparsing не пытается
+       сопоставить их перед каждым элементом грамматики
+    """
+    parser = _parsers.get(ignore_comments)
+    if parser is None:
+        with _parsers_lock:
+            parser = _parsers.get(ignore_comments)
+            if parser is None:
+                from .grammar import make_parser
+
+                parser = _parsers[ignore_comments] = make_parser(ignore_comments)
+    return parser
+
+
+def __getattr__(name: str):
+    # прежний интерфейс модуля: my_parser.parser и my_parser.make_parser
+    if name == 'parser':
+        return get_parser()
+    if name == 'make_parser':
+        from .grammar import make_parser
+
+        return make_parser
+    raise AttributeError("module '{}' has no attribute '{}'".format(__name__, name))
+
+
+ENGINES = ('pyparsing', 'fast')
+# увеличивается при любом изменении грамматики или строимых деревьев (сбрасывает ParseCache)
+GRAMMAR_VERSION = 4
+
+
+class PackratStats(NamedTuple):
+    """Статистика кэша мемоизации (packrat) за последний разбор
+    """
+    hits: int = 0
+    misses: int = 0
+
+
+# мемоизация в pyparsing включается для всего процесса, а кэш packrat общий для всех грамматик,
+# поэтому разборы pyparsing (и с мемоизацией, и без нее) выполняются по одному: иначе разбор без
+# packrat в другом потоке шел бы с включенной на время мемоизацией и менял бы ее статистику
+_packrat_lock = threading.Lock()
+_packrat_stats = PackratStats()
+
+
+def packrat_stats() -> PackratStats:
+    """Число попаданий и промахов кэша packrat за последний разбор с packrat=True
+    """
+    return _packrat_stats
+
+
+def clear_packrat_cache() -> None:
+    """Очистка кэша packrat (вместе со счетчиками)
+    """
+    global _packrat_stats
+    import pyparsing as pp
+
+    with _packrat_lock:
+        pp.ParserElement.reset_cache()
+        _packrat_stats = PackratStats()
+
+
+def _parse_string(grammar: 'pp.ParserElement', prog: str, packrat: bool, cache_size: Optional[int]) -> StmtListNode:
+    global _packrat_stats
+    import pyparsing as pp
+
+    with _packrat_lock:
+        if not packrat:
+            return grammar.parseString(prog)[0]
+        pp.ParserElement.enable_packrat(cache_size, force=True)
+        try:
+            return grammar.parseString(prog)[0]
+        finally:
+            _packrat_stats = PackratStats(*pp.ParserElement.packrat_cache_stats)
+            pp.ParserElement.disable_memoization()
+
+
+def parse(prog: Union[str, TokenStream], engine: str = 'pyparsing',
+          packrat: bool = False, packrat_cache_size: Optional[int] = 128,
+          cache: Optional[ParseCache] = None, outline: bool = False, prelex: bool = False) -> StmtListNode:
+    """Разбор программы; engine - 'pyparsing' (эталонная грамматика) или 'fast' (fast_parser).
+
+       packrat=True включает мемоизацию для грамматики pyparsing: результаты разбора правил
+       запоминаются по позиции (не более packrat_cache_size записей, None - без ограничения),
+       и повторные попытки разобрать то же правило с той же позиции берутся из кэша. Мемоизация
+       pyparsing глобальна, поэтому разборы движком 'pyparsing' в разных потоках (в том числе
+       в parse_many с processes=False) выполняются по очереди; быстрый движок этого ограничения не имеет.
+
+       cache - кэш деревьев на диске: для уже разобранного текста дерево загружается из него.
+
+       outline=True (только для engine='fast') - разбор без тел функций: классы, поля и сигнатуры
+       методов строятся сразу, а тело метода разбирается при первом обращении к FuncNode.body
+
+       prelex=True (или prog - готовый TokenStream) - текст сначала разбивается на лексемы
+       (lexer.TokenStream), и пробелы с комментариями больше не разбираются: быстрый движок
+       работает прямо с лексемами, а pyparsing - с текстом без комментариев, смещения узлов
+       в котором затем переводятся в смещения исходного текста
+    """
+    if engine not in ENGINES:
+        raise ValueError('Unknown parser engine: {}'.format(engine))
+    if outline and (engine != 'fast' or cache is not None):
+        raise ValueError('Outline mode requires the fast engine and no cache')
+    tokens = prog if isinstance(prog, TokenStream) else None
+    if tokens is not None:
+        prog = tokens.prog
+    if cache is not None:
+        tag = '{}-{}'.format(engine, GRAMMAR_VERSION)
+        tree = cache.get(prog, tag)
+        if tree is None:
+            tree = parse(tokens if tokens is not None else prog, engine, packrat, packrat_cache_size,
+                         prelex=prelex)
+            cache.put(prog, tag, tree)
+        return tree
+    if prelex and tokens is None:
+        tokens = TokenStream(str(prog))
+    if tokens is not None and engine == 'pyparsing':
+        return _parse_prelexed(tokens, packrat, packrat_cache_size)
+    positions = LineIndex(prog)
+    token = current_positions.set(positions)
+    try:
+        if engine == 'fast':
+            prog: StmtListNode = fast_parser.parse(tokens if tokens is not None else str(prog), outline)
         else:
-            col += 1
-        locs.append((row, col))
+            prog: StmtListNode = _parse_string(get_parser(), str(prog), packrat, packrat_cache_size)
+        prog.program = True
+        prog.positions = positions
+        return prog
+    finally:
+        current_positions.reset(token)
 
-    old_init_action = AstNode.init_action
 
-    def init_action(node: AstNode) -> None:
+def _parse_prelexed(tokens: TokenStream, packrat: bool, packrat_cache_size: Optional[int]) -> StmtListNode:
+    import pyparsing as pp
+
+    text, starts = tokens.normalized()
+    grammar = get_parser(ignore_comments=False)
+    # узлы строятся без позиций: смещения в text еще нужно перевести в смещения исходного текста
+    token = current_positions.set(None)
+    try:
+        tree: StmtListNode = _parse_string(grammar, text, packrat, packrat_cache_size)
+    except pp.ParseBaseException as e:
+        raise type(e)(tokens.prog, tokens.source_loc(starts, e.loc), e.msg) from None
+    finally:
+        current_positions.reset(token)
+    positions = LineIndex(tokens.prog)
+    source_loc = tokens.source_loc
+    for node in walk(tree):
+        loc = getattr(node, 'loc', None)
+        if isinstance(loc, int):
+            node.loc = source_loc(starts, loc)
+            node.set_positions(positions)
+    tree.program = True
+    tree.positions = positions
+    return tree
+
+
+def _prepare_workers(engine: str) -> None:
+    # грамматика строится до запуска пула: процессы, запущенные через fork, получают ее готовой
+    if engine == 'pyparsing':
+        get_parser()
+
+
+def _parse_args(args: Tuple[str, str]) -> StmtListNode:
+    return parse(*args)
+
+
+def parse_many(sources: Iterable[str], workers: Optional[int] = None, engine: str = 'pyparsing',
+               processes: bool = True) -> List[StmtListNode]:
+    """Разбор нескольких программ в пуле процессов (processes=True) или потоков из workers
+       исполнителей; деревья возвращаются в порядке исходных текстов
+    """
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    args = [(str(prog), engine) for prog in sources]
+    workers = workers or os.cpu_count() or 1
+    if processes:
+        _prepare_workers(engine)
+        with ProcessPoolExecutor(workers) as executor:
+            return list(executor.map(_parse_args, args, chunksize=max(1, len(args) // (4 * workers))))
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(_parse_args, args))
+
+
+def _parse_chunk(args: Tuple[str, int, int, int, str]) -> Tuple[Tuple[StmtNode, ...], int]:
+    # фрагмент дополнен pad пробелами до начала строки, поэтому смещения в нем отличаются
+    # от смещений во всем тексте на offset; pyparsing может дать узлу позицию пробелов перед ним,
+    # а во всем тексте эти пробелы начинаются не раньше начала фрагмента
+    chunk, offset, pad, first_line, engine = args
+    tree = parse(chunk, engine)
+    positions = LineIndex(chunk, offset, first_line)
+    for node in walk(tree):
         loc = getattr(node, 'loc', None)
         if isinstance(loc, int):
-            node.row = locs[loc][0] + 1
-            node.col = locs[loc][1] + 1
+            node.loc = max(loc, pad) + offset
+            node.set_positions(positions)
+    return tree.exprs, tree.loc
 
-    AstNode.init_action = init_action
+
+def _map_chunks(executor: 'Executor', args: List[Tuple[str, int, int, int, str]], prog: str) -> list:
+    results = []
     try:
-        prog: StmtListNode = parser.parseString(str(prog))[0]
-        prog.program = True
-        return prog
+        for result in executor.map(_parse_chunk, args):
+            results.append(result)
+    except Exception as e:
+        # ошибка в первом неразобранном фрагменте: смещения в нем отличаются от смещений в prog на offset
+        error = _relocate_error(e, prog, args[len(results)][1])
+        if error is e:
+            raise
+        raise error from None
+    return results
+
+
+def _relocate_error(error: Exception, prog: str, offset: int) -> Exception:
+    if isinstance(error, ParseError):
+        return ParseError(error.msg, error.loc + offset)
+    import pyparsing as pp
+
+    if isinstance(error, pp.ParseBaseException):
+        # строка и столбец ошибки pyparsing вычисляются по тексту, поэтому он тоже заменяется
+        return type(error)(prog, error.loc + offset, error.msg)
+    return error
+
+
+def parse_parallel(prog: str, workers: Optional[int] = None, engine: str = 'pyparsing',
+                   executor: Optional['Executor'] = None) -> StmtListNode:
+    """Разбор одной большой программы по частям в пуле процессов: текст делится на фрагменты
+       по границам инструкций верхнего уровня (классов и т.п.), фрагменты разбираются
+       независимо, смещения узлов пересчитываются, и инструкции собираются в один StmtListNode.
+
+       Для корректной программы дерево совпадает с результатом parse(prog, engine);
+       executor - готовый пул (иначе создается ProcessPoolExecutor из workers процессов)
+    """
+    if engine not in ENGINES:
+        raise ValueError('Unknown parser engine: {}'.format(engine))
+    prog = str(prog)
+    workers = workers or os.cpu_count() or 1
+    ends = split_top_level(prog)
+    if ends and ends[-1] < len(prog):
+        ends.append(len(prog))
+    if workers == 1 or len(ends) < 2:
+        return parse(prog, engine)
+
+    # фрагменты примерно одинакового размера, по несколько на исполнителя
+    size = len(prog) / min(len(ends), 4 * workers)
+    bounds = [0]
+    for end in ends:
+        if end - bounds[-1] >= size or end == ends[-1]:
+            bounds.append(end)
+
+    positions = LineIndex(prog)
+    starts = positions.starts
+    args = []
+    for start, end in zip(bounds, bounds[1:]):
+        line = bisect_right(starts, start) - 1
+        offset = starts[line]
+        args.append((' ' * (start - offset) + prog[start:end], offset, start - offset, line, engine))
+
+    if executor is None:
+        from concurrent.futures import ProcessPoolExecutor
+
+        _prepare_workers(engine)
+        with ProcessPoolExecutor(workers) as executor:
+            results = _map_chunks(executor, args, prog)
+    else:
+        results = _map_chunks(executor, args, prog)
+
+    exprs = []
+    for chunk_exprs, _ in results:
+        exprs.extend(chunk_exprs)
+    token = current_positions.set(positions)
+    try:
+        tree = StmtListNode(*exprs, loc=results[0][1])
     finally:
-        AstNode.init_action = old_init_action
-
+        current_positions.reset(token)
+    tree.program = True
+    tree.positions = positions
+    return tree
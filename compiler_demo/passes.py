@@ -0,0 +1,274 @@
+"""Менеджер проходов по дереву программы: зависимости, кэш результатов анализов и статистика.
+
+   Проход - анализ (дерево не меняет, результат кэшируется) или преобразование (меняет дерево
+   на месте и выполняется при каждом запросе). В requires проход перечисляет анализы, результаты
+   которых ему нужны: менеджер выполняет их раньше (или берет из кэша) и передает результаты
+   проходу. Кэш хранится на корне дерева (в _extra), поэтому у каждого дерева он свой и исчезает
+   вместе с деревом. После преобразования в кэше остаются только результаты анализов из его
+   preserves, все требования которых тоже сохранены; если дерево изменено вне менеджера,
+   кэш сбрасывается вызовом invalidate.
+
+   Для каждого выполненного прохода записываются файл, время и (если включено, через tracemalloc)
+   пиковый прирост выделенной памяти и память, оставшаяся занятой после прохода. Время и память
+   требований в проход не входят: требования выполняются до него как отдельные проходы
+"""
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from . import my_parser
+from .analyzer import analyze
+from .ast import *
+from .dataflow import build_cfg, ControlFlowGraph, lint_func
+from .folding import fold_constants
+from .visitor import child_nodes, walk
+
+# имя ключа кэша анализов в _extra корня дерева
+_CACHE_KEY = 'analyses'
+
+
+class Pass(NamedTuple):
+    """Проход name: run(tree, results) получает дерево и словарь результатов требований requires
+       (имя анализа -> результат); transform - проход меняет дерево, preserves - анализы,
+       результаты которых после него остаются верными
+    """
+    name: str
+    run: Callable[[AstNode, Dict[str, Any]], Any]
+    requires: Tuple[str, ...] = ()
+    transform: bool = False
+    preserves: Tuple[str, ...] = ()
+
+
+class PassStats(NamedTuple):
+    """Выполнение прохода name для файла file: время в секундах, пиковый прирост выделенной
+       памяти и прирост занятой памяти после прохода в байтах (None, если память не измерялась)
+    """
+    file: str
+    name: str
+    seconds: float
+    peak: Optional[int]
+    retained: Optional[int]
+
+
+def _functions(tree: AstNode) -> List[FuncNode]:
+    return [node for node in walk(tree) if isinstance(node, FuncNode) and node.body is not None]
+
+
+def _cfg_pass(tree: AstNode, results: Dict[str, Any]) -> Dict[FuncNode, ControlFlowGraph]:
+    return {func: build_cfg(func) for func in _functions(tree)}
+
+
+def _lint_pass(tree: AstNode, results: Dict[str, Any]) -> list:
+    warnings = []
+    for func, cfg in results['cfg'].items():
+        warnings.extend(lint_func(func, cfg))
+    return warnings
+
+
+def _dead_code_pass(tree: AstNode, results: Dict[str, Any]) -> int:
+    """Удаление недостижимых инструкций из списков инструкций методов; возвращает число
+       удаленных инструкций (вложенные в них не считаются)
+    """
+    removed = 0
+    for func, cfg in results['cfg'].items():
+        reachable = cfg.reverse_postorder()
+        # шаг for (невидимый блок) остается в дереве, даже если недостижим
+        dead = {id(stmt) for block in cfg.blocks if block.visible for stmt in block.stmts}
+        for index in reachable:
+            dead.difference_update(id(stmt) for stmt in cfg.blocks[index].stmts)
+        if not dead:
+            continue
+        stack: List[AstNode] = [func.body]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, (StmtListNode, FuncStmtListNode)):
+                exprs = tuple(stmt for stmt in node.exprs if id(stmt) not in dead)
+                if len(exprs) != len(node.exprs):
+                    removed += len(node.exprs) - len(exprs)
+                    node.exprs = exprs
+            if isinstance(node, (StmtListNode, FuncStmtListNode, IfNode, ForNode)):
+                stack.extend(child for child in child_nodes(node) if id(child) not in dead)
+    return removed
+
+
+# стандартные проходы: семантический анализ (результат - список ошибок), свертка констант
+# (FoldStats), CFG методов (FuncNode -> ControlFlowGraph), проверки кода (список LintWarning)
+# и удаление недостижимого кода (число удаленных инструкций)
+DEFAULT_PASSES = (
+    Pass('semantic', lambda tree, results: analyze(tree)),
+    Pass('fold', lambda tree, results: fold_constants(tree), ('semantic',), True, ('semantic',)),
+    Pass('cfg', _cfg_pass, ('semantic',)),
+    Pass('lint', _lint_pass, ('cfg',)),
+    Pass('dce', _dead_code_pass, ('cfg',), True, ('semantic',)),
+)
+
+
+class PassManager:
+    """Выполнение проходов (см. описание модуля); stats - записи о выполненных проходах,
+       hits - число результатов анализов, взятых из кэша, по именам проходов
+    """
+
+    def __init__(self, passes: Iterable[Pass] = DEFAULT_PASSES, trace_memory: bool = False) -> None:
+        self.passes: Dict[str, Pass] = {}
+        self.trace_memory = trace_memory
+        self.stats: List[PassStats] = []
+        self.hits: Counter = Counter()
+        for pass_ in passes:
+            self.register(pass_)
+
+    def register(self, pass_: Pass) -> None:
+        """Регистрация прохода; требования должны быть уже зарегистрированными анализами
+           (поэтому циклических зависимостей быть не может)
+        """
+        if pass_.name in self.passes:
+            raise ValueError("Pass '{}' is already registered".format(pass_.name))
+        for name in pass_.requires:
+            required = self.passes.get(name)
+            if required is None or required.transform:
+                raise ValueError("Pass '{}' requires '{}', which is not a registered analysis".format(pass_.name, name))
+        self.passes[pass_.name] = pass_
+
+    @staticmethod
+    def _cache(tree: AstNode) -> Dict[str, Any]:
+        cache = tree._extra.get(_CACHE_KEY) if tree._extra else None
+        if cache is None:
+            cache = {}
+            tree._set_extra(_CACHE_KEY, cache)
+        return cache
+
+    def cached(self, tree: AstNode, name: str) -> bool:
+        """Есть ли в кэше дерева tree результат анализа name
+        """
+        return name in self._cache(tree)
+
+    def invalidate(self, tree: AstNode, preserves: Iterable[str] = ()) -> None:
+        """Сброс кэша дерева tree, кроме анализов preserves, все требования которых сохранены
+        """
+        cache = self._cache(tree)
+        preserves = set(preserves)
+        kept: Dict[str, bool] = {}
+
+        def keep(name: str) -> bool:
+            if name not in kept:
+                kept[name] = name in preserves and name in cache \
+                    and all(keep(required) for required in self.passes[name].requires)
+            return kept[name]
+
+        for name in [name for name in cache if not keep(name)]:
+            del cache[name]
+
+    def get(self, tree: AstNode, name: str, file: str = '<input>') -> Any:
+        """Результат анализа name для дерева tree (из кэша или после выполнения анализа
+           и недостающих требований)
+        """
+        pass_ = self.passes[name]
+        if pass_.transform:
+            raise ValueError("Pass '{}' is a transform, not an analysis".format(name))
+        return self._results(tree, (name,), file)[name]
+
+    def run(self, tree: AstNode, names: Iterable[str], file: str = '<input>') -> Dict[str, Any]:
+        """Выполнение проходов names по порядку (анализы - из кэша, если результат есть);
+           возвращает результаты по именам проходов
+        """
+        results = {}
+        for name in names:
+            pass_ = self.passes[name]
+            if pass_.transform:
+                required = self._results(tree, pass_.requires, file)
+                results[name] = self._execute(pass_, tree, required, file)
+                self.invalidate(tree, pass_.preserves)
+            else:
+                results[name] = self.get(tree, name, file)
+        return results
+
+    def _results(self, tree: AstNode, names: Iterable[str], file: str) -> Dict[str, Any]:
+        """Результаты анализов names и их требований; недостающие выполняются после своих
+           требований (обход в глубину без рекурсии)
+        """
+        cache = self._cache(tree)
+        stack: List[Tuple[str, bool]] = [(name, False) for name in reversed(tuple(names))]
+        while stack:
+            name, ready = stack.pop()
+            if name in cache:
+                if not ready:
+                    self.hits[name] += 1
+                continue
+            pass_ = self.passes[name]
+            if ready:
+                required = {req: cache[req] for req in pass_.requires}
+                cache[name] = self._execute(pass_, tree, required, file)
+                continue
+            stack.append((name, True))
+            stack.extend((req, False) for req in reversed(pass_.requires))
+        return {name: cache[name] for name in names}
+
+    def _execute(self, pass_: Pass, tree: AstNode, required: Dict[str, Any], file: str) -> Any:
+        result, seconds, peak, retained = self._measure(pass_.run, tree, required)
+        self.stats.append(PassStats(file, pass_.name, seconds, peak, retained))
+        return result
+
+    def _measure(self, func: Callable, *args: Any) -> Tuple[Any, float, Optional[int], Optional[int]]:
+        if not self.trace_memory:
+            start = time.perf_counter()
+            result = func(*args)
+            return result, time.perf_counter() - start, None, None
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        try:
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            start = time.perf_counter()
+            result = func(*args)
+            seconds = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started:
+                tracemalloc.stop()
+        return result, seconds, peak - before, current - before
+
+    def run_files(self, paths: Iterable[str], names: Iterable[str],
+                  engine: str = 'fast') -> Dict[str, Dict[str, Any]]:
+        """Разбор каждого из файлов paths (записывается как проход parse) и выполнение проходов
+           names; результаты по файлам
+        """
+        names = tuple(names)
+        result = {}
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                prog = f.read()
+            tree, seconds, peak, retained = self._measure(my_parser.parse, prog, engine)
+            self.stats.append(PassStats(path, 'parse', seconds, peak, retained))
+            result[path] = self.run(tree, names, path)
+        return result
+
+    def report(self) -> str:
+        """Таблица: суммарные время и память по проходам и по файлам, число выполнений проходов
+           и попаданий в кэш
+        """
+        lines = ['{:24} {:>6} {:>6} {:>10} {:>12} {:>12}'.format(
+            'pass', 'runs', 'hits', 'time, ms', 'peak, KiB', 'retained, KiB')]
+
+        def total(key: str, group: List[PassStats], runs: str, hits: str) -> str:
+            seconds = sum(s.seconds for s in group)
+            if self.trace_memory:
+                peak = '{:.1f}'.format(max(s.peak for s in group) / 1024)
+                retained = '{:.1f}'.format(sum(s.retained for s in group) / 1024)
+            else:
+                peak = retained = '-'
+            return '{:24} {:>6} {:>6} {:>10.2f} {:>12} {:>12}'.format(
+                key, runs, hits, seconds * 1000, peak, retained)
+
+        by_pass: Dict[str, List[PassStats]] = {}
+        by_file: Dict[str, List[PassStats]] = {}
+        for s in self.stats:
+            by_pass.setdefault(s.name, []).append(s)
+            by_file.setdefault(s.file, []).append(s)
+        for name, group in by_pass.items():
+            lines.append(total(name, group, str(len(group)), str(self.hits[name])))
+        lines.append('')
+        lines.append('{:24}'.format('file'))
+        for file, group in by_file.items():
+            lines.append(total(file, group, str(len(group)), ''))
+        return '\n'.join(lines)
@@ -0,0 +1,56 @@
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Optional, Tuple
+
+
+class LineIndex:
+    """Индекс начал строк исходного текста: смещение -> (строка, столбец) двоичным поиском.
+
+       Память - O(число строк) вместо кортежа на каждый символ.
+
+       Индекс можно построить для фрагмента большего текста: text начинается со смещения offset
+       (это начало строки first_line), и смещения/строки считаются относительно всего текста.
+
+       Символы '\r' (например, в переводах строк CRLF) столбец не увеличивают, поэтому их
+       смещения хранятся отдельно (в crs, обычно пустом)
+    """
+
+    __slots__ = ('starts', 'crs', 'first_line')
+
+    def __init__(self, text: str, offset: int = 0, first_line: int = 0) -> None:
+        starts = array('l', (offset,))
+        find = text.find
+        i = find('\n')
+        while i >= 0:
+            starts.append(offset + i + 1)
+            i = find('\n', i + 1)
+        crs = array('l')
+        i = find('\r')
+        while i >= 0:
+            crs.append(offset + i)
+            i = find('\r', i + 1)
+        self.starts = starts
+        self.crs = crs
+        self.first_line = first_line
+
+    @staticmethod
+    def from_starts(starts: array, first_line: int = 0, crs: Optional[array] = None) -> 'LineIndex':
+        index = LineIndex.__new__(LineIndex)
+        index.starts = starts
+        index.crs = crs if crs is not None else array('l')
+        index.first_line = first_line
+        return index
+
+    def row_col(self, loc: int) -> Tuple[int, int]:
+        """Строка (с 0) и столбец (с 1, по символу loc включительно); для перевода строки - следующая
+           строка и столбец 0
+        """
+        starts = self.starts
+        line = bisect_right(starts, loc) - 1
+        if line + 1 < len(starts) and starts[line + 1] == loc + 1:
+            return self.first_line + line + 1, 0
+        col = loc - starts[line] + 1
+        crs = self.crs
+        if crs:
+            col -= bisect_right(crs, loc) - bisect_left(crs, starts[line])
+        return self.first_line + line, col
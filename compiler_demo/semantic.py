@@ -1,3 +1,5 @@
+import threading
+import weakref
 from typing import Tuple, Any, Dict, Optional
 from enum import Enum
 
@@ -25,21 +27,42 @@ class BinOp(Enum):
         return self.value
 
 
+# приоритеты бинарных операций (чем больше, тем сильнее связывает операция); операции левоассоциативны,
+# кроме сравнений: две операции одного уровня сравнения подряд (a < b < c) грамматикой не допускаются
+BIN_OP_PRECEDENCE: Dict[BinOp, int] = {
+    BinOp.DOT: 7,
+    BinOp.MUL: 6, BinOp.DIV: 6, BinOp.MOD: 6,
+    BinOp.ADD: 5, BinOp.SUB: 5,
+    BinOp.GT: 4, BinOp.LT: 4, BinOp.GE: 4, BinOp.LE: 4,
+    BinOp.EQUALS: 3, BinOp.NEQUALS: 3,
+    BinOp.LOGICAL_AND: 2,
+    BinOp.LOGICAL_OR: 1,
+}
+NON_ASSOCIATIVE_PRECEDENCES = frozenset((4, 3))
+
+
 class BaseType(Enum):
     """Перечисление для базовых типов данных
     """
 
     VOID = 'void'
     INT = 'int'
+    LONG = 'long'
     FLOAT = 'float'
+    DOUBLE = 'double'
     BOOL = 'bool'
+    CHAR = 'char'
     STR = 'string'
 
     def __str__(self):
         return self.value
 
 
+# имена типов Java, которые отличаются от BaseType.value
+JAVA_TYPE_NAMES: Dict[str, str] = {'boolean': 'bool', 'String': 'string'}
+
 VOID, INT, FLOAT, BOOL, STR = BaseType.VOID, BaseType.INT, BaseType.FLOAT, BaseType.BOOL, BaseType.STR
+LONG, DOUBLE, CHAR = BaseType.LONG, BaseType.DOUBLE, BaseType.CHAR
 
 
 class AccessType(Enum):
@@ -64,23 +87,59 @@ class AccessType(Enum):
 
 
 class TypeDesc:
-    """Класс для описания типа данных.
-
-       Сейчас поддерживаются только примитивные типы данных и функции.
-       При поддержки сложных типов (массивы и т.п.) должен быть рассширен
+    """Класс для описания типа данных: примитивные типы (base_type), функции (return_type и params),
+       массивы (element) и классы (name).
+
+       Экземпляры интернированы: TypeDesc(...) с теми же составляющими возвращает уже созданный
+       объект, поэтому равные типы - это один и тот же объект, сравнение типов - сравнение ссылок,
+       а строковое представление вычисляется один раз. Поэтому же объекты неизменяемы.
+       Таблица интернирования хранит типы по слабым ссылкам: неиспользуемые типы (например,
+       классы из уже разобранных программ) из нее удаляются
     """
 
+    __slots__ = ('base_type', 'return_type', 'params', 'name', 'element', '_str', '__weakref__')
+
     VOID: 'TypeDesc'
     INT: 'TypeDesc'
+    LONG: 'TypeDesc'
     FLOAT: 'TypeDesc'
+    DOUBLE: 'TypeDesc'
     BOOL: 'TypeDesc'
+    CHAR: 'TypeDesc'
     STR: 'TypeDesc'
 
-    def __init__(self, base_type_: Optional[BaseType] = None,
-                 return_type: Optional['TypeDesc'] = None, params: Optional[Tuple['TypeDesc']] = None) -> None:
-        self.base_type = base_type_
-        self.return_type = return_type
-        self.params = params
+    _interned: 'weakref.WeakValueDictionary[tuple, TypeDesc]' = weakref.WeakValueDictionary()
+    # setdefault у WeakValueDictionary не атомарен, поэтому новые типы добавляются под блокировкой
+    _intern_lock = threading.Lock()
+
+    def __new__(cls, base_type_: Optional[BaseType] = None,
+                return_type: Optional['TypeDesc'] = None, params: Optional[Tuple['TypeDesc', ...]] = None,
+                name: Optional[str] = None, element: Optional['TypeDesc'] = None) -> 'TypeDesc':
+        if params is not None:
+            params = tuple(params)
+        # составляющие-типы уже интернированы, поэтому ключ хэшируется и сравнивается по ссылкам
+        key = base_type_, return_type, params, name, element
+        self = cls._interned.get(key)
+        if self is None:
+            self = object.__new__(cls)
+            for attr, value in zip(cls.__slots__, key + (None,)):
+                object.__setattr__(self, attr, value)
+            with cls._intern_lock:
+                self = cls._interned.setdefault(key, self)
+        return self
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError('TypeDesc is immutable')
+
+    def __reduce__(self) -> tuple:
+        # при распаковке (например, в другом процессе) тип снова интернируется
+        return TypeDesc, (self.base_type, self.return_type, self.params, self.name, self.element)
+
+    def __copy__(self) -> 'TypeDesc':
+        return self
+
+    def __deepcopy__(self, memo: dict) -> 'TypeDesc':
+        return self
 
     @property
     def func(self) -> bool:
@@ -90,28 +149,40 @@ class TypeDesc:
     def is_simple(self) -> bool:
         return not self.func
 
+    @property
+    def is_array(self) -> bool:
+        return self.element is not None
+
     @staticmethod
     def from_base_type(base_type_: BaseType) -> 'TypeDesc':
         return getattr(TypeDesc, base_type_.name)
 
     @staticmethod
     def from_str(str_decl: str) -> 'TypeDesc':
-        base_type_ = BaseType(str_decl)
+        base_type_ = BaseType(JAVA_TYPE_NAMES.get(str_decl, str_decl))
         return TypeDesc.from_base_type(base_type_)
 
+    @staticmethod
+    def array_of(element: 'TypeDesc') -> 'TypeDesc':
+        return TypeDesc(element=element)
+
     def __str__(self) -> str:
-        if not self.func:
-            return str(self.base_type)
-        else:
-            res = str(self.return_type)
-            res += ' ('
-            for param in self.params:
-                if res[-1] != '(':
-                    res += ', '
-                res += str(param)
-            res += ')'
+        res = self._str
+        if res is None:
+            if self.name is not None:
+                res = self.name
+            elif self.element is not None:
+                res = str(self.element) + '[]'
+            elif not self.func:
+                res = str(self.base_type)
+            else:
+                res = '{} ({})'.format(self.return_type, ', '.join(map(str, self.params or ())))
+            object.__setattr__(self, '_str', res)
         return res
 
+    def __repr__(self) -> str:
+        return 'TypeDesc({})'.format(self)
+
 
 for base_type in BaseType:
     setattr(TypeDesc, base_type.name, TypeDesc(base_type))
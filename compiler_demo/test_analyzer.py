@@ -0,0 +1,116 @@
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.analyzer import analyze, analyze_parallel
+from compiler_demo.ast import *
+from compiler_demo.semantic import ScopeType
+from compiler_demo.visitor import walk
+
+PROGRAM = '''class A {
+    int x;
+    int f(int n) {
+        int s = n + x;
+        return s;
+    }
+    class B {
+        int g() { return f(1); }
+    }
+}
+class C {
+    double h(double d) { return d * 2; }
+}
+'''
+
+
+def _parse(prog=PROGRAM):
+    return my_parser.parse(prog, engine='fast')
+
+
+def _messages(errors):
+    return [error.msg for error in errors]
+
+
+def test_program_without_errors():
+    tree = _parse()
+    assert analyze(tree) == []
+    func = tree.exprs[0].body.exprs[1]
+    s = func.body.exprs[0].vars[0]
+    assert s.var.node_ident.scope is ScopeType.LOCAL
+    assert s.val.arg1.node_ident.scope is ScopeType.PARAM
+    assert s.val.node_type is TypeDesc.INT
+
+
+@pytest.mark.parametrize('prog, messages', [
+    ('class A { int f() { return y; } }', ["Unknown identifier 'y'"]),
+    ('class A { int f(int a) { int a = 1; return a; } }', ["Identifier 'a' is already declared"]),
+    ('class A { Foo x; }', ["Unknown type 'Foo'"]),
+])
+def test_errors(prog, messages):
+    assert _messages(analyze(_parse(prog))) == messages
+
+
+def test_method_root():
+    func = _parse().exprs[0].body.exprs[1]
+    # поле x объявлено вне метода
+    assert _messages(analyze(func)) == ["Unknown identifier 'x'"]
+    assert func.name.node_ident is not None
+
+
+def test_class_root():
+    cls = _parse().exprs[0]
+    assert analyze(cls) == []
+    assert cls.body.exprs[2].body.exprs[0].body.exprs[0].val.func.node_ident.type.return_type is TypeDesc.INT
+
+
+def test_statement_root():
+    tree = _parse('int a = 1; a = a + 1;')
+    assert _messages(analyze(tree.exprs[1])) == ["Unknown identifier 'a'"] * 2
+    assert analyze(tree) == []
+
+
+def test_parallel_matches_sequential():
+    prog = PROGRAM + 'class D { int k() { return z; } }\n'
+    expected_tree, tree = _parse(prog), _parse(prog)
+    expected = analyze(expected_tree)
+    errors = analyze_parallel(tree, workers=2)
+    assert [str(e) for e in errors] == [str(e) for e in expected]
+    for node, expected_node in zip(walk(tree), walk(expected_tree)):
+        assert str(node.node_type) == str(expected_node.node_type)
+
+
+PARALLEL_PROGRAM = PROGRAM + '''int total = 0;
+class D {
+    int k() { return z + total; }
+    class B { double g() { return 2.5; } }
+    void m() { B b = new B(); total = b.g(); }
+}
+boolean flag = total > missing;
+class E {
+    int f(int n) { return n + total; }
+    String s = "a" + f(1);
+    void bad() { undefined(1); int n = true; }
+}
+'''
+
+
+def _annotations(tree, errors):
+    # ошибки и семантические поля по номерам узлов; одинаковые объявления - один и тот же объект
+    nodes = list(walk(tree))
+    numbers = {id(node): i for i, node in enumerate(nodes)}
+    idents = {}
+    fields = []
+    for node in nodes:
+        ident = node.node_ident
+        if ident is not None:
+            idents.setdefault(id(ident), len(idents))
+            ident = (idents[id(ident)], ident.name, ident.type, ident.scope, ident.index, ident.built_in)
+        fields.append((node.node_type, ident))
+    return [(error.msg, numbers[id(error.node)]) for error in errors], fields
+
+
+@pytest.mark.parametrize('workers', [2, 3])
+def test_parallel_annotations_match_sequential(workers):
+    expected_tree, tree = _parse(PARALLEL_PROGRAM), _parse(PARALLEL_PROGRAM)
+    expected = _annotations(expected_tree, analyze(expected_tree))
+    assert len(expected[0]) >= 3
+    assert _annotations(tree, analyze_parallel(tree, workers=workers)) == expected
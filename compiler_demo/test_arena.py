@@ -0,0 +1,85 @@
+import mmap
+
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.arena import AstArena
+from compiler_demo.visitor import walk
+
+PROGRAM = '''class A {
+    int x = 1 + 2;
+    int f(int n) {
+        if (n < 2) {
+            return n;
+        }
+        return f(n - 1) + f(n - 2);
+    }
+}
+'''
+
+
+def _round_trip(tree):
+    return AstArena.from_bytes(AstArena.from_tree(tree).to_bytes()).to_tree()
+
+
+def _positions(tree):
+    return [(type(node).__name__, node.row, node.col) for node in walk(tree)]
+
+
+@pytest.mark.parametrize('engine', ['fast', 'pyparsing'])
+def test_round_trip_keeps_structure_and_positions(engine):
+    tree = my_parser.parse(PROGRAM, engine=engine)
+    copy = _round_trip(tree)
+    assert copy.tree == tree.tree
+    assert copy.program
+    assert _positions(copy) == _positions(tree)
+
+
+def test_round_trip_after_positions_resolved():
+    tree = my_parser.parse(PROGRAM, engine='fast')
+    expected = _positions(tree)  # row/col вычислены, ссылки узлов на индекс строк сброшены
+    assert (expected[-1][1], expected[-1][2]) != (None, None)
+    arena = AstArena.from_tree(tree)
+    assert arena.line_starts is not None
+    assert _positions(_round_trip(tree)) == expected
+
+
+def test_children_ranges():
+    tree = my_parser.parse(PROGRAM, engine='fast')
+    arena = AstArena.from_tree(tree)
+    for i in range(1, len(arena)):
+        parent = arena.parents[i]
+        first = arena.first_child[parent]
+        assert first <= i < first + arena.child_count[parent]
+    histogram = arena.kind_histogram()
+    assert histogram['FuncNode'] == 1
+    assert histogram['ClassInitNode'] == 1
+
+
+def test_unsupported_format():
+    data = bytearray(AstArena.from_tree(my_parser.parse(PROGRAM, engine='fast')).to_bytes())
+    data[:4] = b'XXXX'
+    with pytest.raises(ValueError):
+        AstArena.from_bytes(bytes(data))
+
+
+@pytest.mark.parametrize('corrupt', [lambda data: data[:-1], lambda data: data[:-1] + b'\xff'])
+def test_failed_load_releases_buffer(tmp_path, corrupt):
+    # второй случай - ошибка в именах, когда массивы узлов уже ссылаются на buffer
+    path = tmp_path / 'tree.ast'
+    path.write_bytes(corrupt(AstArena.from_tree(my_parser.parse(PROGRAM, engine='fast')).to_bytes()))
+    with open(str(path), 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        # ссылки из трассировки исключения не мешают закрыть mmap
+        with pytest.raises(ValueError):
+            AstArena.from_bytes(buffer)
+
+
+def test_release():
+    tree = my_parser.parse(PROGRAM, engine='fast')
+    data = bytearray(AstArena.from_tree(tree).to_bytes())
+    arena = AstArena.from_bytes(data)
+    copy = arena.to_tree()
+    arena.release()
+    # после release buffer снова можно менять, а дерево от него не зависит
+    data.extend(b'\0')
+    assert copy.tree == tree.tree
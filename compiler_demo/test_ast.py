@@ -0,0 +1,160 @@
+import copy
+import io
+import pickle
+
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.analyzer import analyze
+from compiler_demo.ast import *
+from compiler_demo.codegen import compile_class
+from compiler_demo.dataflow import lint
+from compiler_demo.visitor import NodeTransformer
+
+ENGINES = ('fast', 'pyparsing')
+
+
+def _sexpr(node):
+    if isinstance(node, (BinOpNode, OpAssignNode, AssignNode)):
+        arg1, arg2 = (node.arg1, node.arg2) if isinstance(node, BinOpNode) else (node.var, node.val)
+        return '({} {} {})'.format(_sexpr(arg1), node, _sexpr(arg2))
+    return str(node)
+
+
+def _body(body, engine):
+    tree = my_parser.parse('class A {{ void f() {{ {} }} }}'.format(body), engine=engine)
+    return tree.exprs[0].body.exprs[0].body.exprs
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('expr, expected', [
+    ('a + b * c - d', '((a + (b * c)) - d)'),
+    ('a || b && c == d < e + f', '(a || (b && (c == (d < (e + f)))))'),
+    ('a += b', '(a += b)'),
+    ('a *= b + c * 2', '(a *= (b + (c * 2)))'),
+    # составные присваивания правоассоциативны
+    ('a += b -= c', '(a += (b -= c))'),
+    ('a + b /= c', '((a + b) /= c)'),
+    ('x = a -= 1 + 2', '(x = (a -= (1 + 2)))'),
+])
+def test_precedence(engine, expr, expected):
+    assert _sexpr(_body(expr + ';', engine)[0]) == expected
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_compound_assignment(engine):
+    tree = my_parser.parse('''class A {
+        int f(int n) { int s = 0; for (int i = 0; i < n; i = i + 1) { s += i; } return s; }
+    }''', engine=engine)
+    loop = tree.exprs[0].body.exprs[0].body.exprs[1]
+    node = loop.body.exprs[0]
+    assert isinstance(node, OpAssignNode) and node.op is BinOp.ADD
+    assert (node.var.name, node.val.name, node.row, node.col) == ('s', 'i', 2, 72)
+    assert analyze(tree) == [] and node.node_type is TypeDesc.INT
+    assert lint(tree) == []
+    # в код Python составные присваивания не переводятся
+    assert [error.msg for error in compile_class(tree.exprs[0]).errors] == ['Unsupported expression: +=']
+
+
+def test_compound_assignment_target():
+    tree = my_parser.parse('class A { int f(int n) { n + 1 -= 2; return n; } }', engine='fast')
+    assert [str(error) for error in analyze(tree)] == ["Left side of '-=' must be a variable (at 1:27)"]
+
+
+def test_long_chain_without_recursion():
+    expr = ' + '.join(['a'] * 20000) + ' += 1'
+    node = _body(expr + ';', 'fast')[0]
+    assert isinstance(node, OpAssignNode) and isinstance(node.var, BinOpNode)
+
+
+def test_unknown_props_go_to_extra():
+    node = IdentNode('a', row=1, col=2, mark=5)
+    assert node._extra == {'mark': 5} and node.mark == 5
+    assert not hasattr(node, '__dict__')
+    # семантические поля тоже лежат в _extra, а не в слотах
+    node.node_type = TypeDesc.INT
+    assert node._extra == {'mark': 5, 'node_type': TypeDesc.INT}
+    with pytest.raises(AttributeError):
+        node.missing
+    assert IdentNode('b')._extra is None
+
+
+@pytest.mark.parametrize('clone', [copy.copy, copy.deepcopy, lambda node: pickle.loads(pickle.dumps(node))])
+def test_extra_survives_copy(clone):
+    tree = my_parser.parse('class A { int f() { return 1 + x; } }', engine='fast')
+    expr = tree.exprs[0].body.exprs[0].body.exprs[0].val
+    expr._set_extra('mark', [1])
+    expr.node_type = TypeDesc.INT
+    new = clone(expr)
+    assert (new.mark, new.node_type, str(new), new.row, new.col) == ([1], TypeDesc.INT, '+', 1, 29)
+    assert new.arg2.name == 'x'
+    # запись в копию не меняет оригинал
+    new._set_extra('other', 2)
+    assert 'other' not in expr._extra
+
+
+def test_extra_survives_transform():
+    class Rename(NodeTransformer):
+        def visit_IdentNode(self, node):
+            return IdentNode(node.name.upper(), node.row, node.col, **node._extra) if node._extra else node
+
+    tree = my_parser.parse('int a = b + c;', engine='fast')
+    stmt = tree.exprs[0]
+    add = stmt.vars[0].val
+    add._set_extra('mark', 1)
+    add.arg1._set_extra('mark', 2)
+    assert Rename().transform(tree) is tree
+    assert stmt.vars[0].val is add and add.mark == 1
+    assert (add.arg1.name, add.arg1.mark, add.arg1.col) == ('B', 2, 10)
+    assert add.arg2.name == 'c' and add.arg2._extra is None
+
+
+TREE_PROG = 'class A { int f(int n) { return n * (n + 1); } }\nint a = b + c * d;'
+
+
+def _depth(line):
+    # глубина узла в строке iter_tree: по два символа префикса на уровень
+    return (len(line) - len(line.lstrip('│├└ '))) // 2
+
+
+def test_iter_tree_without_limits():
+    tree = my_parser.parse(TREE_PROG, engine='fast')
+    full = list(tree.iter_tree())
+    assert full == list(tree.tree) and TREE_TRUNCATED not in '\n'.join(full)
+    assert list(tree.iter_tree(max_depth=100, max_nodes=len(full))) == full
+
+
+@pytest.mark.parametrize('max_depth', [0, 1, 2, 4])
+def test_iter_tree_max_depth(max_depth):
+    tree = my_parser.parse(TREE_PROG, engine='fast')
+    full = list(tree.iter_tree())
+    lines = list(tree.iter_tree(max_depth=max_depth))
+    # выводятся все узлы не глубже max_depth, а под каждым узлом с отброшенными детьми - (...)
+    assert [line for line in lines if not line.endswith(TREE_TRUNCATED)] == \
+        [line for line in full if _depth(line) <= max_depth]
+    truncated = [i for i, line in enumerate(lines) if line.endswith(TREE_TRUNCATED)]
+    assert truncated and all(_depth(lines[i]) == max_depth + 1 and _depth(lines[i - 1]) <= max_depth
+                             for i in truncated)
+
+
+@pytest.mark.parametrize('max_nodes', [0, 1, 5, 12])
+def test_iter_tree_max_nodes(max_nodes):
+    tree = my_parser.parse(TREE_PROG, engine='fast')
+    full = list(tree.iter_tree())
+    lines = list(tree.iter_tree(max_nodes=max_nodes))
+    assert lines[:-1] == full[:max_nodes]
+    assert lines[-1].endswith(TREE_TRUNCATED)
+    assert _depth(lines[-1]) == _depth(full[max_nodes])
+
+
+def test_write_tree():
+    tree = my_parser.parse(TREE_PROG, engine='fast')
+    for limits in ((None, None), (1, None), (None, 3), (2, 7)):
+        file = io.StringIO()
+        tree.write_tree(file, *limits)
+        assert file.getvalue() == ''.join(line + '\n' for line in tree.iter_tree(*limits))
+    # глубокое дерево выводится без рекурсии
+    deep = my_parser.parse('int x = ' + ' + '.join(['a'] * 5000) + ';', engine='fast')
+    file = io.StringIO()
+    deep.write_tree(file, max_nodes=10000)
+    assert file.getvalue().count('\n') == 10001
@@ -0,0 +1,107 @@
+import os
+
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.arena import AstArena
+from compiler_demo.cache import CACHE_SUFFIX, EVICT_CHECK_INTERVAL, ParseCache
+from compiler_demo.my_parser import GRAMMAR_VERSION
+
+PROGRAM = 'class A { int f(int n) { return n + 1; } }'
+TAG = 'fast-{}'.format(GRAMMAR_VERSION)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ParseCache(str(tmp_path))
+
+
+def _entry(cache, prog=PROGRAM, tag=TAG):
+    return cache._path(cache.key(prog, tag))
+
+
+def test_hit_returns_equal_tree(cache):
+    tree = my_parser.parse(PROGRAM, engine='fast', cache=cache)
+    assert os.path.exists(_entry(cache))
+    cached = cache.get(PROGRAM, TAG)
+    assert cached is not None
+    assert cached.tree == tree.tree
+
+
+def test_miss_for_other_text_or_tag(cache):
+    my_parser.parse(PROGRAM, engine='fast', cache=cache)
+    assert cache.get(PROGRAM + ' ', TAG) is None
+    assert cache.get(PROGRAM, 'other') is None
+
+
+@pytest.mark.parametrize('corrupt', [
+    lambda data: b'',
+    lambda data: data[:10],
+    lambda data: data[:len(data) // 2],
+    lambda data: data[:-1],
+    lambda data: data + b'\0\0\0\0',
+    lambda data: b'XXXX' + data[4:],
+])
+def test_corrupt_entry_is_a_miss_and_removed(cache, corrupt):
+    tree = my_parser.parse(PROGRAM, engine='fast', cache=cache)
+    path = _entry(cache)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(corrupt(data))
+    assert cache.get(PROGRAM, TAG) is None
+    assert not os.path.exists(path)
+    # следующий разбор снова заполняет кэш
+    assert my_parser.parse(PROGRAM, engine='fast', cache=cache).tree == tree.tree
+    assert cache.get(PROGRAM, TAG) is not None
+
+
+def test_evict_keeps_size_limit(tmp_path):
+    cache = ParseCache(str(tmp_path), max_size=1)
+    for i in range(3):
+        my_parser.parse('class A{} ' * (i + 1), engine='fast', cache=cache)
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.ast')]
+
+
+def test_get_closes_mmap_while_arena_is_alive(cache, monkeypatch):
+    # ссылки на arena после загрузки (например, из трассировки) не мешают закрыть mmap
+    arenas = []
+    to_tree = AstArena.to_tree
+
+    def keep_arena(self):
+        arenas.append(self)
+        return to_tree(self)
+
+    tree = my_parser.parse(PROGRAM, engine='fast', cache=cache)
+    monkeypatch.setattr(AstArena, 'to_tree', keep_arena)
+    cached = cache.get(PROGRAM, TAG)
+    assert arenas and cached is not None and cached.tree == tree.tree
+    assert os.path.exists(_entry(cache))
+
+
+def test_evict_scans_directory_only_over_threshold(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path), max_size=10 ** 6)
+    scans = []
+    evict = ParseCache.evict
+    monkeypatch.setattr(ParseCache, 'evict', lambda self: (scans.append(1), evict(self)))
+    for i in range(10):
+        my_parser.parse('class A{} ' * (i + 1), engine='fast', cache=cache)
+    # размер каталога неизвестен только до первой записи
+    assert len(scans) == 1
+    cache.max_size = 1
+    my_parser.parse('class B{}', engine='fast', cache=cache)
+    assert len(scans) == 2
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.ast')]
+
+
+def test_evict_rescans_periodically(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path), max_size=10 ** 6)
+    my_parser.parse('class A{}', engine='fast', cache=cache)
+    # запись другого процесса в тот же каталог учитывается при следующем просмотре
+    with open(os.path.join(str(tmp_path), 'other' + CACHE_SUFFIX), 'wb') as f:
+        f.write(b'\0' * 2 * 10 ** 6)
+    for i in range(EVICT_CHECK_INTERVAL - 1):
+        my_parser.parse('class A{} ' * (i + 2), engine='fast', cache=cache)
+    assert os.path.exists(os.path.join(str(tmp_path), 'other' + CACHE_SUFFIX))
+    my_parser.parse('class C{}', engine='fast', cache=cache)
+    assert not os.path.exists(os.path.join(str(tmp_path), 'other' + CACHE_SUFFIX))
@@ -0,0 +1,118 @@
+import math
+
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.analyzer import analyze
+from compiler_demo.ast import *
+from compiler_demo.codegen import compile_class, compile_func, CompileError
+from compiler_demo.folding import fold_constants
+
+PROGRAM = '''class M {
+    int counter = 10;
+    double half = counter / 4.0;
+    String greet = "hi " + counter;
+    int fib(int n) { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); }
+    int sum(int n) {
+        int s = 0;
+        for (int i = 0; i < n; i = i + 1) { if (i % 3 == 0) { continue; } s = s + i; }
+        return s;
+    }
+    int ovf() { int x = 2147483647; x = x + 1; return x; }
+    int div(int a, int b) { return a / b; }
+    int rem(int a, int b) { return a % b; }
+    long cube(long a) { return a * a * a; }
+    double dd(int a) { double d = a; return d / 0; }
+    String cat(int a, double d, boolean b) { return "a=" + a + " d=" + d + " b=" + b + " n=" + null; }
+    int inc() { counter = counter + 1; return counter; }
+    int loops(int n) {
+        int c = 0;
+        for (int i = 0; i < n; i = i + 1) { for (int j = 0; ; j = j + 1) { if (j >= i) { break; } c = c + 1; } }
+        return c;
+    }
+    boolean logic(int a) { return a > 1 && a < 10 || a == 42; }
+    boolean same(String s) { return s == "x"; }
+    void bad() { Foo f = new Foo(); }
+}
+'''
+
+
+@pytest.fixture
+def tree():
+    tree = my_parser.parse(PROGRAM, engine='fast')
+    analyze(tree)
+    return tree
+
+
+@pytest.fixture
+def compiled(tree):
+    return compile_class(tree.exprs[0])
+
+
+def _method(tree, name):
+    return next(stmt for stmt in tree.exprs[0].body.exprs if isinstance(stmt, FuncNode) and stmt.name.name == name)
+
+
+@pytest.mark.parametrize('name, args, expected', [
+    ('fib', (20,), 6765),
+    ('sum', (10,), 27),
+    ('ovf', (), -2147483648),
+    ('div', (-7, 2), -3),
+    ('rem', (-7, 2), -1),
+    ('rem', (7, -2), 1),
+    ('div', (-2147483648, -1), -2147483648),
+    ('cube', (3000000,), 8553255926290448384),  # 27 * 10**18 по модулю 2**64
+    ('dd', (1,), math.inf),
+    ('dd', (-1,), -math.inf),
+    ('cat', (5, 2.5, True), 'a=5 d=2.5 b=true n=null'),
+    ('loops', (5,), 10),
+    ('logic', (5,), True),
+    ('logic', (42,), True),
+    ('logic', (11,), False),
+    ('same', ('x',), True),
+])
+def test_java_semantics(compiled, name, args, expected):
+    assert getattr(compiled, name)(*args) == expected
+
+
+def test_fields(compiled):
+    assert (compiled.counter, compiled.half, compiled.greet) == (10, 2.5, 'hi 10')
+    assert compiled.inc() == 11 and compiled.inc() == 12 and compiled.counter == 12
+
+
+def test_division_by_zero(compiled):
+    with pytest.raises(ZeroDivisionError):
+        compiled.div(1, 0)
+    assert math.isnan(compiled.dd(0))
+
+
+def test_unsupported_method(compiled):
+    assert len(compiled.errors) == 1
+    with pytest.raises(CompileError):
+        compiled.bad()
+
+
+def test_compile_func(tree):
+    assert compile_func(_method(tree, 'fib'))(10) == 55
+
+
+def test_cached_code_follows_in_place_edits(tree):
+    div = _method(tree, 'div')
+    assert compile_class(tree.exprs[0]).div(7, 2) == 3
+    div.body.exprs[0].val.op = BinOp.MUL
+    assert compile_class(tree.exprs[0]).div(7, 2) == 14
+
+
+def test_cached_code_follows_folding():
+    tree = my_parser.parse('class A { int f(int n) { return n * (2 + 3); } }', engine='fast')
+    analyze(tree)
+    func = tree.exprs[0].body.exprs[0]
+    assert compile_func(func)(2) == 10
+    assert fold_constants(tree).folded == 1
+    code = func.compiled[2]
+    assert compile_func(func)(2) == 10
+    assert func.compiled[2] is not code
+    # без изменений дерева код берется из кэша
+    code = func.compiled[2]
+    assert compile_func(func)(3) == 15
+    assert func.compiled[2] is code
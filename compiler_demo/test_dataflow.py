@@ -0,0 +1,84 @@
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.analyzer import analyze
+from compiler_demo.dataflow import build_cfg, DEF, lint, lint_func
+
+
+def _lint(body, params='int n'):
+    tree = my_parser.parse('class L {{\n  int m({}) {{\n{}\n  }}\n}}'.format(params, body), engine='fast')
+    assert analyze(tree) == []
+    return [(w.msg, w.node.row) for w in lint(tree)]
+
+
+def _method(body, params='int n'):
+    tree = my_parser.parse('class L {{ int m({}) {{ {} }} }}'.format(params, body), engine='fast')
+    assert analyze(tree) == []
+    return tree.exprs[0].body.exprs[0]
+
+
+@pytest.mark.parametrize('body, expected', [
+    # строки тела метода начинаются с 3
+    ('int x;\nif (n > 0) { x = 1; }\nreturn x;', [("Variable 'x' might not have been initialized", 5)]),
+    ('int x;\nif (n > 0) { x = 1; } else { x = 2; }\nreturn x;', []),
+    ('int q = q + 1;\nreturn q;', [("Variable 'q' might not have been initialized", 3)]),
+    ('int unused = 5;\nreturn n;', [("Variable 'unused' is never used", 3)]),
+    ('int s = 0;\ns = 5;\nreturn s;', [("Value assigned to 's' is never used", 3)]),
+    # значение параметра приходит от вызывающего: перезапись до чтения не отмечается, лишняя запись - да
+    ('n = 5;\nreturn n;', []),
+    ('n = 5;\nn = 6;\nreturn n;', [("Value assigned to 'n' is never used", 3)]),
+    ('return n;\nn = 2;\nn = 3;', [('Unreachable statement', 4)]),
+    ('if (n > 1) { return 1; } else { return 2; }\nn = 3;', [('Unreachable statement', 4)]),
+    ('for (int i = 0; i < n; i = i + 1) {\nif (i > 3) { break; n = 7; }\ncontinue;\nn = 8;\n}\nreturn n;',
+     [('Unreachable statement', 4), ('Unreachable statement', 6)]),
+    ('int s = 0;\nfor (;;) { s = s + 1; if (s > n) { return s; } }\nreturn 0;', [('Unreachable statement', 5)]),
+    ('for (int i = 0; i < n; i = i + 1) {\nint t;\nif (i > 1) { t = i; }\nn = t;\n}\nreturn n;',
+     [("Variable 't' might not have been initialized", 6)]),
+])
+def test_lint_rules(body, expected):
+    assert _lint(body) == expected
+
+
+@pytest.mark.parametrize('body', [
+    'for (int i = 0; i < n; i = i + 1) { return i; }\nreturn -1;',
+    'int r = 0;\nfor (int i = 0; i < n; i = i + 1) { r = i; break; }\nreturn r;',
+    'for (int i = 0; i < n; i = i + 1) { if (i > 2) { return i; } else { break; } }\nreturn 0;',
+])
+def test_unreachable_for_step_is_not_reported(body):
+    # javac принимает такие циклы: шаг не отдельная инструкция
+    assert _lint(body) == []
+
+
+def test_whole_loop_after_return_is_reported():
+    assert _lint('return n;\nfor (int i = 0; i < n; i = i + 1) { n = 1; }') == [('Unreachable statement', 4)]
+
+
+def test_lint_func_accepts_built_cfg():
+    func = _method('int x; return x;')
+    cfg = build_cfg(func)
+    assert [str(w) for w in lint_func(func, cfg)] == [str(w) for w in lint_func(func)]
+
+
+def test_reaching_definitions_and_liveness():
+    func = _method('int x = 1; if (n > 0) { x = 2; } return x + n;')
+    cfg = build_cfg(func)
+    order = cfg.reverse_postorder()
+    assert order[0] == cfg.entry.index and cfg.exit.index in order
+    reaching_in, _ = cfg.reaching_definitions(order)
+    ret_block = next(block for block in cfg.blocks if any(type(s).__name__ == 'ReturnNode' for s in block.stmts))
+    # до return доходят оба присваивания x (и параметр n)
+    x_index = next(index for index, ident in cfg.variables.items() if ident.name == 'x')
+    x_defs = [i for i, (var, _, assigned) in enumerate(cfg.definitions) if var == x_index and assigned]
+    assert len(x_defs) == 2
+    assert all(reaching_in[ret_block.index] >> i & 1 for i in x_defs)
+    # параметры и x определяются во входном блоке, на его входе ничего не живо
+    live_in, live_out = cfg.liveness(order)
+    n_index = next(index for index, ident in cfg.variables.items() if ident.name == 'n')
+    assert live_in[cfg.entry.index] == 0
+    assert live_out[cfg.entry.index] >> n_index & 1 == 1
+    assert sum(1 for block in cfg.blocks for event in block.events if event[0] == DEF) == len(cfg.definitions)
+
+
+def test_long_method_is_linted_without_recursion():
+    body = ' '.join('int v{0} = {0}; n = n + v{0};'.format(i) for i in range(3000)) + ' return n;'
+    assert lint_func(_method(body)) == []
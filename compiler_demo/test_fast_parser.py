@@ -0,0 +1,186 @@
+import ast as py_ast
+import pathlib
+from bisect import bisect_left, bisect_right
+from functools import partial
+
+import pytest
+
+from compiler_demo import fast_parser, my_parser
+from compiler_demo.ast import *
+from compiler_demo.fast_parser import EXPR_OPS
+from compiler_demo.lexer import ParseError, split_top_level, tokenize
+from compiler_demo.visitor import walk
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+def _main_samples():
+    # тексты test1..test4 из main.py
+    module = py_ast.parse((ROOT / 'main.py').read_text(encoding='utf-8'))
+    return {node.targets[0].id: node.value.value for node in py_ast.walk(module)
+            if isinstance(node, py_ast.Assign) and isinstance(node.value, py_ast.Constant)
+            and isinstance(node.value.value, str)}
+
+
+SAMPLES = dict(_main_samples(), java_example=(ROOT / 'java_example.java').read_text(encoding='utf-8'))
+SAMPLES.update(
+    full='''// все виды инструкций
+class A {
+    int x = 1, y;
+    String s = "a\\"b" + s;
+    public static double f(int a, double b) {
+        A o = new A(a, b);
+        for (int i = 0; i < a; i = i + 1) { if (i >= 2 && i != 3) { break; } }
+        if (a == 1) { return a.b().c; } else { x *= 2 + a % 3; y += x -= 1; }
+        for (;;) { break; }
+        return -1.5e3 + value;
+    }
+    class B { void g() { f(1, 2.0); } }
+}
+''',
+    bad_expr='class A { int f() { return 1 + ; } }\nclass B { }',
+    bad_params='class A { }\n// c\nclass B { int f( { } }',
+    bad_literal='class A { }\n/* c */ class B { int x = 2147483648; }',
+)
+
+
+def _parse(prog, engine):
+    try:
+        return my_parser.parse(prog, engine=engine), None
+    except Exception as e:
+        return None, e
+
+
+@pytest.mark.parametrize('name', SAMPLES)
+def test_engines_agree(name):
+    prog = SAMPLES[name]
+    (fast, fast_error), (reference, reference_error) = _parse(prog, 'fast'), _parse(prog, 'pyparsing')
+    assert (fast is None) == (reference is None)
+    locs = list(tokenize(prog).locs)
+    if fast is not None:
+        assert fast.tree == reference.tree
+        for node, expected in zip(walk(fast), walk(reference)):
+            # pyparsing может дать позицию пробелов перед первой лексемой узла
+            loc = getattr(expected, 'loc', None)
+            assert getattr(node, 'loc', None) == (locs[bisect_left(locs, loc)] if loc is not None else None)
+        return
+    # pyparsing сообщает об ошибке на первой лексеме инструкции верхнего уровня, в которой ее нашел
+    # быстрый движок, или там же, где он, если это ошибка без отката
+    starts = [locs[0]] + [locs[bisect_left(locs, end)] for end in split_top_level(prog)]
+    statement_start = starts[bisect_right(starts, fast_error.loc) - 1]
+    assert reference_error.loc in (fast_error.loc, statement_start)
+
+
+def test_samples_cover_both_outcomes():
+    failed = {name for name, prog in SAMPLES.items() if _parse(prog, 'fast')[0] is None}
+    assert failed == {'test1', 'test2', 'java_example', 'bad_expr', 'bad_params', 'bad_literal'}
+
+
+@pytest.mark.parametrize('op', sorted(EXPR_OPS))
+def test_every_expression_operator_builds_a_node(op):
+    chain = BinOpChain(IdentNode('a'), 0)
+    chain.push(op, IdentNode('b'), 4)
+    node = chain.result()
+    assert isinstance(node, (BinOpNode, OpAssignNode)) and str(node) == op
+
+
+def _funcs(tree):
+    # функции в порядке текста; обход не заходит в тела (обращение к body разобрало бы их)
+    funcs = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, FuncNode):
+            funcs.append(node)
+        else:
+            stack.extend(reversed(list(node.iter_child_nodes())))
+    return funcs
+
+
+def _locs(tree):
+    return [(type(node).__name__, node.loc, node.row, node.col)
+            for node in walk(tree) if isinstance(getattr(node, 'loc', None), int)]
+
+
+OUTLINE_SAMPLES = [
+    SAMPLES['full'],
+    'class A {\n  int f(int n) { for (int i = 0; i < n; i = i + 1) { { } } return n; }\n'
+    '  class B { void g() { f(1); } }\n}\nclass C { int x = 1; double h() { return x; } }',
+]
+
+
+@pytest.mark.parametrize('prog', OUTLINE_SAMPLES)
+@pytest.mark.parametrize('prelex', [False, True])
+def test_outline_bodies_match_full_parse(prog, prelex):
+    expected = my_parser.parse(prog, engine='fast')
+    tree = my_parser.parse(prog, engine='fast', outline=True, prelex=prelex)
+    funcs = _funcs(tree)
+    assert funcs and not any(func.body_loaded for func in funcs)
+    # тела разбираются по одному и в любом порядке
+    for func, expected_func in reversed(list(zip(funcs, _funcs(expected)))):
+        assert func.body.tree == expected_func.body.tree
+        assert func.body_loaded
+    assert tree.tree == expected.tree
+    assert _locs(tree) == _locs(expected)
+
+
+def test_outline_error_in_body_is_deferred():
+    prog = 'class A {\n  int f() { return 1; }\n  int g() { return 1 + ; }\n}'
+    with pytest.raises(ParseError) as expected:
+        my_parser.parse(prog, engine='fast')
+    tree = my_parser.parse(prog, engine='fast', outline=True)
+    f, g = _funcs(tree)
+    assert str(f.body.exprs[0].val) == '1'
+    with pytest.raises(ParseError) as error:
+        g.body
+    assert (error.value.loc, error.value.msg) == (expected.value.loc, expected.value.msg)
+    # ошибка в структуре классов обнаруживается сразу
+    with pytest.raises(ParseError):
+        my_parser.parse('class A { int f() { { }', engine='fast', outline=True)
+
+
+CHOICES = {name: getattr(fast_parser, name) for name in dir(fast_parser)
+           if isinstance(getattr(fast_parser, name), fast_parser.Choice)}
+# начала правил, в том числе лексемы, которые входят в FIRST нескольких альтернатив
+# (имя перед '(' или '=', тип перед именем, new, true, +/- перед числом, public)
+CHOICE_INPUTS = [
+    'new A()', 'new A().b', 'a = 1', 'a += 1', 'a(1)', 'a(1).b', 'a', 'a.b', 'a.b()', 'a == b', 'a;', '1', '-1',
+    '- a', '+ 1', 'true', 'trueValue', 'true.x', '(a)', '(a) + 1', 'int a', 'int a = 1', 'int a, b;', 'int[] a',
+    'int f() { }', 'int f();', 'static int f() { }', 'class A { }', 'public class A { }', 'public int a;',
+    'public int f() { }', 'public = 1', 'new = 1', '{ }', '{ a; }', 'return 1', 'return', 'if (a) { }',
+    'for (;;) { }', 'class', 'a b c', ';', '', ')',
+]
+
+
+def _choose_result(choice, prog, fallback):
+    parser = fast_parser.Parser(prog)
+    try:
+        if fallback:
+            # упорядоченный выбор из всех альтернатив, без таблицы FIRST
+            node = parser.first_of(*(partial(rule, parser) for _, rule in choice.alts))
+        else:
+            node = parser.choose(choice)
+    except ParseError:
+        return None
+    return type(node), node.tree, parser.pos
+
+
+@pytest.mark.parametrize('name', sorted(CHOICES))
+def test_choice_table_picks_same_branch_as_fallback(name):
+    choice = CHOICES[name]
+    results = [_choose_result(choice, prog, False) for prog in CHOICE_INPUTS]
+    assert results == [_choose_result(choice, prog, True) for prog in CHOICE_INPUTS]
+    assert any(results) and not all(results)
+    # в таблице альтернативы идут в порядке грамматики
+    for rules in choice.table.values():
+        order = [rule for _, rule in choice.alts if rule in rules]
+        assert list(rules) == order
+
+
+def test_choice_table_keeps_overlapping_alternatives():
+    stmt = fast_parser.STMT
+    # тип и имя: сначала функция, потом объявление переменных, потом выражение
+    assert [rule.__name__ for rule in stmt.candidates('ident', 'ident')] == ['func', 'rule_semi', 'rule_semi']
+    assert stmt.candidates('ident', 'ident')[0] is fast_parser.Parser.func
+    assert fast_parser.GROUP.candidates('-', 'literal') == (fast_parser.Parser.literal,)
+    assert fast_parser.GROUP.candidates('-', 'ident') == ()
@@ -0,0 +1,157 @@
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.analyzer import analyze
+from compiler_demo.ast import *
+from compiler_demo.folding import ConstantFolder, fold_constants, fold_files, fold_values
+from compiler_demo.semantic import BaseType
+from compiler_demo.visitor import walk
+
+PROGRAM = 'class A {{ double f(int i, double d, boolean b, String s) {{ return {}; }} boolean g() {{ return true; }} }}'
+
+
+def _fold(expr, analyzed=False):
+    # свертка выражения из return; analyzed - после семантического анализа (тогда известны типы)
+    tree = my_parser.parse(PROGRAM.format(expr), engine='fast')
+    if analyzed:
+        assert analyze(tree) == []
+    stats = fold_constants(tree)
+    return tree.exprs[0].body.exprs[0].body.exprs[0].val, stats
+
+
+def _shape(node):
+    # узлы дерева в прямом порядке, без семантических полей
+    return ' '.join(line.split(' : ')[0].strip('│├└ ') for line in node.tree)
+
+
+def _fold_literals(op, literal1, literal2):
+    # узлы с литералами long и float (в исходном тексте суффиксов L и f грамматика не знает)
+    node = BinOpNode(op, LiteralNode(literal1), LiteralNode(literal2))
+    return ConstantFolder().fold(node)
+
+
+@pytest.mark.parametrize('expr, expected', [
+    ('2147483647 + 1', '-2147483648'),
+    ('-2147483648 - 1', '2147483647'),
+    ('65536 * 65536', '0'),
+    ('2147483647 * 2', '-2'),
+    ('-2147483648 / -1', '-2147483648'),
+])
+def test_int_overflow_wraps(expr, expected):
+    assert _shape(_fold(expr)[0]) == expected
+
+
+@pytest.mark.parametrize('op, literal1, literal2, expected', [
+    (BinOp.ADD, '9223372036854775807L', '1', '-9223372036854775808L'),
+    (BinOp.MUL, '4294967296L', '4294967296L', '0L'),
+    (BinOp.SUB, '-9223372036854775808L', '1L', '9223372036854775807L'),
+    # int + long вычисляется в long и не переполняется
+    (BinOp.ADD, '2147483647', '1L', '2147483648L'),
+])
+def test_long_overflow_wraps(op, literal1, literal2, expected):
+    assert _fold_literals(op, literal1, literal2).literal == expected
+
+
+@pytest.mark.parametrize('expr, expected', [
+    ('7 / 2', '3'), ('-7 / 2', '-3'), ('7 / -2', '-3'), ('-7 / -2', '3'),
+    ('7 % 2', '1'), ('-7 % 2', '-1'), ('7 % -2', '1'), ('-7 % -2', '-1'),
+    ('-7.5 % 2', '-1.5'), ('7.5 % -2', '1.5'),
+])
+def test_division_truncates_toward_zero(expr, expected):
+    assert _shape(_fold(expr)[0]) == expected
+
+
+def test_long_division_truncates_toward_zero():
+    assert _fold_literals(BinOp.DIV, '-7L', '2').literal == '-3L'
+    assert _fold_literals(BinOp.MOD, '-7L', '2L').literal == '-1L'
+
+
+@pytest.mark.parametrize('op, literal1, literal2, expected', [
+    (BinOp.ADD, '1.1f', '2.2f', 3.3000001907348633),
+    (BinOp.MUL, '0.1f', '3', 0.30000001192092896),
+    # 2**24 + 1 не представимо во float
+    (BinOp.ADD, '16777216f', '1f', 16777216.0),
+])
+def test_float_is_rounded_to_32_bits(op, literal1, literal2, expected):
+    literal = _fold_literals(op, literal1, literal2)
+    assert literal.type is TypeDesc.FLOAT and literal.value == expected
+    assert literal.literal == repr(expected) + 'f'
+    # в double те же операнды дают другой результат
+    assert fold_values(op, 1.1, BaseType.DOUBLE, 2.2, BaseType.DOUBLE)[0] != expected
+
+
+@pytest.mark.parametrize('expr', ['1 / 0', '1 % 0', 'i / 0', '1.0 / 0', '0.0 / 0.0', '"a" + 1.5'])
+def test_not_folded(expr):
+    node, stats = _fold(expr)
+    assert isinstance(node, BinOpNode) and stats.folded == 0
+    assert stats.nodes_before == stats.nodes_after
+
+
+def test_float_overflow_not_folded():
+    assert isinstance(_fold_literals(BinOp.ADD, '3.4e38f', '3.4e38f'), BinOpNode)
+
+
+@pytest.mark.parametrize('expr, analyzed, expected', [
+    # тождества для вещественных и строк неверны: -0.0 + 0 == 0.0, s + 0 - сцепление
+    ('d + 0', True, '+ d 0'),
+    ('0 + d', True, '+ 0 d'),
+    ('s + 0', True, '+ s 0'),
+    # без анализа тип x неизвестен
+    ('i + 0', False, '+ i 0'),
+    # вызов слева вычисляется всегда, поэтому не отбрасывается
+    ('g() && false', True, '&& call g params false'),
+    ('g() || true', True, '|| call g params true'),
+])
+def test_identities_that_must_not_fire(expr, analyzed, expected):
+    node, stats = _fold(expr, analyzed)
+    assert _shape(node) == expected
+    assert stats.folded == 0
+
+
+@pytest.mark.parametrize('expr, expected', [
+    ('i + 0', 'i'), ('0 + i', 'i'), ('d - 0', 'd'), ('d * 1', 'd'), ('1 * d', 'd'), ('d / 1', 'd'),
+    ('b && true', 'b'), ('b || false', 'b'),
+    # правая часть в Java не вычисляется, поэтому вызов можно отбросить
+    ('false && g()', 'false'), ('true || g()', 'true'),
+    ('(i + 1) + 2', '+ i 3'),
+])
+def test_identities_that_fire(expr, expected):
+    node, stats = _fold(expr, analyzed=True)
+    assert _shape(node) == expected
+    assert stats.folded == 1
+
+
+def _count(prog):
+    return sum(1 for _ in walk(my_parser.parse(prog, engine='fast')))
+
+
+def test_fold_files_reports_node_reduction(tmp_path):
+    # исходный текст и тот же текст после свертки
+    sources = {
+        'a.java': ('class A { int x = 1 + 2 * 3; int y = 2147483647 + 1; int z = x / 0; }',
+                   'class A { int x = 7; int y = -2147483648; int z = x / 0; }'),
+        'b.java': ('class B { int f(int n) { return n; } }', 'class B { int f(int n) { return n; } }'),
+    }
+    paths = []
+    for name, (source, _) in sources.items():
+        path = tmp_path / name
+        path.write_text(source, encoding='utf-8')
+        paths.append(str(path))
+    stats = fold_files(paths)
+    assert list(stats) == paths
+    for path, (source, folded) in zip(paths, sources.values()):
+        assert (stats[path].nodes_before, stats[path].nodes_after) == (_count(source), _count(folded))
+    a, b = stats[paths[0]], stats[paths[1]]
+    # 1 + 2 * 3 -> 7 (два выражения, 4 узла), 2147483647 + 1 -> -2147483648 (2 узла); x / 0 остается
+    assert (a.nodes_before - a.nodes_after, a.folded) == (6, 3)
+    assert a.reduction == pytest.approx(6 / a.nodes_before)
+    assert str(a) == '{} -> {} nodes (-{:.1%}), 3 expressions folded'.format(
+        a.nodes_before, a.nodes_after, a.reduction)
+    assert b.folded == 0 and b.reduction == 0.0
+
+
+def test_folded_literal_keeps_position():
+    tree = my_parser.parse('int a = 1;\nint b = 20 + 30;', engine='fast')
+    fold_constants(tree)
+    literal = tree.exprs[1].vars[0].val
+    assert (literal.literal, literal.row, literal.col) == ('50', 2, 10)
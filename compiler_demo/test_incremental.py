@@ -0,0 +1,69 @@
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.incremental import reparse, TextEdit
+from compiler_demo.lexer import ParseError
+from compiler_demo.visitor import walk
+
+PROGRAM = '''class A {
+    int x = 1;
+    int f(int n) {
+        int s = n + 1;
+        return s;
+    }
+    int g() { return 2; }
+}
+class B {
+    int h() { return 3; }
+}
+'''
+
+
+def _edit(anchor, removed, inserted, shift=0):
+    return TextEdit(PROGRAM.index(anchor) + shift, removed, inserted)
+
+
+def _locs(tree):
+    return [(type(node).__name__, getattr(node, 'loc', None), node.row, node.col) for node in walk(tree)]
+
+
+@pytest.mark.parametrize('edit', [
+    _edit('n + 1', 5, 'n * 2 + 1'),           # выражение в теле метода
+    _edit('return s;', 0, 'int t = 0;\n        '),  # новая инструкция
+    _edit('return 2;', 9, 'return 20;'),      # тело метода в одну строку
+    _edit('int g()', 0, 'int k;\n    '),      # новый член класса
+    _edit('return 3;', 0, '// comment\n        '),
+])
+def test_partial_reparse_matches_full_parse(edit):
+    tree = my_parser.parse(PROGRAM, engine='fast')
+    first_class = tree.exprs[0]
+    new_tree, new_prog = reparse(tree, PROGRAM, edit)
+    assert new_prog == edit.apply(PROGRAM)
+    assert new_tree is tree and tree.exprs[0] is first_class  # дерево изменено на месте
+    expected = my_parser.parse(new_prog, engine='fast')
+    assert new_tree.tree == expected.tree
+    assert _locs(new_tree) == _locs(expected)
+
+
+def test_edit_outside_bodies_falls_back_to_full_parse():
+    edit = _edit('class B', 7, 'class C')
+    tree = my_parser.parse(PROGRAM, engine='fast')
+    new_tree, new_prog = reparse(tree, PROGRAM, edit)
+    assert new_tree is not tree
+    assert new_tree.tree == my_parser.parse(new_prog, engine='fast').tree
+
+
+@pytest.mark.parametrize('inserted', ['// ', '/* ', '"', '{'])
+def test_edit_that_breaks_closing_brace_is_rejected(inserted):
+    # правка перед закрывающей скобкой тела f в той же строке
+    edit = _edit('    }\n    int g', 0, inserted)
+    with pytest.raises(ParseError):
+        my_parser.parse(edit.apply(PROGRAM), engine='fast')
+    with pytest.raises(ParseError):
+        reparse(my_parser.parse(PROGRAM, engine='fast'), PROGRAM, edit)
+
+
+def test_brace_inside_body_is_balanced():
+    edit = _edit('return s;', 0, 'if (n > 0) { s = 0; }\n        ')
+    tree, prog = reparse(my_parser.parse(PROGRAM, engine='fast'), PROGRAM, edit)
+    assert tree.tree == my_parser.parse(prog, engine='fast').tree
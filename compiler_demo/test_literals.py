@@ -0,0 +1,57 @@
+import math
+
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.lexer import ParseError
+from compiler_demo.literals import decode_literal
+from compiler_demo.semantic import BaseType
+
+
+@pytest.mark.parametrize('literal, value, base_type', [
+    ('0', 0, BaseType.INT),
+    ('2147483647', 2147483647, BaseType.INT),
+    ('-2147483648', -2147483648, BaseType.INT),
+    ('2147483648L', 2147483648, BaseType.LONG),
+    ('0x7fffffff', 2147483647, BaseType.INT),
+    ('0xffffffff', -1, BaseType.INT),
+    ('1.5', 1.5, BaseType.DOUBLE),
+    ('"a\\tb"', 'a\tb', BaseType.STR),
+    ("'x'", 'x', BaseType.CHAR),
+    ('true', True, BaseType.BOOL),
+])
+def test_decode(literal, value, base_type):
+    assert decode_literal(literal) == (value, base_type)
+
+
+def test_float_is_rounded_to_32_bits():
+    value, base_type = decode_literal('0.1f')
+    assert base_type is BaseType.FLOAT
+    assert value != 0.1 and math.isclose(value, 0.1, rel_tol=1e-7)
+
+
+@pytest.mark.parametrize('literal', ['2147483648', '-2147483649', '9223372036854775808L', '"abc', "'ab'"])
+def test_illegal_literal(literal):
+    with pytest.raises(ValueError):
+        decode_literal(literal)
+
+
+@pytest.mark.parametrize('prog, loc', [
+    ('int a = 2147483648;', 8),
+    ('class A { int f() { return g(1, 99999999999); } }', 32),
+    ('class A { int f() { return -2147483649; } }', 27),
+])
+def test_fast_parser_reports_literal_location(prog, loc):
+    with pytest.raises(ParseError) as info:
+        my_parser.parse(prog, engine='fast')
+    assert info.value.loc == loc
+    assert 'too large' in info.value.msg
+
+
+def test_pyparsing_reports_literal_location():
+    import pyparsing as pp
+
+    with pytest.raises(pp.ParseBaseException) as info:
+        my_parser.parse('class A { int a = 2147483648; }', engine='pyparsing')
+    assert info.value.loc == 18
+    assert 'too large' in info.value.msg
@@ -0,0 +1,271 @@
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.arena import AstArena
+from compiler_demo.ast import current_positions
+from compiler_demo.lexer import TokenStream
+from compiler_demo.positions import LineIndex
+from compiler_demo.test_fast_parser import ROOT, SAMPLES
+from compiler_demo.visitor import walk
+
+VALID = ('test3', 'test4', 'full')
+
+
+@pytest.mark.parametrize('name', VALID)
+@pytest.mark.parametrize('cache_size', [128, None])
+@pytest.mark.parametrize('prelex', [False, True])
+def test_packrat_builds_same_tree(name, cache_size, prelex):
+    prog = SAMPLES[name]
+    expected = my_parser.parse(prog)
+    tree = my_parser.parse(prog, packrat=True, packrat_cache_size=cache_size, prelex=prelex)
+    assert tree.tree == expected.tree
+    assert [node.loc for node in tree.exprs] == [node.loc for node in expected.exprs]
+
+
+def test_packrat_stats_are_not_affected_by_other_threads():
+    prog, other = SAMPLES['full'], SAMPLES['test3']
+    my_parser.parse(prog, packrat=True)
+    expected = my_parser.packrat_stats()
+    assert expected.hits and expected.misses
+    expected_other = my_parser.parse(other).tree
+    stop = threading.Event()
+    trees = []
+
+    def parse_other():
+        while not stop.is_set():
+            trees.append(my_parser.parse(other).tree)
+
+    threads = [threading.Thread(target=parse_other) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    try:
+        stats = []
+        for _ in range(10):
+            my_parser.parse(prog, packrat=True)
+            stats.append(my_parser.packrat_stats())
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert stats == [expected] * 10
+    assert trees and all(tree == expected_other for tree in trees)
+
+
+def test_clear_packrat_cache():
+    my_parser.parse(SAMPLES['test4'], packrat=True)
+    my_parser.clear_packrat_cache()
+    assert my_parser.packrat_stats() == my_parser.PackratStats(0, 0)
+
+
+def _eager_positions(prog):
+    # прежняя таблица позиций из parse(): (строка, столбец) для каждого символа
+    locs = []
+    row = col = 0
+    for ch in prog:
+        if ch == '\n':
+            row += 1
+            col = 0
+        elif ch != '\r':
+            col += 1
+        locs.append((row, col))
+    return locs
+
+
+# в каждом тексте есть узлы и на первой, и на последней строке
+POSITION_SAMPLES = [
+    SAMPLES['test3'].rstrip() + '\nint z = 0;',
+    'class A {\n\tint f(int n) {\n\t\treturn n;\n\t}\n}\nclass B { }',
+    'class A {\r\n    int x = 1;\r\n    int f() { return x; }\r\n}\r\nint y = 2;',
+    'int a = 1;\n\n  int b = a + 2;\n\tint c =\t\tb;',
+]
+
+
+@pytest.mark.parametrize('prog', POSITION_SAMPLES)
+@pytest.mark.parametrize('engine, prelex', [('pyparsing', False), ('pyparsing', True), ('fast', False)])
+def test_lazy_positions_match_eager_table(prog, engine, prelex):
+    tree = my_parser.parse(prog, engine=engine, prelex=prelex)
+    eager = _eager_positions(prog)
+    nodes = [node for node in walk(tree) if isinstance(getattr(node, 'loc', None), int)]
+    assert {1, prog.count('\n') + 1} <= {node.row for node in nodes}
+    for node in nodes:
+        row, col = eager[node.loc]
+        assert (node.row, node.col) == (row + 1, col + 1)
+
+
+@pytest.mark.parametrize('prog', POSITION_SAMPLES)
+def test_line_index(prog):
+    eager = _eager_positions(prog)
+    index = LineIndex(prog)
+    assert [index.row_col(loc) for loc in range(len(prog))] == eager
+    # индекс фрагмента считает строки и смещения относительно всего текста
+    start = prog.index('\n') + 1
+    fragment = LineIndex(prog[start:], start, 1)
+    assert [fragment.row_col(loc) for loc in range(start, len(prog))] == eager[start:]
+
+
+@pytest.mark.parametrize('prog', POSITION_SAMPLES)
+def test_positions_survive_arena_round_trip(prog):
+    tree = my_parser.parse(prog)
+    loaded = AstArena.from_bytes(AstArena.from_tree(tree, tree.positions).to_bytes()).to_tree()
+    assert [(node.row, node.col) for node in walk(loaded) if isinstance(getattr(node, 'loc', None), int)] == \
+        [(node.row, node.col) for node in walk(tree) if isinstance(getattr(node, 'loc', None), int)]
+
+
+def test_positions_are_per_thread():
+    # разбор в потоке не меняет индекс позиций текущего контекста
+    assert current_positions.get() is None
+    thread = threading.Thread(target=my_parser.parse, args=(SAMPLES['test4'],))
+    thread.start()
+    thread.join()
+    assert current_positions.get() is None
+
+
+def _positions(tree):
+    return [(node.loc, node.row, node.col) for node in walk(tree) if isinstance(getattr(node, 'loc', None), int)]
+
+
+@pytest.mark.parametrize('engine', my_parser.ENGINES)
+@pytest.mark.parametrize('processes', [False, True])
+def test_parse_many_matches_parse(engine, processes):
+    progs = [SAMPLES[name] for name in ('full', 'test3', 'test4')] + POSITION_SAMPLES
+    trees = my_parser.parse_many(progs, 2, engine, processes)
+    assert len(trees) == len(progs)
+    for tree, prog in zip(trees, progs):
+        expected = my_parser.parse(prog, engine)
+        assert tree.tree == expected.tree
+        assert _positions(tree) == _positions(expected)
+
+
+@pytest.mark.parametrize('engine', my_parser.ENGINES)
+@pytest.mark.parametrize('processes', [False, True])
+def test_parse_many_raises_parse_error(engine, processes):
+    progs = [SAMPLES['full'], SAMPLES['bad_expr'], SAMPLES['test3']]
+    with pytest.raises(Exception) as expected:
+        my_parser.parse(SAMPLES['bad_expr'], engine)
+    # ошибка из процесса-исполнителя приходит того же типа и с той же позицией
+    with pytest.raises(type(expected.value)) as error:
+        my_parser.parse_many(progs, 2, engine, processes)
+    assert (error.value.loc, error.value.msg) == (expected.value.loc, expected.value.msg)
+
+
+PARALLEL_CLASSES = ['class C{0} {{\n  int f{0}(int n) {{ return n + {0}; }}\n}}\n'.format(i) for i in range(8)]
+BAD_CLASSES = [
+    'class X { int f() { return 1 + ; } }\n',
+    '// c\nclass X { int f( { } }\n',
+    'class X {\n\tint x = 2147483648; }\n',
+]
+
+
+def _parse_error(parse, *args, **kwargs):
+    with pytest.raises(Exception) as error:
+        parse(*args, **kwargs)
+    error = error.value
+    return type(error), error.loc, error.msg, getattr(error, 'lineno', None), getattr(error, 'col', None)
+
+
+@pytest.mark.parametrize('engine', my_parser.ENGINES)
+def test_parse_parallel_matches_parse(engine):
+    prog = ''.join(PARALLEL_CLASSES) + 'int z = 1;'
+    expected = my_parser.parse(prog, engine)
+    with ThreadPoolExecutor(4) as executor:
+        tree = my_parser.parse_parallel(prog, 4, engine, executor=executor)
+    assert tree.tree == expected.tree
+    assert _positions(tree) == _positions(expected)
+    assert tree.program and tree.positions is not None
+
+
+@pytest.mark.parametrize('engine', my_parser.ENGINES)
+@pytest.mark.parametrize('bad', BAD_CLASSES)
+@pytest.mark.parametrize('index', [0, 3, 8])
+def test_parse_parallel_reports_error_in_source(engine, bad, index):
+    # ошибка в классе из любого фрагмента сообщается со смещением, строкой и столбцом во всем тексте
+    prog = ''.join(PARALLEL_CLASSES[:index]) + bad + ''.join(PARALLEL_CLASSES[index:])
+    expected = _parse_error(my_parser.parse, prog, engine)
+    with ThreadPoolExecutor(4) as executor:
+        assert _parse_error(my_parser.parse_parallel, prog, 4, engine, executor=executor) == expected
+
+
+def test_parse_parallel_in_processes():
+    prog = ''.join(PARALLEL_CLASSES[:5]) + BAD_CLASSES[0] + ''.join(PARALLEL_CLASSES[5:])
+    assert _parse_error(my_parser.parse_parallel, prog, 2, 'fast') == _parse_error(my_parser.parse, prog, 'fast')
+    prog = ''.join(PARALLEL_CLASSES)
+    assert my_parser.parse_parallel(prog, 2, 'fast').tree == my_parser.parse(prog, 'fast').tree
+
+
+PRELEX_SAMPLES = dict(SAMPLES, **{'position{}'.format(i): prog for i, prog in enumerate(POSITION_SAMPLES)})
+PRELEX_SAMPLES.update(
+    comments='/* a */ // b\nclass A { /* x */ int /* y */ f() { // z\n return 1 /* q */ + /* r */ 2; } } // end',
+    bad_after_comments='class A { } /* a */ // b\n class /* c */ B { int f( { } }',
+    bad_literal_after_comment='/* a */ class A { int x = /* b */ 2147483648; }',
+    bad_expr_in_comments='class A { int f() { return 1 /* q */ + /* r */ ; } }',
+    leading_comments='\n// x\n/* y */ int a = 1;',
+    only_comment='// only',
+    empty='',
+)
+
+
+def _parse_result(prog, engine, **kwargs):
+    try:
+        tree = my_parser.parse(prog, engine, **kwargs)
+    except Exception as e:
+        return type(e), e.loc, e.msg, getattr(e, 'lineno', None), getattr(e, 'col', None)
+    return tree.tree, _positions(tree)
+
+
+@pytest.mark.parametrize('name', PRELEX_SAMPLES)
+@pytest.mark.parametrize('engine', my_parser.ENGINES)
+def test_prelex_matches_parse(name, engine):
+    prog = PRELEX_SAMPLES[name]
+    expected = _parse_result(prog, engine)
+    assert _parse_result(prog, engine, prelex=True) == expected
+    assert _parse_result(TokenStream(prog), engine) == expected
+
+
+def test_import_does_not_build_grammar():
+    # импорт модулей и разбор быстрым движком не импортируют pyparsing и не строят грамматику
+    code = '''
+import sys
+from compiler_demo import analyzer, arena, cache, codegen, dataflow, folding, incremental, my_parser, passes, vm
+assert not my_parser._parsers
+my_parser.parse('class A { int f() { return 1; } }', engine='fast')
+assert 'pyparsing' not in sys.modules and 'compiler_demo.grammar' not in sys.modules, sorted(sys.modules)
+my_parser.parse('int a = 1;')
+assert 'compiler_demo.grammar' in sys.modules and list(my_parser._parsers) == [True]
+'''
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=str(ROOT))
+
+
+def test_get_parser_builds_grammar_once(monkeypatch):
+    from compiler_demo import grammar
+
+    calls = []
+    make_parser = grammar.make_parser
+
+    def slow_make_parser(ignore_comments=True):
+        calls.append(ignore_comments)
+        time.sleep(0.05)
+        return make_parser(ignore_comments)
+
+    monkeypatch.setattr(grammar, 'make_parser', slow_make_parser)
+    monkeypatch.setattr(my_parser, '_parsers', {})
+    barrier = threading.Barrier(8)
+    parsers = []
+
+    def get(ignore_comments):
+        barrier.wait()
+        parsers.append((ignore_comments, my_parser.get_parser(ignore_comments)))
+
+    threads = [threading.Thread(target=get, args=(i % 2 == 0,)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(calls) == [False, True]
+    assert len({(ignore_comments, id(parser)) for ignore_comments, parser in parsers}) == 2
+    assert my_parser.get_parser() is my_parser.get_parser(True)
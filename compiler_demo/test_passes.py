@@ -0,0 +1,115 @@
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.ast import *
+from compiler_demo.codegen import compile_func
+from compiler_demo.passes import DEFAULT_PASSES, Pass, PassManager
+
+PROGRAM = '''class A {
+    int f(int n) { return n * (2 + 3); n = 1; }
+    int g(int n) { int r = 0; for (int i = 0; i < n; i = i + 1) { r = i; break; } return r; }
+    int h(int n) { return n; for (int i = 0; i < n; i = i + 1) { n = n + 1; } }
+}
+'''
+
+
+def _parse(prog=PROGRAM):
+    return my_parser.parse(prog, engine='fast')
+
+
+def _names(pm):
+    return [s.name for s in pm.stats]
+
+
+def _method(tree, name):
+    return next(stmt for stmt in tree.exprs[0].body.exprs if isinstance(stmt, FuncNode) and stmt.name.name == name)
+
+
+def test_requirements_run_once_and_are_cached():
+    pm, tree = PassManager(), _parse()
+    assert [str(w) for w in pm.get(tree, 'lint')] == ['Unreachable statement (at 2:41)', 'Unreachable statement (at 4:31)']
+    assert _names(pm) == ['semantic', 'cfg', 'lint']
+    pm.get(tree, 'lint')
+    pm.get(tree, 'cfg')
+    assert _names(pm) == ['semantic', 'cfg', 'lint']
+    assert (pm.hits['lint'], pm.hits['cfg'], pm.hits['semantic']) == (1, 1, 0)
+
+
+def test_cache_is_per_tree():
+    pm, first, second = PassManager(), _parse(), _parse()
+    pm.get(first, 'cfg')
+    assert not pm.cached(second, 'semantic')
+    pm.get(second, 'cfg')
+    assert _names(pm) == ['semantic', 'cfg'] * 2
+
+
+def test_transform_keeps_only_preserved_analyses():
+    pm, tree = PassManager(), _parse()
+    pm.get(tree, 'lint')
+    assert pm.run(tree, ['fold'])['fold'].folded == 1
+    assert pm.cached(tree, 'semantic')
+    assert not pm.cached(tree, 'cfg') and not pm.cached(tree, 'lint')
+    # преобразование выполняется при каждом запросе
+    pm.run(tree, ['fold', 'cfg'])
+    assert _names(pm) == ['semantic', 'cfg', 'lint', 'fold', 'fold', 'cfg']
+
+
+def test_invalidate():
+    pm, tree = PassManager(), _parse()
+    pm.get(tree, 'lint')
+    # lint без cfg сохранить нельзя: его требование сбрасывается
+    pm.invalidate(tree, ('semantic', 'lint'))
+    assert [name for name in ('semantic', 'cfg', 'lint') if pm.cached(tree, name)] == ['semantic']
+    pm.invalidate(tree)
+    assert not pm.cached(tree, 'semantic')
+
+
+def test_dead_code_elimination():
+    pm, tree = PassManager(), _parse()
+    assert pm.run(tree, ['dce', 'lint']) == {'dce': 2, 'lint': []}
+    assert len(_method(tree, 'f').body.exprs) == 1
+    assert len(_method(tree, 'h').body.exprs) == 1
+    # недостижимый шаг цикла в g остается, и метод по-прежнему работает
+    loop = _method(tree, 'g').body.exprs[1]
+    assert isinstance(loop, ForNode) and loop.step is not None
+    assert compile_func(_method(tree, 'g'))(5) == 0
+    assert pm.run(tree, ['dce'])['dce'] == 0
+
+
+@pytest.mark.parametrize('pass_, message', [
+    (Pass('cfg', lambda tree, results: None), "Pass 'cfg' is already registered"),
+    (Pass('x', lambda tree, results: None, ('fold',)), "Pass 'x' requires 'fold', which is not a registered analysis"),
+    (Pass('x', lambda tree, results: None, ('y',)), "Pass 'x' requires 'y', which is not a registered analysis"),
+])
+def test_register_errors(pass_, message):
+    with pytest.raises(ValueError) as info:
+        PassManager().register(pass_)
+    assert str(info.value) == message
+
+
+def test_get_rejects_transform():
+    with pytest.raises(ValueError):
+        PassManager().get(_parse(), 'dce')
+
+
+def test_custom_analysis_receives_requirements():
+    pm = PassManager(DEFAULT_PASSES + (Pass('count', lambda tree, results: len(results['cfg']), ('cfg',)),))
+    assert pm.get(_parse(), 'count') == 3
+
+
+def test_run_files_and_report(tmp_path):
+    paths = []
+    for name, prog in (('a.java', PROGRAM), ('b.java', 'class B { int k() { return 1; } }')):
+        path = tmp_path / name
+        path.write_text(prog, encoding='utf-8')
+        paths.append(str(path))
+    pm = PassManager(trace_memory=True)
+    results = pm.run_files(paths, ['lint', 'dce'])
+    assert (len(results[paths[0]]['lint']), results[paths[0]]['dce']) == (2, 2)
+    assert (results[paths[1]]['lint'], results[paths[1]]['dce']) == ([], 0)
+    assert [s.name for s in pm.stats if s.file == paths[1]] == ['parse', 'semantic', 'cfg', 'lint', 'dce']
+    assert all(s.peak is not None and s.retained is not None for s in pm.stats)
+    report = pm.report().splitlines()
+    assert report[0].split()[:3] == ['pass', 'runs', 'hits']
+    assert report[1].split()[:3] == ['parse', '2', '0']
+    assert 'lint' in pm.report() and paths[1] in pm.report()
@@ -0,0 +1,67 @@
+import copy
+import gc
+import pickle
+import threading
+import weakref
+
+import pytest
+
+from compiler_demo.semantic import BaseType, TypeDesc
+
+
+def test_equal_types_are_one_object():
+    assert TypeDesc(BaseType.INT) is TypeDesc.INT
+    assert TypeDesc.from_str('boolean') is TypeDesc.BOOL
+    func = TypeDesc(return_type=TypeDesc.INT, params=[TypeDesc.DOUBLE, TypeDesc.array_of(TypeDesc.INT)])
+    assert func is TypeDesc(return_type=TypeDesc.INT, params=(TypeDesc.DOUBLE, TypeDesc(element=TypeDesc.INT)))
+    assert func is not TypeDesc(return_type=TypeDesc.INT, params=(TypeDesc.DOUBLE,))
+    assert TypeDesc(name='A') is TypeDesc(name='A') and TypeDesc(name='A') is not TypeDesc(name='B')
+    for clone in (copy.copy, copy.deepcopy, lambda t: pickle.loads(pickle.dumps(t))):
+        assert clone(func) is func
+
+
+def test_types_are_immutable():
+    with pytest.raises(AttributeError):
+        TypeDesc.INT.base_type = BaseType.FLOAT
+    with pytest.raises(AttributeError):
+        TypeDesc.INT.extra = 1
+
+
+def test_str_and_hash_are_cached():
+    func = TypeDesc(return_type=TypeDesc.VOID, params=(TypeDesc.array_of(TypeDesc.STR), TypeDesc(name='A')))
+    text = str(func)
+    assert text == 'void (string[], A)'
+    assert str(func) is text
+    same = TypeDesc(return_type=TypeDesc.VOID, params=(TypeDesc.array_of(TypeDesc.STR), TypeDesc(name='A')))
+    assert str(same) is text and hash(same) == hash(func)
+    assert {func: 1}[same] == 1
+
+
+def test_unused_types_are_released():
+    # интернирование не держит типы, на которые больше никто не ссылается
+    ref = weakref.ref(TypeDesc(name='Unused'))
+    key = (None, None, None, 'Unused', None)
+    gc.collect()
+    assert ref() is None and key not in TypeDesc._interned
+    # встроенные типы живут, пока живет класс
+    assert TypeDesc(BaseType.INT) is TypeDesc.INT
+    # тип, на который есть ссылка, остается единственным
+    kept = TypeDesc(name='Kept')
+    gc.collect()
+    assert TypeDesc(name='Kept') is kept
+
+
+def test_interning_from_threads():
+    barrier = threading.Barrier(8)
+    results = []
+
+    def make():
+        barrier.wait()
+        results.append(TypeDesc(name='Threaded', element=TypeDesc.INT))
+
+    threads = [threading.Thread(target=make) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 8 and all(result is results[0] for result in results)
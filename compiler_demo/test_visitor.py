@@ -0,0 +1,159 @@
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.ast import *
+from compiler_demo.visitor import SKIP, NodeTransformer, NodeVisitor, walk
+
+PROG = 'class A { int f(int n) { if (n > 0) { return n; } else { n = 1; } g(n, 2); return n + 1; } }'
+
+
+def _parse(prog=PROG):
+    return my_parser.parse(prog, engine='fast')
+
+
+def _body(tree):
+    return tree.exprs[0].body.exprs[0].body
+
+
+def test_replace_nodes():
+    class Double(NodeTransformer):
+        def visit_LiteralNode(self, node):
+            return LiteralNode(str(node.value * 2))
+
+        def visit_IdentNode(self, node):
+            return IdentNode('m') if node.name == 'n' else node
+
+    tree = _parse()
+    body = _body(tree)
+    if_node = body.exprs[0]
+    assert Double().transform(tree) is tree
+    # узлы с измененными детьми остаются на месте, меняются только их поля
+    assert body.exprs[0] is if_node
+    expected = 'class A { int f(int m) { if (m > 0) { return m; } else { m = 2; } g(m, 4); return m + 2; } }'
+    assert tree.tree == _parse(expected).tree
+
+
+def test_replace_root():
+    class Replace(NodeTransformer):
+        def visit_StmtListNode(self, node):
+            return IdentNode('x')
+
+    assert str(Replace().transform(_parse())) == 'x'
+
+
+def test_delete_nodes():
+    class Delete(NodeTransformer):
+        def visit_CallNode(self, node):
+            return None
+
+        def visit_FuncStmtListNode(self, node):
+            # тело else пустеет, и сама ветка удаляется (обычное поле становится None)
+            return node if node.exprs else None
+
+        def visit_AssignNode(self, node):
+            return None
+
+    tree = _parse()
+    Delete().transform(tree)
+    body = _body(tree)
+    assert [type(stmt) for stmt in body.exprs] == [IfNode, ReturnNode]
+    assert body.exprs[0].else_stmt is None and body.exprs[0].then_stmt is not None
+    assert not any(isinstance(node, (CallNode, AssignNode)) for node in walk(tree))
+
+
+def test_flatten_lists():
+    class Unroll(NodeTransformer):
+        def visit_CallNode(self, node):
+            # вызов заменяется двумя копиями, параметр - тремя
+            return [node, CallNode(IdentNode('h'))]
+
+        def visit_LiteralNode(self, node):
+            return [node, node, node] if node.value == 2 else node
+
+    tree = _parse()
+    Unroll().transform(tree)
+    stmts = _body(tree).exprs
+    assert [type(stmt) for stmt in stmts] == [IfNode, CallNode, CallNode, ReturnNode]
+    assert [str(param) for param in stmts[1].params] == ['n', '2', '2', '2']
+    assert str(stmts[2].func) == 'h' and stmts[2].params == ()
+
+
+def test_list_in_single_field():
+    class Bad(NodeTransformer):
+        def visit_BinOpNode(self, node):
+            return [node.arg1, node.arg2]
+
+    with pytest.raises(TypeError):
+        Bad().transform(_parse('int a = 1 + 2;'))
+
+
+def test_transform_order():
+    class Order(NodeTransformer):
+        def __init__(self):
+            self.names = []
+
+        def visit_IdentNode(self, node):
+            # TypeNode - тоже IdentNode
+            if type(node) is IdentNode:
+                self.names.append(node.name)
+            return node
+
+        def visit_BinOpNode(self, node):
+            self.names.append(str(node))
+            return node
+
+    order = Order()
+    order.transform(_parse('int x = a + b * c;'))
+    # обработчик вызывается после детей
+    assert order.names == ['x', 'a', 'b', 'c', '*', '+']
+
+
+def test_visitor_order_and_skip():
+    class Trace(NodeVisitor):
+        def __init__(self):
+            self.events = []
+
+        def visit_IdentNode(self, node):
+            if type(node) is IdentNode:
+                self.events.append(str(node))
+
+        def visit_BinOpNode(self, node):
+            self.events.append(str(node))
+
+        def visit_CallNode(self, node):
+            self.events.append(str(node))
+            return SKIP
+
+        def leave_BinOpNode(self, node):
+            self.events.append('/' + str(node))
+
+    trace = Trace()
+    trace.visit(_parse('int x = a + f(b) * c;'))
+    assert trace.events == ['x', '+', 'a', '*', 'call', 'c', '/*', '/+']
+
+
+def test_deep_tree():
+    tree = _parse('int x = ' + ' + '.join(['a'] * 5000) + ';')
+
+    class Rename(NodeTransformer):
+        def visit_IdentNode(self, node):
+            return IdentNode('b') if node.name == 'a' else node
+
+    class Count(NodeVisitor):
+        count = 0
+
+        def visit_IdentNode(self, node):
+            self.count += type(node) is IdentNode
+
+    Rename().transform(tree)
+    count = Count()
+    count.visit(tree)
+    assert count.count == 5001
+    assert sum(isinstance(node, IdentNode) and node.name == 'b' for node in walk(tree)) == 5000
+
+
+def test_childs_are_cached():
+    call = _body(_parse()).exprs[1]
+    assert call.childs is call.childs
+    call.params = call.params[:1]
+    assert len(call.childs[1].childs) == 1
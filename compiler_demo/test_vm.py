@@ -0,0 +1,111 @@
+import pytest
+
+from compiler_demo import my_parser
+from compiler_demo.analyzer import analyze
+from compiler_demo.codegen import compile_class, CompileError
+from compiler_demo.vm import load_class, lower_func, VmError
+
+PROGRAM = '''class M {
+    int counter = 10;
+    String greet = "hi " + counter;
+    int fib(int n) { if (n < 2) { return n; } return fib(n - 1) + fib(n - 2); }
+    int sum(int n) {
+        int s = 0;
+        for (int i = 0; i < n; i = i + 1) { if (i % 3 == 0) { continue; } s = s + i * 7; }
+        return s;
+    }
+    int ovf(int x) { return x * x + 2147483647; }
+    long lmul(long a, long b) { return a * b - 1; }
+    int div(int a, int b) { return a / b + a % b; }
+    double grid(int n) {
+        double acc = 0.0;
+        for (int i = 0; i < n; i = i + 1) {
+            for (int j = 0; j < n; j = j + 1) { if (i > j && j % 2 == 0 || i == j) { acc = acc + i * 0.5 - j / 4.0; } }
+        }
+        return acc;
+    }
+    float f32(float a, float b) { return a / 3 + b; }
+    String cat(int a, double d, boolean b, char c) { return "a=" + a + " d=" + d + " b=" + b + " c=" + c; }
+    boolean same(String s) { return s == "x"; }
+    boolean nan(double d) { double n = d / 0; return n < 1.0 || n == n; }
+    int inc() { counter = counter + 1; return counter; }
+    int hazard(int x) { int y = x + fib(x + 5); int z; z = y; y = x + 1; return y * 100 + x * 10 + z; }
+    int loops(int n) {
+        int c = 0;
+        for (int i = 0; i < n; i = i + 1) { for (int j = 0; ; j = j + 1) { if (j >= i) { break; } c = c + 1; } }
+        return c;
+    }
+    String doubling(int n) { String s = "ab"; for (int i = 0; i < n; i = i + 1) { s = s + s; } return s; }
+    int forever() { int i = 0; for (;;) { i = i + 1; } return i; }
+    int deep(int n) { return deep(n + 1); }
+    void bad() { Foo f = new Foo(); }
+}
+'''
+
+CALLS = [
+    ('fib', (15,)), ('sum', (1000,)), ('ovf', (65536,)), ('ovf', (-3,)), ('lmul', (1 << 40, 1 << 30)),
+    ('div', (-7, 2)), ('div', (7, -2)), ('div', (-2147483648, -1)), ('grid', (20,)), ('f32', (1.0, 0.1)),
+    ('cat', (5, 2.5, True, ord('z'))), ('same', ('x',)), ('same', ('y',)), ('nan', (0.0,)), ('nan', (1.0,)),
+    ('hazard', (3,)), ('loops', (6,)), ('doubling', (4,)),
+]
+
+
+@pytest.fixture(scope='module')
+def tree():
+    tree = my_parser.parse(PROGRAM, engine='fast')
+    # bad() ссылается на неизвестный класс и не переводится
+    assert {error.msg for error in analyze(tree)} == {"Unknown type 'Foo'"}
+    return tree
+
+
+@pytest.mark.parametrize('name, args', CALLS)
+def test_vm_matches_codegen(tree, name, args):
+    vm, compiled = load_class(tree.exprs[0]), compile_class(tree.exprs[0])
+    assert repr(getattr(vm, name)(*args)) == repr(getattr(compiled, name)(*args))
+
+
+def test_fields(tree):
+    vm = load_class(tree.exprs[0])
+    assert (vm.counter, vm.greet) == (10, 'hi 10')
+    assert vm.inc() == 11 and vm.counter == 11
+
+
+def test_division_by_zero(tree):
+    with pytest.raises(ZeroDivisionError):
+        load_class(tree.exprs[0]).div(1, 0)
+
+
+def test_unsupported_method(tree):
+    vm = load_class(tree.exprs[0])
+    assert len(vm.errors) == 1
+    with pytest.raises(CompileError):
+        vm.bad()
+
+
+def test_step_limit(tree):
+    vm = load_class(tree.exprs[0], max_steps=1000)
+    assert vm.sum(100) == load_class(tree.exprs[0]).sum(100)
+    with pytest.raises(VmError):
+        vm.forever()
+    with pytest.raises(VmError):
+        vm.fib(30)
+
+
+def test_call_depth_limit(tree):
+    with pytest.raises(VmError):
+        load_class(tree.exprs[0], max_depth=100).deep(0)
+
+
+def test_string_limit(tree):
+    vm = load_class(tree.exprs[0], max_steps=100, max_chars=1 << 20)
+    assert len(vm.doubling(10)) == 2048
+    # без ограничения длины строк 28 итераций создали бы строку в 512 МБ
+    with pytest.raises(VmError):
+        vm.doubling(28)
+    # ограничение действует на каждый вызов отдельно
+    assert len(vm.doubling(10)) == 2048
+
+
+def test_ir_dump(tree):
+    func = lower_func(tree.exprs[0].body.exprs[3], {})
+    assert 'LOOP' in func.dump()
@@ -0,0 +1,140 @@
+"""Итеративный обход AST-дерева (без рекурсии) с диспетчеризацией по классу узла.
+
+   Обход идет по полям _fields узлов (AstNode.iter_child_nodes), поэтому вспомогательные
+   _GroupNode из childs не создаются. Методы обработчиков ищутся по MRO класса узла
+   (visit_StmtNode сработает для всех инструкций, если нет более точного visit_IfNode и т.п.)
+   и кэшируются в таблице диспетчеризации класса обработчика.
+"""
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .ast import AstNode
+
+# значение, которое visit_* может вернуть в NodeVisitor, чтобы не обходить детей узла
+SKIP = object()
+
+
+def child_nodes(node: AstNode) -> List[AstNode]:
+    """Список дочерних узлов (то же, что iter_child_nodes, но без генератора)
+    """
+    result = []
+    for field in node._fields:
+        value = getattr(node, field.lstrip('*'))
+        if isinstance(value, AstNode):
+            result.append(value)
+        elif value:
+            result.extend(value)
+    return result
+
+
+def walk(root: AstNode) -> Iterator[AstNode]:
+    """Все узлы поддерева в прямом порядке
+    """
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        yield node
+        childs = child_nodes(node)
+        childs.reverse()
+        stack.extend(childs)
+
+
+class _Dispatcher:
+    """Общая часть обработчиков: поиск методов prefix + имя класса по MRO с кэшированием
+    """
+
+    _dispatch: Dict[Tuple[str, type], Optional[Callable]]
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._dispatch = {}
+
+    def _handler(self, prefix: str, node_class: type) -> Optional[Callable]:
+        key = prefix, node_class
+        dispatch = type(self)._dispatch
+        try:
+            func = dispatch[key]
+        except KeyError:
+            func = None
+            for klass in node_class.__mro__:
+                func = getattr(type(self), prefix + klass.__name__, None)
+                if func is not None:
+                    break
+            dispatch[key] = func
+        return func
+
+
+class NodeVisitor(_Dispatcher):
+    """Обход в прямом порядке: visit_<Класс>(node) при входе в узел (если вернет SKIP,
+       дети узла пропускаются) и leave_<Класс>(node) при выходе из него
+    """
+
+    def visit(self, root: AstNode) -> None:
+        handler = self._handler
+        stack: list = [root]
+        while stack:
+            node = stack.pop()
+            if type(node) is tuple:
+                leave, node = node
+                leave(self, node)
+                continue
+            visit = handler('visit_', type(node))
+            if visit is not None and visit(self, node) is SKIP:
+                continue
+            leave = handler('leave_', type(node))
+            if leave is not None:
+                stack.append((leave, node))
+            childs = child_nodes(node)
+            childs.reverse()
+            stack.extend(childs)
+
+
+class NodeTransformer(_Dispatcher):
+    """Обход в обратном порядке с заменой узлов: visit_<Класс>(node) вызывается после обработки
+       детей и возвращает узел, который встанет на место node (None - удалить узел; из полей-кортежей
+       он убирается, обычное поле становится None). В поле-кортеж вместо узла можно вставить
+       несколько узлов, вернув их список. Поля узлов меняются на месте
+    """
+
+    def transform(self, root: AstNode) -> Optional[AstNode]:
+        handler = self._handler
+        stack: list = [(root, None)]
+        results: list = []
+        while stack:
+            node, count = stack.pop()
+            if count is None:
+                childs = child_nodes(node)
+                stack.append((node, len(childs)))
+                stack.extend((child, None) for child in reversed(childs))
+                continue
+            if count:
+                new_childs = results[-count:]
+                del results[-count:]
+                self._replace_fields(node, new_childs)
+            visit = handler('visit_', type(node))
+            results.append(visit(self, node) if visit is not None else node)
+        return results[0]
+
+    @staticmethod
+    def _replace_fields(node: AstNode, new_childs: list) -> None:
+        i = 0
+        for field in node._fields:
+            name = field.lstrip('*')
+            value = getattr(node, name)
+            if isinstance(value, AstNode):
+                new = new_childs[i]
+                if type(new) is list:
+                    raise TypeError('Field {}.{} holds a single node, not a list'.format(type(node).__name__, name))
+                if new is not value:
+                    setattr(node, name, new)
+                i += 1
+            elif value:
+                new_value = new_childs[i:i + len(value)]
+                i += len(value)
+                if any(new is not old for new, old in zip(new_value, value)):
+                    items = []
+                    for new in new_value:
+                        if type(new) is list:
+                            items.extend(new)
+                        elif new is not None:
+                            items.append(new)
+                    setattr(node, name, tuple(items))
@@ -0,0 +1,967 @@
+"""Регистровое промежуточное представление (IR) методов и виртуальная машина для него.
+
+   Метод (FuncNode после семантического анализа) переводится в трехадресный код: бинарная
+   операция - одна инструкция op dst, src1, src2 над регистрами, if и for - условные
+   и безусловные переходы (сравнение в условии сливается с переходом в одну инструкцию).
+   Инструкции хранятся в параллельных массивах array (код операции и три операнда), как узлы
+   в AstArena. Регистры метода - список значений: сначала параметры и локальные переменные
+   (номер регистра - IdentDesc.index), затем временные значения и константы; константы заранее
+   записаны в шаблон кадра, который копируется при вызове, поэтому отдельных загрузок констант нет.
+
+   Семантика и поддерживаемое подмножество Java - те же, что у codegen (функции времени
+   выполнения общие). Машина выполняет вызовы в одном цикле со своим стеком кадров, без рекурсии
+   Python. Код метода не имеет доступа ни к чему, кроме своих аргументов и полей класса, и может
+   быть ограничен: max_steps - число шагов (итераций циклов и вызовов), max_depth - глубина
+   вызовов, max_chars - суммарная длина строк, созданных сцеплением. Числа имеют фиксированную
+   ширину, а строки растут только при сцеплении, поэтому с заданными max_steps и max_chars время
+   и память выполнения ограничены и код можно выполнять в "песочнице"; без них (по умолчанию)
+   ограничена только глубина вызовов
+"""
+import operator
+import sys
+from array import array
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+from .ast import *
+from .codegen import (CompileError, _DEFAULTS, _FLOATING, _INTEGRAL, _dstr, _expr_childs, _f32, _fdiv, _frem,
+                      _fstr, _idiv32, _idiv64, _irem, _jstr, _wrap32, _wrap64)
+from .semantic import BaseType, ScopeType
+from .visitor import _Dispatcher, walk
+
+MAX_CALL_DEPTH = 10000
+
+
+class Op(IntEnum):
+    """Коды операций. Порядок важен: цикл _run проверяет частые операции первыми и сравнивает
+       код с числовыми литералами; операции начиная с LADD вычисляются функцией из _FUNCS
+    """
+    MOV = 0     # a = b
+    IADD = 1    # a = b + c (int)
+    ISUB = 2    # a = b - c (int)
+    IMUL = 3    # a = b * c (int)
+    IDIV = 4    # a = b / c (int)
+    IREM = 5    # a = b % c (int)
+    LOOP = 6    # переход на a (обратная дуга цикла, расходует шаг)
+    JUMP = 7    # переход на a
+    JLT = 8     # переход на a, если b < c
+    JLE = 9
+    JGT = 10
+    JGE = 11
+    JEQ = 12
+    JNE = 13
+    JNLT = 14   # переход на a, если не b < c (для вещественных не то же, что b >= c из-за NaN)
+    JNLE = 15
+    JNGT = 16
+    JNGE = 17
+    JT = 18     # переход на a, если b
+    JF = 19     # переход на a, если не b
+    CALL = 20   # a = функция b от аргументов из списка регистров c
+    RET = 21    # возврат значения a
+    RETV = 22   # возврат без значения
+    GETF = 23   # a = поле b
+    PUTF = 24   # поле a = b
+    # a = f(b, c)
+    LADD = 25
+    LSUB = 26
+    LMUL = 27
+    LDIV = 28
+    LREM = 29
+    DADD = 30
+    DSUB = 31
+    DMUL = 32
+    DDIV = 33
+    DREM = 34
+    FADD = 35
+    FSUB = 36
+    FMUL = 37
+    FDIV = 38
+    FREM = 39
+    LT = 40
+    LE = 41
+    GT = 42
+    GE = 43
+    EQ = 44
+    NE = 45
+    IS = 46
+    ISNOT = 47
+    CONCAT = 48
+    # a = f(b)
+    I2D = 49
+    I2F = 50
+    ISTR = 51
+    BSTR = 52
+    CSTR = 53
+    DSTR = 54
+    FSTR = 55
+    JSTR = 56
+    FAIL = 57   # ошибка b (метод, который не удалось перевести)
+
+
+_FIRST_UNARY = Op.I2D
+
+# виды операндов для листинга и разрешения меток: r - регистр, j - переход, f - функция,
+# a - список аргументов, k - поле
+_OPERANDS = {Op.MOV: 'rr', Op.LOOP: 'j', Op.JUMP: 'j', Op.JT: 'jr', Op.JF: 'jr', Op.CALL: 'rfa', Op.RET: 'r',
+             Op.RETV: '', Op.GETF: 'rk', Op.PUTF: 'kr'}
+_OPERANDS.update((op, 'jrr') for op in Op if Op.JLT <= op <= Op.JNGE)
+_OPERANDS.update((op, 'rrr') for op in Op if Op.IADD <= op <= Op.IREM or Op.LADD <= op < _FIRST_UNARY)
+_OPERANDS.update((op, 'rr') for op in Op if op >= _FIRST_UNARY)
+
+
+def _add64(a: int, b: int) -> int:
+    return _wrap64(a + b)
+
+
+def _sub64(a: int, b: int) -> int:
+    return _wrap64(a - b)
+
+
+def _mul64(a: int, b: int) -> int:
+    return _wrap64(a * b)
+
+
+def _fadd(a: float, b: float) -> float:
+    return _f32(a + b)
+
+
+def _fsub(a: float, b: float) -> float:
+    return _f32(a - b)
+
+
+def _fmul(a: float, b: float) -> float:
+    return _f32(a * b)
+
+
+def _fdiv32(a: float, b: float) -> float:
+    return _f32(_fdiv(a, b))
+
+
+def _frem32(a: float, b: float) -> float:
+    return _f32(_frem(a, b))
+
+
+def _bool_str(x: bool) -> str:
+    return 'true' if x else 'false'
+
+
+def _fail(error: Exception) -> Any:
+    raise error
+
+
+# функции операций, которые цикл _run не выполняет сам
+_FUNCS: List[Optional[Callable]] = [None] * len(Op)
+for _op, _func in ((Op.LADD, _add64), (Op.LSUB, _sub64),
+                   (Op.LMUL, _mul64), (Op.LDIV, _idiv64), (Op.LREM, _irem), (Op.DADD, operator.add),
+                   (Op.DSUB, operator.sub), (Op.DMUL, operator.mul), (Op.DDIV, _fdiv), (Op.DREM, _frem),
+                   (Op.FADD, _fadd), (Op.FSUB, _fsub), (Op.FMUL, _fmul), (Op.FDIV, _fdiv32), (Op.FREM, _frem32),
+                   (Op.LT, operator.lt), (Op.LE, operator.le), (Op.GT, operator.gt), (Op.GE, operator.ge),
+                   (Op.EQ, operator.eq), (Op.NE, operator.ne), (Op.IS, operator.is_), (Op.ISNOT, operator.is_not),
+                   (Op.CONCAT, operator.add), (Op.I2D, float), (Op.I2F, _f32), (Op.ISTR, str),
+                   (Op.BSTR, _bool_str), (Op.CSTR, chr), (Op.DSTR, _dstr), (Op.FSTR, _fstr), (Op.JSTR, _jstr),
+                   (Op.FAIL, _fail)):
+    _FUNCS[_op] = _func
+del _op, _func
+
+# арифметика по типу результата
+_ARITHMETIC = {
+    BaseType.INT: {BinOp.ADD: Op.IADD, BinOp.SUB: Op.ISUB, BinOp.MUL: Op.IMUL, BinOp.DIV: Op.IDIV,
+                   BinOp.MOD: Op.IREM},
+    BaseType.LONG: {BinOp.ADD: Op.LADD, BinOp.SUB: Op.LSUB, BinOp.MUL: Op.LMUL, BinOp.DIV: Op.LDIV,
+                    BinOp.MOD: Op.LREM},
+    BaseType.DOUBLE: {BinOp.ADD: Op.DADD, BinOp.SUB: Op.DSUB, BinOp.MUL: Op.DMUL, BinOp.DIV: Op.DDIV,
+                      BinOp.MOD: Op.DREM},
+    BaseType.FLOAT: {BinOp.ADD: Op.FADD, BinOp.SUB: Op.FSUB, BinOp.MUL: Op.FMUL, BinOp.DIV: Op.FDIV,
+                     BinOp.MOD: Op.FREM},
+}
+# сравнение: значение, переход при истинном и при ложном результате (для целых и для вещественных)
+_COMPARISONS = {
+    BinOp.LT: (Op.LT, Op.JLT, Op.JGE, Op.JNLT), BinOp.LE: (Op.LE, Op.JLE, Op.JGT, Op.JNLE),
+    BinOp.GT: (Op.GT, Op.JGT, Op.JLE, Op.JNGT), BinOp.GE: (Op.GE, Op.JGE, Op.JLT, Op.JNGE),
+    BinOp.EQUALS: (Op.EQ, Op.JEQ, Op.JNE, Op.JNE), BinOp.NEQUALS: (Op.NE, Op.JNE, Op.JEQ, Op.JEQ),
+}
+# условный переход с обратным условием
+_INVERSE = {Op.JLT: Op.JNLT, Op.JLE: Op.JNLE, Op.JGT: Op.JNGT, Op.JGE: Op.JNGE, Op.JEQ: Op.JNE, Op.JT: Op.JF}
+_INVERSE.update({inverse: op for op, inverse in list(_INVERSE.items())})
+_STR_OPS = {BaseType.INT: Op.ISTR, BaseType.LONG: Op.ISTR, BaseType.BOOL: Op.BSTR, BaseType.CHAR: Op.CSTR,
+            BaseType.DOUBLE: Op.DSTR, BaseType.FLOAT: Op.FSTR}
+
+
+class VmError(Exception):
+    """Превышение ограничений виртуальной машины (числа шагов, глубины вызовов или длины строк)
+    """
+
+
+class IrFunc:
+    """Код метода: параллельные массивы ops, a, b, c (код операции и операнды инструкций),
+       шаблон кадра frame (начальные значения регистров после параметров: константы и None)
+       и списки регистров-аргументов вызовов arglists
+    """
+
+    __slots__ = ('name', 'params', 'ops', 'a', 'b', 'c', 'frame', 'arglists')
+
+    def __init__(self, name: str, params: int) -> None:
+        self.name = name
+        self.params = params
+        self.ops = array('B')
+        self.a = array('i')
+        self.b = array('i')
+        self.c = array('i')
+        self.frame: List[Any] = []
+        self.arglists: List[Tuple[int, ...]] = []
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    @property
+    def registers(self) -> int:
+        return self.params + len(self.frame)
+
+    def dump(self) -> str:
+        """Листинг кода (регистр-константа показывается вместе со значением)
+        """
+        consts = {reg: value for reg, value in enumerate(self.frame, self.params) if value is not None}
+        lines = ['{}({} params, {} registers):'.format(self.name, self.params, self.registers)]
+        for pc, op in enumerate(self.ops):
+            operands = []
+            for kind, value in zip(_OPERANDS[op], (self.a[pc], self.b[pc], self.c[pc])):
+                if kind == 'r':
+                    operands.append('r{}={!r}'.format(value, consts[value]) if value in consts else 'r{}'.format(value))
+                elif kind == 'j':
+                    operands.append('@{}'.format(value))
+                elif kind == 'a':
+                    operands.append('(' + ', '.join('r{}'.format(reg) for reg in self.arglists[value]) + ')')
+                else:
+                    operands.append('{}{}'.format(kind, value))
+            lines.append('{:5}  {:6} {}'.format(pc, Op(op).name, ', '.join(operands)))
+        return '\n'.join(lines)
+
+
+class _FuncLowering(_Dispatcher):
+    """Перевод одного метода в IrFunc; members - номера методов и полей класса (в списках
+       функций и полей VmModule)
+    """
+
+    def __init__(self, node: FuncNode, members: Dict[IdentDesc, int]) -> None:
+        self.node = node
+        self.members = members
+        params = len(node.params) if node.params else 0
+        self.func = IrFunc(node.name.name, params)
+        # регистры после параметров и локальных переменных: временные и константы
+        first = max((n.node_ident.index for n in walk(node) if isinstance(n, IdentNode)
+                     and n.node_ident is not None and n.node_ident.scope in (ScopeType.PARAM, ScopeType.LOCAL)),
+                    default=params - 1) + 1
+        self.func.frame.extend([None] * (first - params))
+        self.consts: Dict[Tuple[type, str], int] = {}
+        self.temps: Set[int] = set()
+        self.free: List[int] = []
+        # позиции меток (-1 - еще не поставлена) и позиция последней поставленной метки
+        self.labels: List[int] = []
+        self.last_label = -1
+        # метки break и continue объемлющих циклов
+        self.loops: List[Tuple[int, int]] = []
+        # читать локальные переменные через копию: в выражении есть присваивание, которое может
+        # изменить переменную после того, как ее регистр стал операндом
+        self.copy_locals = False
+
+    def lower(self) -> IrFunc:
+        node = self.node
+        ident = node.name.node_ident
+        if ident is None or not ident.type.func:
+            raise CompileError('Method is not analyzed', node)
+        if node.body is None:
+            raise CompileError('Method has no body', node)
+        for i, param in enumerate(node.params):
+            if self._local(param.name) != i:
+                raise CompileError('Method is not analyzed', param)
+        self._stmts(node.body.exprs)
+        self._emit(Op.RETV)
+        return self._finish()
+
+    def _finish(self) -> IrFunc:
+        func = self.func
+        labels = self.labels
+        for pc, op in enumerate(func.ops):
+            if _OPERANDS[op][:1] == 'j':
+                func.a[pc] = labels[func.a[pc]]
+        return func
+
+    def _emit(self, op: Op, a: int = 0, b: int = 0, c: int = 0) -> None:
+        func = self.func
+        func.ops.append(op)
+        func.a.append(a)
+        func.b.append(b)
+        func.c.append(c)
+
+    # метки
+
+    def _label(self) -> int:
+        self.labels.append(-1)
+        return len(self.labels) - 1
+
+    def _place(self, label: int) -> None:
+        func = self.func
+        ops, a = func.ops, func.a
+        # переход на следующую инструкцию не нужен (если после него не поставлена другая метка)
+        if ops and self.last_label < len(ops) and ops[-1] == Op.JUMP and a[-1] == label:
+            self._pop()
+        # условный переход через безусловный (Jcond label; JUMP other; label:) заменяется переходом
+        # с обратным условием, если на безусловный переход не ссылаются другие метки
+        if len(ops) >= 2 and self.last_label < len(ops) - 1 and ops[-1] == Op.JUMP and ops[-2] in _INVERSE \
+                and a[-2] == label:
+            target = a[-1]
+            self._pop()
+            ops[-1] = _INVERSE[ops[-1]]
+            a[-1] = target
+        self.labels[label] = self.last_label = len(ops)
+
+    def _pop(self) -> None:
+        func = self.func
+        for field in (func.ops, func.a, func.b, func.c):
+            field.pop()
+
+    # регистры
+
+    def _temp(self) -> int:
+        if self.free:
+            return self.free.pop()
+        frame = self.func.frame
+        reg = self.func.params + len(frame)
+        frame.append(None)
+        self.temps.add(reg)
+        return reg
+
+    def _release(self, reg: int) -> None:
+        if reg in self.temps and reg not in self.free:
+            self.free.append(reg)
+
+    def _const(self, value: Any) -> int:
+        if isinstance(value, str):
+            # строковые литералы в Java интернированы: одинаковые литералы - один объект
+            value = sys.intern(value)
+        key = type(value), repr(value)
+        reg = self.consts.get(key)
+        if reg is None:
+            frame = self.func.frame
+            reg = self.consts[key] = self.func.params + len(frame)
+            frame.append(value)
+        return reg
+
+    def _local(self, name_node: IdentNode) -> int:
+        ident = name_node.node_ident
+        if ident is None or ident.scope not in (ScopeType.PARAM, ScopeType.LOCAL):
+            raise CompileError("Unknown local variable '{}'".format(name_node.name), name_node)
+        return ident.index
+
+    def _member(self, name_node: IdentNode, func: bool) -> int:
+        ident = name_node.node_ident
+        index = self.members.get(ident)
+        if index is None or ident.type.func != func:
+            if func:
+                raise CompileError("'{}' is not a method of the class".format(name_node.name), name_node)
+            raise CompileError("'{}' is not a local variable or a field of the class".format(name_node.name),
+                               name_node)
+        return index
+
+    @staticmethod
+    def _is_local(name_node: IdentNode) -> bool:
+        ident = name_node.node_ident
+        return ident is not None and ident.scope in (ScopeType.PARAM, ScopeType.LOCAL)
+
+    # типы
+
+    @staticmethod
+    def _type(node: AstNode) -> TypeDesc:
+        type_ = node.node_type
+        if type_ is None:
+            raise CompileError('Unknown type of expression', node)
+        return type_
+
+    @staticmethod
+    def _conversion(from_type: TypeDesc, to_type: TypeDesc, node: AstNode) -> Optional[Op]:
+        """Операция присваивающего преобразования типа from_type к to_type (None - не нужна)
+        """
+        if from_type is to_type:
+            return None
+        from_base, to_base = from_type.base_type, to_type.base_type
+        if to_base is BaseType.DOUBLE and from_base in _INTEGRAL:
+            return Op.I2D
+        if to_base is BaseType.DOUBLE and from_base is BaseType.FLOAT:
+            return None
+        if to_base is BaseType.FLOAT and from_base in _INTEGRAL:
+            return Op.I2F
+        if to_base in (BaseType.INT, BaseType.LONG) and from_base in (BaseType.INT, BaseType.CHAR) \
+                or to_base is BaseType.LONG and from_base is BaseType.LONG:
+            return None
+        if from_type.name == 'null' and to_base not in _DEFAULTS:
+            return None
+        raise CompileError('Incompatible types: {} cannot be converted to {}'.format(from_type, to_type), node)
+
+    def _convert(self, reg: int, node: AstNode, to_type: TypeDesc) -> int:
+        op = self._conversion(self._type(node), to_type, node)
+        if op is None:
+            return reg
+        self._release(reg)
+        result = self._temp()
+        self._emit(op, result, reg)
+        return result
+
+    def _assign(self, dst: int, node: AstNode, to_type: TypeDesc) -> None:
+        """Вычисление значения node с преобразованием к to_type в регистр dst
+        """
+        op = self._conversion(self._type(node), to_type, node)
+        if op is None:
+            self._expr(node, dst)
+        else:
+            reg = self._expr(node)
+            self._emit(op, dst, reg)
+            self._release(reg)
+
+    # инструкции
+
+    def _stmts(self, stmts: Sequence[AstNode]) -> None:
+        for stmt in stmts:
+            self._stmt(stmt)
+
+    @staticmethod
+    def _block(node: Optional[AstNode]) -> Sequence[AstNode]:
+        if node is None:
+            return ()
+        return node.exprs if isinstance(node, (StmtListNode, FuncStmtListNode)) else (node,)
+
+    def _stmt(self, node: AstNode) -> None:
+        stmt = self._handler('stmt_', type(node))
+        if stmt is None:
+            raise CompileError('Unsupported statement: {}'.format(node), node)
+        stmt(self, node)
+
+    def stmt_ExprNode(self, node: ExprNode) -> None:
+        self._release(self._expr(node))
+
+    def stmt_StmtNode(self, node: StmtNode) -> None:
+        raise CompileError('Unsupported statement: {}'.format(node), node)
+
+    def stmt_StmtListNode(self, node: Union[StmtListNode, FuncStmtListNode]) -> None:
+        self._stmts(node.exprs)
+
+    stmt_FuncStmtListNode = stmt_StmtListNode
+
+    def stmt_IdentNode(self, node: IdentNode) -> None:
+        if node.name in ('break', 'continue'):
+            if not self.loops:
+                raise CompileError("'{}' outside of loop".format(node.name), node)
+            self._emit(Op.JUMP, self.loops[-1][node.name == 'continue'])
+        else:
+            self.stmt_ExprNode(node)
+
+    def stmt_AssignNode(self, node: AssignNode) -> None:
+        var = node.var
+        if not isinstance(var, IdentNode):
+            raise CompileError('Unsupported assignment target', var)
+        if self._is_local(var):
+            self._assign(self._local(var), node.val, var.node_ident.type)
+        else:
+            index = self._member(var, False)
+            reg = self._convert(self._expr(node.val), node.val, var.node_ident.type)
+            self._emit(Op.PUTF, index, reg)
+            self._release(reg)
+
+    def stmt_VarsNode(self, node: VarsNode) -> None:
+        for var in node.vars:
+            # объявление без инициализатора ничего не делает: Java не дает читать переменную до присваивания
+            if isinstance(var, AssignNode):
+                self.stmt_AssignNode(var)
+
+    def stmt_ReturnNode(self, node: ReturnNode) -> None:
+        if node.val is None:
+            self._emit(Op.RETV)
+            return
+        return_type = self.node.name.node_ident.type.return_type
+        reg = self._convert(self._expr(node.val), node.val, return_type)
+        self._emit(Op.RET, reg)
+        self._release(reg)
+
+    def stmt_IfNode(self, node: IfNode) -> None:
+        else_label = self._label()
+        self._branch(node.cond, else_label, False)
+        self._stmts(self._block(node.then_stmt))
+        if node.else_stmt is None:
+            self._place(else_label)
+            return
+        end_label = self._label()
+        self._emit(Op.JUMP, end_label)
+        self._place(else_label)
+        self._stmts(self._block(node.else_stmt))
+        self._place(end_label)
+
+    def stmt_ForNode(self, node: ForNode) -> None:
+        self._stmts(self._block(node.init))
+        top, step, end = self._label(), self._label(), self._label()
+        self._place(top)
+        cond = node.cond
+        if not (isinstance(cond, StmtListNode) and not cond.exprs):
+            self._branch(cond, end, False)
+        self.loops.append((end, step))
+        self._stmts(self._block(node.body))
+        self.loops.pop()
+        self._place(step)
+        self._stmts(self._block(node.step))
+        self._emit(Op.LOOP, top)
+        self._place(end)
+
+    # условия
+
+    def _branch(self, root: AstNode, target: int, jump_if: bool) -> None:
+        """Переход на метку target, если значение условия root равно jump_if (&& и || - переходами,
+           без вычисления значения)
+        """
+        stack: List[Union[int, Tuple[AstNode, int, bool]]] = [(root, target, jump_if)]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, int):
+                self._place(item)
+                continue
+            node, target, jump_if = item
+            op = node.op if isinstance(node, BinOpNode) else None
+            if op is BinOp.LOGICAL_AND or op is BinOp.LOGICAL_OR:
+                if (op is BinOp.LOGICAL_AND) != jump_if:
+                    # a && b ложно (a || b истинно), если так для любого из операндов
+                    stack.append((node.arg2, target, jump_if))
+                    stack.append((node.arg1, target, jump_if))
+                else:
+                    skip = self._label()
+                    stack.append(skip)
+                    stack.append((node.arg2, target, jump_if))
+                    stack.append((node.arg1, skip, not jump_if))
+            elif op in _COMPARISONS and self._numeric_comparison(node):
+                a, b, floating = self._comparison_operands(node)
+                ops = _COMPARISONS[op]
+                self._emit(ops[1] if jump_if else ops[3] if floating else ops[2], target, a, b)
+                self._release(a)
+                self._release(b)
+            else:
+                reg = self._expr(node)
+                self._emit(Op.JT if jump_if else Op.JF, target, reg)
+                self._release(reg)
+
+    def _numeric_comparison(self, node: BinOpNode) -> bool:
+        base1, base2 = self._type(node.arg1).base_type, self._type(node.arg2).base_type
+        numeric = base1 in _INTEGRAL + _FLOATING and base2 in _INTEGRAL + _FLOATING
+        if not numeric and node.op not in (BinOp.EQUALS, BinOp.NEQUALS):
+            raise CompileError("Bad operand types for '{}'".format(node.op), node)
+        return numeric or base1 is base2 is BaseType.BOOL
+
+    def _comparison_operands(self, node: BinOpNode) -> Tuple[int, int, bool]:
+        """Регистры операндов числового сравнения; целое сравнивается с вещественным после
+           преобразования в вещественное, как в Java
+        """
+        base1, base2 = self._type(node.arg1).base_type, self._type(node.arg2).base_type
+        copy_locals = self.copy_locals
+        self.copy_locals = copy_locals or self._has_assign(node.arg2)
+        a = self._expr(node.arg1)
+        self.copy_locals = copy_locals
+        b = self._expr(node.arg2)
+        if base1 in _INTEGRAL and base2 in _FLOATING:
+            a = self._convert(a, node.arg1, TypeDesc.DOUBLE)
+        elif base2 in _INTEGRAL and base1 in _FLOATING:
+            b = self._convert(b, node.arg2, TypeDesc.DOUBLE)
+        return a, b, base1 in _FLOATING or base2 in _FLOATING
+
+    # выражения
+
+    @staticmethod
+    def _has_assign(root: AstNode) -> bool:
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, AssignNode):
+                return True
+            stack.extend(_expr_childs(node))
+        return False
+
+    def _expr(self, root: AstNode, dst: Optional[int] = None) -> int:
+        """Регистр со значением выражения root (без рекурсии по операндам); если задан dst,
+           значение вычисляется в него
+        """
+        copy_locals = self.copy_locals
+        self.copy_locals = copy_locals or any(self._has_assign(child) for child in _expr_childs(root))
+        stack: List[Tuple[AstNode, bool]] = [(root, False)]
+        results: List[int] = []
+        handler = self._handler
+        while stack:
+            node, ready = stack.pop()
+            if isinstance(node, BinOpNode) and node.op in (BinOp.LOGICAL_AND, BinOp.LOGICAL_OR):
+                # значение логической операции - через переходы
+                results.append(self._logical(node, dst if node is root else None))
+                continue
+            childs = _expr_childs(node)
+            if not ready:
+                stack.append((node, True))
+                stack.extend((child, False) for child in reversed(childs))
+                continue
+            args = results[len(results) - len(childs):] if childs else []
+            if childs:
+                del results[len(results) - len(childs):]
+            expr = handler('expr_', type(node))
+            if expr is None:
+                raise CompileError('Unsupported expression: {}'.format(node), node)
+            results.append(expr(self, node, args, dst if node is root else None))
+            for reg in args:
+                self._release(reg)
+        self.copy_locals = copy_locals
+        result = results[0]
+        if dst is not None and result != dst:
+            self._emit(Op.MOV, dst, result)
+            self._release(result)
+            return dst
+        return result
+
+    def _result(self, target: Optional[int]) -> int:
+        return self._temp() if target is None else target
+
+    def _logical(self, node: BinOpNode, target: Optional[int]) -> int:
+        result = self._result(target)
+        false_label, end_label = self._label(), self._label()
+        self._branch(node, false_label, False)
+        self._emit(Op.MOV, result, self._const(True))
+        self._emit(Op.JUMP, end_label)
+        self._place(false_label)
+        self._emit(Op.MOV, result, self._const(False))
+        self._place(end_label)
+        return result
+
+    def expr_LiteralNode(self, node: LiteralNode, args: List[int], target: Optional[int]) -> int:
+        if node.type.base_type is BaseType.CHAR:
+            return self._const(ord(node.value))
+        return self._const(node.value)
+
+    def expr_IdentNode(self, node: IdentNode, args: List[int], target: Optional[int]) -> int:
+        ident = node.node_ident
+        if ident is not None and ident.built_in and node.name == 'null':
+            return self._const(None)
+        if self._is_local(node):
+            reg = self._local(node)
+            if not self.copy_locals:
+                return reg
+            result = self._result(target)
+            self._emit(Op.MOV, result, reg)
+            return result
+        index = self._member(node, False)
+        result = self._result(target)
+        self._emit(Op.GETF, result, index)
+        return result
+
+    def expr_AssignNode(self, node: AssignNode, args: List[int], target: Optional[int]) -> int:
+        var = node.var
+        if not isinstance(var, IdentNode):
+            raise CompileError('Unsupported assignment target', var)
+        type_ = var.node_ident.type if var.node_ident is not None else None
+        if self._is_local(var):
+            reg = self._local(var)
+            op = self._conversion(self._type(node.val), type_, node.val)
+            self._emit(op if op is not None else Op.MOV, reg, args[0])
+            return reg
+        index = self._member(var, False)
+        value = self._convert(args[0], node.val, type_)
+        self._emit(Op.PUTF, index, value)
+        if value != args[0]:
+            self._release(value)
+        result = self._result(target)
+        self._emit(Op.MOV, result, value)
+        return result
+
+    def expr_CallNode(self, node: CallNode, args: List[int], target: Optional[int]) -> int:
+        func = node.func
+        index = self._member(func, True)
+        params = func.node_ident.type.params
+        if len(args) != len(params):
+            raise CompileError("Method '{}' expects {} arguments".format(func.name, len(params)), node)
+        converted = [self._convert(reg, param, type_) for reg, param, type_ in zip(args, node.params, params)]
+        result = self._result(target)
+        arglists = self.func.arglists
+        arglists.append(tuple(converted))
+        self._emit(Op.CALL, result, index, len(arglists) - 1)
+        for reg, arg in zip(converted, args):
+            if reg != arg:
+                self._release(reg)
+        return result
+
+    def expr_BinOpNode(self, node: BinOpNode, args: List[int], target: Optional[int]) -> int:
+        op = node.op
+        if op is BinOp.DOT:
+            raise CompileError('Member access is not supported', node)
+        a, b = args
+        if op in _COMPARISONS:
+            if self._numeric_comparison(node):
+                base1, base2 = self._type(node.arg1).base_type, self._type(node.arg2).base_type
+                if base1 in _INTEGRAL and base2 in _FLOATING:
+                    a = self._convert(a, node.arg1, TypeDesc.DOUBLE)
+                elif base2 in _INTEGRAL and base1 in _FLOATING:
+                    b = self._convert(b, node.arg2, TypeDesc.DOUBLE)
+                code = _COMPARISONS[op][0]
+            else:
+                # ссылки (строки, объекты, null) сравниваются как ссылки
+                code = Op.IS if op is BinOp.EQUALS else Op.ISNOT
+        else:
+            result_type = self._type(node)
+            if result_type is TypeDesc.STR:
+                a, b = self._string(a, node.arg1), self._string(b, node.arg2)
+                code = Op.CONCAT
+            else:
+                code = _ARITHMETIC.get(result_type.base_type, {}).get(op)
+                if code is None:
+                    raise CompileError("Bad operand types for '{}'".format(op), node)
+        result = self._result(target)
+        self._emit(code, result, a, b)
+        for reg, arg in zip((a, b), args):
+            if reg != arg:
+                self._release(reg)
+        return result
+
+    def _string(self, reg: int, node: AstNode) -> int:
+        """Преобразование значения к строке при сцеплении
+        """
+        type_ = self._type(node)
+        base_type = type_.base_type
+        if base_type is BaseType.STR and isinstance(node, (LiteralNode, BinOpNode)):
+            # литерал и результат сцепления не бывают null
+            return reg
+        if type_.name == 'null':
+            return self._const('null')
+        op = Op.JSTR if base_type is BaseType.STR else _STR_OPS.get(base_type)
+        if op is None:
+            raise CompileError("Cannot convert '{}' to string".format(type_), node)
+        result = self._temp()
+        self._emit(op, result, reg)
+        return result
+
+
+def lower_func(node: FuncNode, members: Optional[Dict[IdentDesc, int]] = None) -> IrFunc:
+    """Код IR для метода node (дерево должно быть размечено семантическим анализом); members -
+       номера методов и полей класса (по умолчанию - только сам метод с номером 0)
+    """
+    if members is None:
+        ident = node.name.node_ident
+        if ident is None:
+            raise CompileError('Method is not analyzed', node)
+        members = {ident: 0}
+    try:
+        return _FuncLowering(node, members).lower()
+    except RecursionError as e:
+        raise CompileError('Blocks are nested too deeply', node) from e
+
+
+def _limited_concat(max_chars: int) -> Callable[[str, str], str]:
+    """Сцепление строк, которое бросает VmError, когда суммарная длина созданных им строк
+       превысит max_chars (проверка - до выделения памяти под результат)
+    """
+    left = max_chars
+
+    def concat(x: str, y: str) -> str:
+        nonlocal left
+        left -= len(x) + len(y)
+        if left < 0:
+            raise VmError('String length limit exceeded ({} characters)'.format(max_chars))
+        return x + y
+
+    return concat
+
+
+def _run(functions: List[IrFunc], fields: List[Any], func: IrFunc, args: Sequence[Any],
+         max_steps: Optional[int], max_depth: int, max_chars: Optional[int] = None) -> Any:
+    """Цикл интерпретатора: выполнение func с аргументами args
+    """
+    ops, A, B, C = func.ops, func.a, func.b, func.c
+    regs = list(args)
+    regs += func.frame
+    pc = 0
+    frames: List[Tuple[IrFunc, list, int, int]] = []
+    # шаги - обратные переходы и вызовы; -1 - без ограничения (счетчик не дойдет до нуля)
+    fuel = -1 if max_steps is None else max_steps + 1
+    funcs = _FUNCS
+    if max_chars is not None:
+        funcs = list(funcs)
+        funcs[Op.CONCAT] = _limited_concat(max_chars)
+    while True:
+        op = ops[pc]
+        if op < 8:
+            if op == 0:  # MOV
+                regs[A[pc]] = regs[B[pc]]
+            elif op < 4:  # IADD, ISUB, IMUL
+                x = regs[B[pc]]
+                y = regs[C[pc]]
+                v = x + y if op == 1 else x - y if op == 2 else x * y
+                regs[A[pc]] = v if -0x80000000 <= v <= 0x7FFFFFFF else (v + 0x80000000 & 0xFFFFFFFF) - 0x80000000
+            elif op < 6:  # IDIV, IREM
+                x = regs[B[pc]]
+                y = regs[C[pc]]
+                if x >= 0 and y > 0:
+                    regs[A[pc]] = x // y if op == 4 else x % y
+                else:
+                    regs[A[pc]] = _idiv32(x, y) if op == 4 else _irem(x, y)
+            else:  # LOOP, JUMP
+                if op == 6:
+                    fuel -= 1
+                    if not fuel:
+                        raise VmError('Step limit exceeded in {}'.format(func.name))
+                pc = A[pc]
+                continue
+            pc += 1
+        elif op < 18:  # переход по сравнению
+            x = regs[B[pc]]
+            y = regs[C[pc]]
+            if op < 12:
+                if op < 10:
+                    taken = x < y if op == 8 else x <= y
+                else:
+                    taken = x > y if op == 10 else x >= y
+            elif op < 14:
+                taken = x == y if op == 12 else x != y
+            elif op < 16:
+                taken = not (x < y if op == 14 else x <= y)
+            else:
+                taken = not (x > y if op == 16 else x >= y)
+            pc = A[pc] if taken else pc + 1
+        elif op < 25:
+            if op == 18:  # JT
+                pc = A[pc] if regs[B[pc]] else pc + 1
+            elif op == 19:  # JF
+                pc = pc + 1 if regs[B[pc]] else A[pc]
+            elif op == 20:  # CALL
+                fuel -= 1
+                if not fuel:
+                    raise VmError('Step limit exceeded in {}'.format(func.name))
+                if len(frames) >= max_depth:
+                    raise VmError('Call stack overflow in {}'.format(func.name))
+                frames.append((func, regs, pc + 1, A[pc]))
+                callee = functions[B[pc]]
+                regs = [regs[reg] for reg in func.arglists[C[pc]]]
+                regs += callee.frame
+                func = callee
+                ops, A, B, C = func.ops, func.a, func.b, func.c
+                pc = 0
+            elif op < 23:  # RET, RETV
+                value = regs[A[pc]] if op == 21 else None
+                if not frames:
+                    return value
+                func, regs, pc, dst = frames.pop()
+                ops, A, B, C = func.ops, func.a, func.b, func.c
+                regs[dst] = value
+            elif op == 23:  # GETF
+                regs[A[pc]] = fields[B[pc]]
+                pc += 1
+            else:  # PUTF
+                fields[A[pc]] = regs[B[pc]]
+                pc += 1
+        elif op < 49:
+            regs[A[pc]] = funcs[op](regs[B[pc]], regs[C[pc]])
+            pc += 1
+        else:
+            regs[A[pc]] = funcs[op](regs[B[pc]])
+            pc += 1
+
+
+class VmModule:
+    """Класс (или программа), переведенный в IR: методы functions, значения полей fields,
+       номера членов по имени names. Вызов метода - execute или атрибут объекта (m.fib(10)),
+       чтение поля - атрибут объекта. errors - ошибки перевода членов: такой метод при вызове
+       бросает CompileError, поле без вычисленного инициализатора получает значение по умолчанию.
+       Ограничения max_steps, max_depth и max_chars (см. описание модуля) действуют на каждый вызов
+    """
+
+    def __init__(self, functions: List[IrFunc], fields: List[Any], names: Dict[str, Tuple[bool, int]],
+                 errors: List[CompileError], max_steps: Optional[int] = None,
+                 max_depth: int = MAX_CALL_DEPTH, max_chars: Optional[int] = None) -> None:
+        self.functions = functions
+        self.fields = fields
+        self.names = names
+        self.errors = errors
+        self.max_steps = max_steps
+        self.max_depth = max_depth
+        self.max_chars = max_chars
+
+    def execute(self, index: int, *args: Any) -> Any:
+        """Выполнение метода с номером index
+        """
+        func = self.functions[index]
+        if len(args) != func.params:
+            raise TypeError('{}() takes {} arguments ({} given)'.format(func.name, func.params, len(args)))
+        return _run(self.functions, self.fields, func, args, self.max_steps, self.max_depth, self.max_chars)
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            is_func, index = self.__dict__['names'][name]
+        except KeyError:
+            raise AttributeError("Class has no member '{}'".format(name)) from None
+        if not is_func:
+            return self.fields[index]
+        return lambda *args: self.execute(index, *args)
+
+
+def _failed(node: FuncNode, error: CompileError) -> IrFunc:
+    # метод, который не удалось перевести: при вызове бросает ту же ошибку
+    func = IrFunc(node.name.name, len(node.params) if node.params else 0)
+    func.frame.append(error)
+    for field, value in zip((func.ops, func.a, func.b, func.c), (Op.FAIL, func.params, func.params, 0)):
+        field.append(value)
+    return func
+
+
+def load_func(node: FuncNode, max_steps: Optional[int] = None, max_depth: int = MAX_CALL_DEPTH,
+              max_chars: Optional[int] = None) -> Callable:
+    """Функция Python, выполняющая метод node на виртуальной машине (метод не обращается
+       к другим членам класса, кроме себя самого)
+    """
+    module = VmModule([lower_func(node)], [], {node.name.name: (True, 0)}, [], max_steps, max_depth, max_chars)
+    return lambda *args: module.execute(0, *args)
+
+
+def load_class(node: Union[ClassInitNode, StmtListNode], max_steps: Optional[int] = None,
+               max_depth: int = MAX_CALL_DEPTH, max_chars: Optional[int] = None) -> VmModule:
+    """Перевод методов класса (или членов верхнего уровня программы) в IR и инициализация полей;
+       дерево должно быть размечено семантическим анализом
+    """
+    body = node.body.exprs if isinstance(node, ClassInitNode) else node.exprs
+    members: Dict[IdentDesc, int] = {}
+    names: Dict[str, Tuple[bool, int]] = {}
+    funcs: List[FuncNode] = []
+    fields: List[AstNode] = []
+    for stmt in body:
+        if isinstance(stmt, FuncNode):
+            items, is_func = (stmt,), True
+        elif isinstance(stmt, VarsNode):
+            items, is_func = stmt.vars, False
+        else:
+            continue
+        for item in items:
+            name = item.name if is_func else item.var if isinstance(item, AssignNode) else item
+            if name.node_ident is None:
+                raise CompileError('Class is not analyzed', name)
+            group = funcs if is_func else fields
+            members[name.node_ident] = len(group)
+            names[name.name] = is_func, len(group)
+            group.append(item)
+
+    errors: List[CompileError] = []
+    functions = []
+    for func in funcs:
+        try:
+            functions.append(lower_func(func, members))
+        except CompileError as e:
+            errors.append(e)
+            functions.append(_failed(func, e))
+    module = VmModule(functions, [], names, errors, max_steps, max_depth, max_chars)
+    # поля инициализируются в порядке объявления, как при загрузке класса в Java
+    for var in fields:
+        name_node = var.var if isinstance(var, AssignNode) else var
+        module.fields.append(_DEFAULTS.get(name_node.node_ident.type.base_type))
+        if isinstance(var, AssignNode):
+            try:
+                init = _FuncLowering(FuncNode(None, None, None, IdentNode('<init>'), ()), members)
+                reg = init._convert(init._expr(var.val), var.val, name_node.node_ident.type)
+                init._emit(Op.RET, reg)
+                module.fields[-1] = _run(functions, module.fields, init._finish(), (), max_steps, max_depth,
+                                         max_chars)
+            except CompileError as e:
+                errors.append(e)
+    return module
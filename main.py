@@ -1,4 +1,4 @@
-import os
+import sys
 
 from compiler_demo import my_parser
 
@@ -104,9 +104,7 @@ public class Main {
         int a = 1;
     }'''
     prog = my_parser.parse(test3)
-    ast_tree = prog.tree
-
-    print(*ast_tree, sep=os.linesep)
+    prog.write_tree(sys.stdout)
 
 
 if __name__ == "__main__":